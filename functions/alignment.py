@@ -0,0 +1,64 @@
+import pandas as pd
+import streamlit as st
+
+from functions.correlation import energy_matrix
+from functions.load_data import fetch_era5, load_elhub_data
+
+
+# ---------------------------------------------------------
+# Felles tidsakse: naiv UTC, én rad per time
+# ---------------------------------------------------------
+# ERA5 med timezone=auto gir lokal tid (med doble/manglende timer ved
+# sommertid), mens Elhub-tidene er UTC eller har offset. Begge normaliseres
+# derfor til naiv UTC før de slås sammen.
+
+def to_utc_naive(times):
+    """Tidsstempler (naive = UTC, eller med offset) som naiv UTC."""
+    return pd.to_datetime(times, utc=True, errors="coerce").dt.tz_convert(None)
+
+
+def era5_utc(latitude, longitude, year):
+    """ERA5 hentet i UTC (timezone=GMT) med unike, sorterte timer. Kaster ved feilet nedlasting."""
+    meteo = fetch_era5(latitude, longitude, year, timezone="GMT")
+    if meteo.empty:
+        return meteo
+    meteo["time"] = to_utc_naive(meteo["time"])
+    return meteo.dropna(subset=["time"]).drop_duplicates("time").sort_values("time")
+
+
+def energy_hourly(energy, year):
+    """
+    Energi per time i UTC for ett år: energy_kwh (sum av alle rader, som før) pluss
+    én kolonne per (prisområde, kilde, gruppe). Returnerer (DataFrame, seriekolonner).
+    """
+    energy = energy[["start_time", "price_area", "source", "energy_group", "quantity_kwh"]].copy()
+    energy["start_time"] = to_utc_naive(energy["start_time"])
+    energy = energy[energy["start_time"].dt.year == year]
+
+    wide, labels = energy_matrix(energy)
+    total = energy.groupby("start_time")["quantity_kwh"].sum().rename("energy_kwh")
+    hourly = pd.concat([total, wide], axis=1).rename_axis("time").reset_index()
+    return hourly, labels
+
+
+# ---------------------------------------------------------
+# Sammenslått vær–energi-tabell (cachet per by og år)
+# ---------------------------------------------------------
+@st.cache_data(ttl=600, show_spinner=False)
+def aligned_weather_energy(latitude, longitude, year):
+    """
+    Timesoppløst vær + energi for én by og ett år, bygget én gang.
+    Elhub-dataene lastes inne i funksjonen, så et cache-treff slipper både
+    nedlasting og behandling av hele Elhub-tabellen. Samme ttl som load_elhub_data.
+    En feilet ERA5-nedlasting kaster (og caches dermed ikke); kalleren viser feilen.
+    Returnerer (df, værkolonner, energikolonner).
+    """
+    meteo = era5_utc(latitude, longitude, year)
+    if meteo.empty:
+        return pd.DataFrame(), [], []
+
+    hourly, labels = energy_hourly(load_elhub_data(), year)
+    df = pd.merge(meteo, hourly, on="time", how="inner").sort_values("time").reset_index(drop=True)
+
+    met_vars = [c for c in meteo.columns if c != "time"]
+    return df, met_vars, ["energy_kwh"] + labels
@@ -0,0 +1,154 @@
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from sklearn.neighbors import LocalOutlierFactor
+
+from functions.load_data import load_era5_raw
+from functions.lof_1d import lof_scores_1d
+from functions.spc_engine import spc_z
+
+
+# ---------------------------------------------------------
+# Oppsett: prisområder, variabler og lagring
+# ---------------------------------------------------------
+AREA_COORDS = {
+    "NO1": (59.9139, 10.7522),   # Oslo
+    "NO2": (58.1467, 7.9956),    # Kristiansand
+    "NO3": (63.4305, 10.3951),   # Trondheim
+    "NO4": (69.6492, 18.9560),   # Tromsø
+    "NO5": (60.3929, 5.3240),    # Bergen
+}
+
+# Vindretning er sirkulær (359° ligger nær 1°) og scores derfor ikke med avstandsbasert LOF
+VARIABLES = ["temperature_2m", "precipitation", "wind_speed_10m", "wind_gusts_10m"]
+JOINT_VARIABLES = ["temperature_2m", "wind_speed_10m", "precipitation"]
+JOINT_NAME = "temperatur+vind+nedbør"
+
+STORE_DIR = Path(__file__).resolve().parent.parent / ".cache" / "anomalies"
+
+
+def store_path(price_area, year):
+    return STORE_DIR / f"{price_area}_{year}.parquet"
+
+
+# ---------------------------------------------------------
+# Scoring for ett område og ett år
+# ---------------------------------------------------------
+def _hourly_frame(df):
+    frame = df.set_index("time").sort_index()
+    frame = frame[~frame.index.duplicated()]
+    return frame.asfreq("1h").interpolate("time").ffill().bfill()
+
+
+def score_area_year(price_area, year, n_neighbors=50, n_jobs=1):
+    """Scor alle ERA5-variabler og den felles vektoren for ett område/år."""
+    lat, lon = AREA_COORDS[price_area]
+    df = load_era5_raw(lat, lon, year)
+    if df.empty:
+        return pd.DataFrame()
+
+    frame = _hourly_frame(df)
+    parts = []
+
+    for var in VARIABLES:
+        if var not in frame.columns:
+            continue
+        x = frame[var].to_numpy(dtype=float)
+        parts.append(pd.DataFrame({
+            "time": frame.index,
+            "variable": var,
+            "value": x,
+            "lof": lof_scores_1d(x, n_neighbors),
+            "spc_z": spc_z(x),
+        }))
+
+    # Felles temperatur–vind–nedbør-vektor (robust standardisert)
+    if set(JOINT_VARIABLES).issubset(frame.columns):
+        X = frame[JOINT_VARIABLES].to_numpy(dtype=float)
+        med = np.median(X, axis=0)
+        mad = np.median(np.abs(X - med), axis=0)
+        X = (X - med) / np.where(mad > 0, 1.4826 * mad, X.std(axis=0) + 1e-12)
+
+        lof = LocalOutlierFactor(n_neighbors=n_neighbors, n_jobs=n_jobs).fit(X)
+        parts.append(pd.DataFrame({
+            "time": frame.index,
+            "variable": JOINT_NAME,
+            "value": np.nan,
+            "lof": -lof.negative_outlier_factor_,
+            "spc_z": np.nan,
+        }))
+
+    out = pd.concat(parts, ignore_index=True)
+    out["price_area"] = price_area
+    out["year"] = year
+    for col in ["value", "lof", "spc_z"]:
+        out[col] = out[col].astype(np.float32)
+    for col in ["variable", "price_area"]:
+        out[col] = out[col].astype("category")
+    return out
+
+
+def _score_and_store(args):
+    """Arbeidsfunksjon for prosesspoolen (må ligge på modulnivå)."""
+    price_area, year, n_neighbors, n_jobs = args
+    scores = score_area_year(price_area, year, n_neighbors, n_jobs)
+    if scores.empty:
+        return None
+
+    STORE_DIR.mkdir(parents=True, exist_ok=True)
+    path = store_path(price_area, year)
+    tmp = path.with_suffix(".tmp")
+    scores.to_parquet(tmp, index=False)
+    tmp.replace(path)
+    return str(path)
+
+
+# ---------------------------------------------------------
+# Batchjobb og oppslag
+# ---------------------------------------------------------
+def run_batch(years, areas=None, n_neighbors=50, max_workers=None, n_jobs=1):
+    """
+    Scor alle (prisområde × år) i en prosesspool og lagre resultatene.
+    n_jobs sendes videre til nabosøket i den flerdimensjonale LOF-en. Hver
+    prosess i poolen får så mange tråder, så hold n_jobs=1 med mindre
+    max_workers reduseres tilsvarende.
+    Returnerer stiene til filene som ble skrevet.
+    """
+    areas = list(areas or AREA_COORDS)
+    jobs = [(area, int(year), n_neighbors, n_jobs) for area in areas for year in years]
+
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        return [p for p in pool.map(_score_and_store, jobs) if p]
+
+
+def available():
+    """(prisområde, år) som har lagrede anomaliscorer."""
+    if not STORE_DIR.exists():
+        return []
+    pairs = []
+    for path in sorted(STORE_DIR.glob("*.parquet")):
+        area, year = path.stem.split("_")
+        pairs.append((area, int(year)))
+    return pairs
+
+
+def load_scores(price_area, year, variable=None):
+    path = store_path(price_area, year)
+    if not path.exists():
+        return pd.DataFrame()
+    filters = [("variable", "==", variable)] if variable else None
+    return pd.read_parquet(path, filters=filters)
+
+
+if __name__ == "__main__":
+    # Eksempel: python -m functions.anomaly_batch 2021 2022 2023
+    import sys
+    import time
+
+    years = [int(y) for y in sys.argv[1:]] or [2021]
+    t0 = time.perf_counter()
+    # Én prosess per kjerne, ett nabosøk per prosess (n_jobs=1)
+    paths = run_batch(years)
+    print(f"Lagret {len(paths)} filer i {STORE_DIR} på {time.perf_counter() - t0:.1f} s")
@@ -0,0 +1,184 @@
+import threading
+from collections import deque
+
+import numpy as np
+import pandas as pd
+
+from functions.lof_1d import lof_reference, score_new_1d
+from functions.rolling_stats import SortedWindow
+
+
+# ---------------------------------------------------------
+# Strømmende SPC: høypassfilter + rullerende median/MAD
+# ---------------------------------------------------------
+# DCT-filteret på page_6 trenger hele serien. Her erstattes det av et kausalt
+# førsteordens lavpassfilter (samme cutoff-periode) som trekkes fra verdien,
+# og median/MAD holdes i et etterfølgende vindu. Hver ny time koster O(log w).
+
+class StreamingSPC:
+    def __init__(self, cutoff_dager=90, vindu_timer=30 * 24, min_timer=48):
+        # Tidskonstant τ = T / 2π timer for en cutoff-periode T
+        self.alpha = 1.0 - np.exp(-2 * np.pi / (cutoff_dager * 24))
+        self.vindu_timer = vindu_timer
+        self.min_timer = min_timer
+        self.baseline = None
+        self.window = SortedWindow()
+        self.buffer = deque()
+
+    def _residual(self, value):
+        base = value if self.baseline is None else self.baseline
+        return value - base
+
+    def score(self, value, update=True):
+        """Robust z-score for den nye verdien mot vinduet før den legges inn."""
+        r = self._residual(value)
+        z = np.nan
+        if len(self.window) >= self.min_timer:
+            m = self.window.median()
+            mad = self.window.mad(m)
+            z = abs(r - m) / (1.4826 * mad) if mad > 0 else 0.0
+
+        if update:
+            self.baseline = value if self.baseline is None else self.baseline + self.alpha * (value - self.baseline)
+            self.window.insert(r)
+            self.buffer.append(r)
+            if len(self.buffer) > self.vindu_timer:
+                self.window.remove(self.buffer.popleft())
+        return z
+
+
+# ---------------------------------------------------------
+# Strømmende LOF: referansesett som tilpasses på nytt med jevne mellomrom
+# ---------------------------------------------------------
+class StreamingLOF:
+    def __init__(self, n_neighbors=50, referanse_timer=30 * 24, refit_hver=24, andel=0.01):
+        self.n_neighbors = n_neighbors
+        self.refit_hver = refit_hver
+        self.andel = andel
+        self.history = deque(maxlen=referanse_timer)
+        self.ref = None
+        self.terskel = np.inf
+        self.siden_refit = 0
+
+    def _refit(self):
+        self.ref = lof_reference(np.fromiter(self.history, dtype=float), self.n_neighbors)
+        # Terskel som i page_6: andelen med høyest score i referansesettet
+        self.terskel = float(np.quantile(self.ref["scores"], 1.0 - self.andel))
+        self.siden_refit = 0
+
+    def score(self, value, update=True):
+        """LOF-score for den nye verdien mot referansesettet (O(log n + k))."""
+        s = score_new_1d(self.ref, value) if self.ref is not None else np.nan
+
+        if update:
+            self.history.append(value)
+            self.siden_refit += 1
+            if len(self.history) > self.n_neighbors and (self.ref is None or self.siden_refit >= self.refit_hver):
+                self._refit()
+        return s
+
+
+# ---------------------------------------------------------
+# Tjeneste: én monitor per variabel og inkrementelt inntak
+# ---------------------------------------------------------
+# Samme metodevalg som page_6: SPC for jevne serier, LOF for nedbør
+METODER = {
+    "temperature_2m": "spc",
+    "wind_speed_10m": "spc",
+    "precipitation": "lof",
+    "quantityKwh": "spc",
+}
+
+
+class AnomalyService:
+    """
+    Holder tilstanden for én kilde (by eller prisområde) og scorer bare timer som er
+    nyere enn siste innlagte. Historikken beregnes aldri på nytt.
+    """
+
+    def __init__(self, variabler, k_sigma=3.0, cutoff_dager=90, vindu_timer=30 * 24, andel=0.01):
+        self.k_sigma = k_sigma
+        # Hver variabel får bare scoreren som brukes til alarmen
+        self.scorers = {
+            v: StreamingLOF(referanse_timer=vindu_timer, andel=andel)
+            if METODER.get(v, "spc") == "lof" else StreamingSPC(cutoff_dager, vindu_timer)
+            for v in variabler
+        }
+        self.last_time = None
+        self.alarms = []
+        self._lock = threading.Lock()
+
+    def _score_row(self, time, row, update):
+        rows = []
+        for var, scorer in self.scorers.items():
+            value = row.get(var)
+            if value is None or pd.isna(value):
+                continue
+            score = scorer.score(float(value), update)
+
+            if isinstance(scorer, StreamingLOF):
+                metode, alarm = "lof", score > scorer.terskel
+            else:
+                metode, alarm = "spc_z", score > self.k_sigma
+            rows.append({
+                "time": time, "variable": var, "value": float(value),
+                "metode": metode, "score": score, "alarm": bool(alarm),
+            })
+        return rows
+
+    def ingest(self, df, tids_kolonne="time"):
+        """Legg inn nye observerte timer (eldre enn last_time hoppes over). Returnerer nye alarmer."""
+        with self._lock:
+            new = df.sort_values(tids_kolonne)
+            if self.last_time is not None:
+                new = new[new[tids_kolonne] > self.last_time]
+
+            nye_alarmer = []
+            for rec in new.to_dict("records"):
+                for r in self._score_row(rec[tids_kolonne], rec, update=True):
+                    if r["alarm"]:
+                        nye_alarmer.append(r)
+                self.last_time = rec[tids_kolonne]
+
+            self.alarms.extend(nye_alarmer)
+            return pd.DataFrame(nye_alarmer)
+
+    def preview(self, df, tids_kolonne="time"):
+        """Scor prognosetimer mot dagens tilstand uten å oppdatere den."""
+        with self._lock:
+            rows = []
+            for rec in df.sort_values(tids_kolonne).to_dict("records"):
+                rows.extend(self._score_row(rec[tids_kolonne], rec, update=False))
+            return pd.DataFrame(rows)
+
+    def alarm_frame(self):
+        with self._lock:
+            return pd.DataFrame(self.alarms, columns=["time", "variable", "value", "metode", "score", "alarm"])
+
+
+if __name__ == "__main__":
+    # Benchmark for inntak time for time: python -m functions.anomaly_stream
+    import time as _time
+
+    rng = np.random.default_rng(0)
+    n = 5 * 8760
+    t = pd.date_range("2020-01-01", periods=n, freq="h")
+    temp = 10 * np.sin(np.arange(n) * 2 * np.pi / 8760) + rng.normal(0, 2, n)
+    temp[rng.choice(n, 20, replace=False)] += 15
+    wet = rng.random(n) < 0.35
+    df = pd.DataFrame({
+        "time": t,
+        "temperature_2m": temp,
+        "precipitation": np.where(wet, np.round(rng.gamma(0.6, 1.5, n), 1), 0.0),
+    })
+
+    service = AnomalyService(["temperature_2m", "precipitation"])
+    t0 = _time.perf_counter()
+    service.ingest(df.iloc[:-24])
+    t1 = _time.perf_counter()
+    service.ingest(df)  # bare de 24 siste timene er nye
+    t2 = _time.perf_counter()
+    print(
+        f"{n - 24} timer historikk: {t1 - t0:.2f} s ({1e6 * (t1 - t0) / (n - 24):.0f} µs/time), "
+        f"24 nye timer: {1000 * (t2 - t1):.1f} ms, alarmer: {len(service.alarms)}"
+    )
@@ -0,0 +1,174 @@
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from functions.forecasting import _extend, _pool_map, fit_sarimax, forecast
+
+
+# ---------------------------------------------------------
+# Backtest med rullerende origo
+# ---------------------------------------------------------
+# Ved hvert origo tilpasses modellen på de window timene før origo, og
+# prognosen for de neste horizon timene sammenlignes med fasit. Origoene deles
+# i sammenhengende blokker, én oppgave per blokk i prosesspoolen. Serien sendes
+# til hver arbeider én gang (initializer) og bare leses der. Innen en blokk
+# varmstartes hver ny estimering fra forrige origo, og mellom estimeringene
+# (refit_every timer) legges de nye timene bare til med Kalman-filtrering.
+
+_series = None
+
+
+def _init_worker(y):
+    global _series
+    _series = y
+
+
+def backtest_origins(n, window, horizon, n_origins):
+    """Posisjoner for inntil n_origins jevnt fordelte origoer med fullt vindu og fasit."""
+    if n < window + horizon:
+        return np.array([], dtype=int)
+    return np.unique(np.linspace(window, n - horizon, n_origins).round().astype(int))
+
+
+def _backtest_block(args):
+    """Arbeidsfunksjon: alle origoer i én blokk, med gjenbruk av modellen mellom dem."""
+    positions, window, horizon, order, seasonal_order, harmonics, refit_every, reuse = args
+    n_diff = order[1] + seasonal_order[1] * seasonal_order[3]
+
+    rows, forecasts, lowers, uppers = [], [], [], []
+    result, fitted_at, last = None, None, None
+    for pos in positions:
+        t0 = time.perf_counter()
+        if reuse and result is not None and pos - fitted_at < refit_every:
+            # Samme parametere: filtrer bare timene siden forrige origo
+            result = _extend(result, _series.iloc[last - n_diff:pos])
+            kind, iterations = "filtrert", 0
+        else:
+            start = result.params if reuse and result is not None else None
+            result = fit_sarimax(
+                _series.iloc[pos - window:pos], order, seasonal_order, start_params=start, harmonics=harmonics
+            )
+            kind = "kald" if start is None else "varmstart"
+            iterations = result.mle_retvals.get("iterations", 0) if result.mle_retvals else 0
+            fitted_at = pos
+        fit_seconds = time.perf_counter() - t0
+
+        fc = forecast(result, horizon)
+        ci = fc.conf_int().to_numpy()
+        forecasts.append(fc.predicted_mean.to_numpy())
+        lowers.append(ci[:, 0])
+        uppers.append(ci[:, 1])
+        last = pos
+
+        rows.append({
+            "origo": _series.index[pos],
+            "tilpasning": kind,
+            "iterasjoner": iterations,
+            "sekunder": fit_seconds,
+            "prognose_sekunder": time.perf_counter() - t0 - fit_seconds,
+        })
+
+    return rows, np.array(forecasts), np.array(lowers), np.array(uppers)
+
+
+def run_backtest(y: pd.Series, order: tuple, seasonal_order: tuple, harmonics=(), window=30 * 24,
+                 horizon=48, n_origins=52, refit_every=7 * 24, reuse=True, max_workers=None,
+                 on_progress=None):
+    """
+    Backtest av én modellkonfigurasjon over hele serien.
+    reuse=False estimerer kaldt ved hvert origo (referanse for gjenbruken).
+    on_progress(ferdige, totalt) kalles når en blokk er ferdig.
+    Returnerer dict med per_horisont (MAE, MAPE, dekning), per_origo og tider.
+    """
+    y = y.asfreq("h")
+    positions = backtest_origins(len(y), window, horizon, n_origins)
+    if len(positions) == 0:
+        raise ValueError("Serien er for kort for valgt vindu og horisont.")
+
+    workers = max_workers or min(len(positions), os.cpu_count() or 1)
+    blocks = {i: block for i, block in enumerate(np.array_split(positions, workers)) if len(block)}
+    tasks = {
+        i: (block, window, horizon, order, seasonal_order, harmonics, refit_every, reuse)
+        for i, block in blocks.items()
+    }
+
+    parts = {}
+
+    def on_result(label, answer):
+        parts[label] = answer
+        if on_progress is not None:
+            on_progress(sum(len(blocks[i]) for i in parts), len(positions))
+
+    t0 = time.perf_counter()
+    _pool_map(_backtest_block, tasks, on_result, max_workers=workers,
+              initializer=_init_worker, initargs=(y,))
+    wall = time.perf_counter() - t0
+
+    order_labels = sorted(parts)
+    per_origin = pd.DataFrame([row for i in order_labels for row in parts[i][0]])
+    mean, lower, upper = (np.vstack([parts[i][k] for i in order_labels]) for k in (1, 2, 3))
+    actual = np.vstack([y.to_numpy(dtype=float)[pos:pos + horizon] for pos in positions])
+
+    err = np.abs(mean - actual)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ape = np.where(actual != 0, err / np.abs(actual), np.nan)
+    inside = (actual >= lower) & (actual <= upper)
+    valid = np.isfinite(actual)
+
+    per_horizon = pd.DataFrame({
+        "horisont": np.arange(1, horizon + 1),
+        "MAE": np.nanmean(np.where(valid, err, np.nan), axis=0),
+        "MAPE (%)": 100 * np.nanmean(ape, axis=0),
+        "dekning 95 % (%)": 100 * np.nanmean(np.where(valid, inside, np.nan), axis=0),
+    })
+    per_origin["MAE"] = np.nanmean(np.where(valid, err, np.nan), axis=1)
+
+    fit_seconds = per_origin.groupby("tilpasning")["sekunder"]
+    timing = {
+        "veggklokke": wall,
+        "CPU-tid tilpasning": float(per_origin["sekunder"].sum()),
+        "CPU-tid prognoser": float(per_origin["prognose_sekunder"].sum()),
+        "origoer": len(positions),
+        "arbeidere": workers,
+        "per tilpasning": fit_seconds.agg(["count", "mean", "median", "max"]).reset_index(),
+    }
+    return {"per_horisont": per_horizon, "per_origo": per_origin, "tider": timing}
+
+
+if __name__ == "__main__":
+    # Benchmark: python -m functions.backtest
+    rng = np.random.default_rng(0)
+    n = 365 * 24
+    idx = pd.date_range("2021-01-01", periods=n, freq="h")
+    h = np.arange(n)
+    ar = np.zeros(n)
+    shocks = rng.normal(0, 3e3, n)
+    for i in range(1, n):
+        ar[i] = 0.8 * ar[i - 1] + shocks[i]
+    y = pd.Series(1e5 + 2e4 * np.sin(h * 2 * np.pi / 24) + np.where((h // 24) % 7 >= 5, -1.5e4, 0.0) + ar,
+                  index=idx)
+
+    from functions.forecasting import FOURIER_HARMONICS
+
+    for name, order, seasonal, harmonics in [
+        ("ARIMA(1,0,1)+Fourier", (1, 0, 1), (0, 0, 0, 0), FOURIER_HARMONICS),
+        ("SARIMA(1,0,1)(1,0,1,24)", (1, 0, 1), (1, 0, 1, 24), ()),
+        ("ARIMA(1,1,1)+Fourier", (1, 1, 1), (0, 0, 0, 0), FOURIER_HARMONICS),
+    ]:
+        for label, reuse, refit_every in [
+            ("kald ved hvert origo", False, 0),
+            ("varmstart ved hvert origo", True, 0),
+            ("varmstart ukentlig, filtrering ellers", True, 7 * 24),
+        ]:
+            report = run_backtest(y, order, seasonal, harmonics, n_origins=52, refit_every=refit_every,
+                                  reuse=reuse)
+            ph, timing = report["per_horisont"], report["tider"]
+            kinds = report["per_origo"]["tilpasning"].value_counts().to_dict()
+            print(
+                f"{name}, {label}: veggklokke {timing['veggklokke']:.1f} s "
+                f"(tilpasning {timing['CPU-tid tilpasning']:.1f} s, prognoser {timing['CPU-tid prognoser']:.1f} s, "
+                f"{kinds}), MAE t+1 {ph['MAE'].iloc[0]:.0f} / t+48 {ph['MAE'].iloc[-1]:.0f}, "
+                f"MAPE {ph['MAPE (%)'].mean():.1f} %, dekning {ph['dekning 95 % (%)'].mean():.0f} %"
+            )
@@ -0,0 +1,65 @@
+import numpy as np
+import pandas as pd
+from scipy.stats import norm
+from statsmodels.tsa.holtwinters import ExponentialSmoothing
+
+
+# ---------------------------------------------------------
+# Raske referansemodeller (millisekunder)
+# ---------------------------------------------------------
+# Brukes som nedre nivåer når SARIMAX ikke blir ferdig innenfor tidsbudsjettet.
+# Begge returnerer et objekt med samme grensesnitt som SARIMAX-prognosen
+# (predicted_mean og conf_int()), så siden kan plotte dem likt.
+
+
+class SimpleForecast:
+    def __init__(self, mean: pd.Series, sd: np.ndarray):
+        self.predicted_mean = mean
+        self.sd = sd
+
+    def conf_int(self, alpha=0.05):
+        z = norm.ppf(1 - alpha / 2)
+        return pd.DataFrame(
+            {"lower": self.predicted_mean - z * self.sd, "upper": self.predicted_mean + z * self.sd},
+            index=self.predicted_mean.index,
+        )
+
+
+def _future_index(y: pd.Series, steps):
+    return pd.date_range(y.index[-1] + pd.Timedelta(hours=1), periods=steps, freq="h")
+
+
+def seasonal_naive(y: pd.Series, steps, season=24) -> SimpleForecast:
+    """Siste sesong gjentatt; usikkerheten vokser med antall hele sesonger frem."""
+    values = y.to_numpy(dtype=float)
+    season = min(season, len(values))
+    last = values[-season:]
+    mean = np.resize(last, steps)
+
+    resid = values[season:] - values[:-season]
+    sd_1 = np.nanstd(resid) if len(resid) > 1 else np.nanstd(values)
+    sd = sd_1 * np.sqrt(np.arange(steps) // season + 1)
+    return SimpleForecast(pd.Series(mean, index=_future_index(y, steps)), sd)
+
+
+def ets_forecast(y: pd.Series, steps, season=24) -> SimpleForecast:
+    """
+    Holt-Winters med additiv sesong og dempet trend. Startverdiene settes
+    heuristisk, så bare glattingsparameterne optimeres.
+    """
+    model = ExponentialSmoothing(
+        y.to_numpy(dtype=float),
+        trend="add",
+        damped_trend=True,
+        seasonal="add",
+        seasonal_periods=season,
+        initialization_method="heuristic",
+    )
+    fit = model.fit()
+    mean = fit.forecast(steps)
+
+    # Tilnærmet intervall: ett-stegs-feil skalert som for enkel eksponentiell glatting
+    sd_1 = np.std(fit.resid)
+    alpha = fit.params["smoothing_level"]
+    sd = sd_1 * np.sqrt(1 + np.arange(steps) * alpha ** 2)
+    return SimpleForecast(pd.Series(mean, index=_future_index(y, steps)), sd)
@@ -0,0 +1,34 @@
+import hashlib
+import os
+import tempfile
+
+import numpy as np
+
+
+# ---------------------------------------------------------
+# Felles hjelpere for diskcachene (STL, SARIMAX)
+# ---------------------------------------------------------
+# Flere prosesser (jobbkøen, batchpoolen, samtidige økter) kan skrive samme
+# nøkkel samtidig. Hver skriver får derfor sin egen midlertidige fil i samme
+# katalog, og filen publiseres atomisk med os.replace: en leser ser enten den
+# gamle eller den nye filen, aldri en halvskrevet.
+
+def data_version(ts):
+    """Kort hash av tidsindeks og verdier; endres når dataene endres."""
+    h = hashlib.sha1()
+    h.update(ts.index.asi8.tobytes())
+    h.update(np.ascontiguousarray(ts.to_numpy(dtype=float)).tobytes())
+    return h.hexdigest()[:16]
+
+
+def save_npz(path, **arrays):
+    """np.savez til path via en unik midlertidig fil i samme katalog."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f"{path.stem}.", suffix=".tmp.npz")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            np.savez(f, **arrays)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
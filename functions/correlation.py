@@ -0,0 +1,244 @@
+import numpy as np
+from scipy import fft
+
+
+# ---------------------------------------------------------
+# Korrelasjon for alle lag på én gang
+# ---------------------------------------------------------
+# Konvensjon som sliding_corr på page_corr: lag L sammenligner x[t] med y[t − L]
+# (energiserien forskjøvet L rader). Manglende verdier håndteres ved at bare
+# par der begge finnes telles med, akkurat som pandas.
+
+# Maks antall tidskolonner i lag × tid-heatmapen
+MAX_TIME_BINS = 1500
+
+
+def _standardize(a):
+    """Sentrer og skaler (uten NaN) så kumulative summer holder presisjonen."""
+    a = np.asarray(a, dtype=float)
+    mask = np.isfinite(a)
+    if mask.any():
+        mu, sd = a[mask].mean(), a[mask].std()
+        a = (a - mu) / (sd if sd > 0 else 1.0)
+    return np.where(mask, a, 0.0), mask.astype(float)
+
+
+def _xcorr(a, b, nfft, max_lag):
+    """sum_t a[t] · b[t − L] for L = −max_lag … max_lag via FFT."""
+    c = fft.irfft(fft.rfft(a, nfft) * np.conj(fft.rfft(b, nfft)), nfft)
+    return np.concatenate([c[-max_lag:], c[:max_lag + 1]]) if max_lag else c[:1]
+
+
+def lagged_corr_fft(x, y, max_lag):
+    """
+    Pearson-korrelasjon over hele perioden for alle lag −max_lag … max_lag.
+    Summene over overlappende par for hvert lag regnes med seks FFT-krysskorrelasjoner,
+    så resultatet er eksakt (ikke den vanlige normaliserte FFT-tilnærmingen).
+    Returnerer (lags, corr).
+    """
+    x, mx = _standardize(x)
+    y, my = _standardize(y)
+    nfft = fft.next_fast_len(len(x) + len(y) + 1)
+
+    n = _xcorr(mx, my, nfft, max_lag)
+    sx = _xcorr(x, my, nfft, max_lag)
+    sy = _xcorr(mx, y, nfft, max_lag)
+    sxx = _xcorr(x * x, my, nfft, max_lag)
+    syy = _xcorr(mx, y * y, nfft, max_lag)
+    sxy = _xcorr(x, y, nfft, max_lag)
+
+    n = np.round(n)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        cov = sxy - sx * sy / n
+        var_x = sxx - sx * sx / n
+        var_y = syy - sy * sy / n
+        corr = cov / np.sqrt(var_x * var_y)
+    corr[(n < 3) | (var_x <= 1e-9) | (var_y <= 1e-9)] = np.nan
+
+    return np.arange(-max_lag, max_lag + 1), np.clip(corr, -1.0, 1.0)
+
+
+# ---------------------------------------------------------
+# Lag × tid: glidende korrelasjon fra kumulative summer
+# ---------------------------------------------------------
+def _window_sums(a, window):
+    """Glidende sum over de siste window radene langs siste akse (NaN de første window−1)."""
+    c = np.cumsum(a, axis=-1)
+    out = np.full(a.shape, np.nan)
+    out[..., window - 1] = c[..., window - 1]
+    out[..., window:] = c[..., window:] - c[..., :-window]
+    return out
+
+
+def _pair_corr(n, sx, sy, sxx, syy, sxy, window):
+    """Pearson fra glidende summer. Som pandas: fullt vindu kreves, konstante vinduer gir NaN."""
+    with np.errstate(invalid="ignore", divide="ignore"):
+        cov = sxy - sx * sy / n
+        var_x = sxx - sx * sx / n
+        var_y = syy - sy * sy / n
+        corr = cov / np.sqrt(var_x * var_y)
+    tol = 1e-9 * window
+    corr[(np.round(n) < window) | (var_x <= tol) | (var_y <= tol)] = np.nan
+    return np.clip(corr, -1.0, 1.0)
+
+
+def _shifted(a, lags):
+    """Matrise (lag × tid) der rad i er a forskjøvet lags[i] rader (som pandas shift)."""
+    n = len(a)
+    idx = np.arange(n)[None, :] - np.asarray(lags)[:, None]
+    valid = (idx >= 0) & (idx < n)
+    return np.where(valid, a[np.clip(idx, 0, n - 1)], 0.0), valid
+
+
+def rolling_corr_lags(x, y, lags, window, chunk=16):
+    """
+    Glidende korrelasjon (samme vindu som rolling(window).corr) for alle lag.
+    Alle summer (n, Σx, Σy, Σx², Σy², Σxy) er glidende summer fra cumsum, og lagene
+    behandles i blokker på chunk rader for å holde minnet nede.
+    Returnerer float32-matrise (len(lags) × tid).
+    """
+    x, mx = _standardize(x)
+    y, my = _standardize(y)
+    lags = np.asarray(lags)
+    out = np.empty((len(lags), len(x)), dtype=np.float32)
+
+    for lo in range(0, len(lags), chunk):
+        ys, valid = _shifted(y, lags[lo:lo + chunk])
+        ms, _ = _shifted(my, lags[lo:lo + chunk])
+        m = mx[None, :] * ms * valid
+        xm, ym = x[None, :] * m, ys * m
+
+        out[lo:lo + chunk] = _pair_corr(
+            _window_sums(m, window), _window_sums(xm, window), _window_sums(ym, window),
+            _window_sums(xm * xm, window), _window_sums(ym * ym, window),
+            _window_sums(xm * ym, window), window,
+        )
+
+    return out
+
+
+def best_lag(lags, corr_matrix):
+    """Lag med sterkest |korrelasjon| for hver tidskolonne (NaN der alt mangler)."""
+    a = np.abs(corr_matrix)
+    ok = np.isfinite(a).any(axis=0)
+    idx = np.nanargmax(np.where(np.isfinite(a), a, -1.0), axis=0)
+    best = np.asarray(lags, dtype=float)[idx]
+    value = corr_matrix[idx, np.arange(corr_matrix.shape[1])]
+    best[~ok] = np.nan
+    return best, np.where(ok, value, np.nan)
+
+
+# ---------------------------------------------------------
+# Alle værvariabler × alle energiserier i ett vektorisert pass
+# ---------------------------------------------------------
+def energy_matrix(energy, time_col="start_time"):
+    """
+    Energiserier (prisområde × kilde × gruppe) som bred tabell med timeindeks.
+    Returnerer (DataFrame tid × serie, etiketter "NO1 · production · hydro").
+    """
+    wide = energy.pivot_table(
+        index=time_col, columns=["price_area", "source", "energy_group"],
+        values="quantity_kwh", aggfunc="sum",
+    ).sort_index()
+    labels = [" · ".join(map(str, c)) for c in wide.columns]
+    wide.columns = labels
+    return wide, labels
+
+
+def rolling_corr_matrix(X, Y, window, lag=0, chunk=8):
+    """
+    Glidende korrelasjon for alle rader i X (værvariabler × tid) mot alle rader i
+    Y (energiserier × tid), med Y forskjøvet lag rader som i sliding_corr.
+    Summene per serie (Σx, Σx², Σy, Σy²) er felles for alle par når seriene er
+    komplette, så bare Σxy regnes per par; par med hull får egne summer.
+    Returnerer float32-kube (len(X) × len(Y) × tid).
+    """
+    X = np.atleast_2d(np.asarray(X, dtype=float))
+    Y = np.atleast_2d(np.asarray(Y, dtype=float))
+    if lag:
+        shifted = np.full_like(Y, np.nan)
+        if lag > 0:
+            shifted[:, lag:] = Y[:, :-lag]
+        else:
+            shifted[:, :lag] = Y[:, -lag:]
+        Y = shifted
+
+    xs, mx = zip(*(_standardize(r) for r in X))
+    ys, my = zip(*(_standardize(r) for r in Y))
+    xs, mx, ys, my = map(np.array, (xs, mx, ys, my))
+    cube = np.empty((len(X), len(Y), X.shape[-1]), dtype=np.float32)
+
+    # Felles summer for komplette værserier
+    x_full = mx.all(axis=-1)
+    sx_all, sxx_all = _window_sums(xs, window), _window_sums(xs * xs, window)
+
+    for lo in range(0, len(Y), chunk):
+        yc, mc = ys[lo:lo + chunk], my[lo:lo + chunk]
+        sxy = _window_sums(xs[:, None, :] * yc[None, :, :], window)
+
+        if x_full.all() and mc.all():
+            sy, syy = _window_sums(yc, window), _window_sums(yc * yc, window)
+            corr = _pair_corr(
+                float(window), sx_all[:, None], sy[None], sxx_all[:, None], syy[None], sxy, window
+            )
+        else:
+            m = mx[:, None, :] * mc[None, :, :]
+            xm, ym = xs[:, None, :] * m, yc[None, :, :] * m
+            corr = _pair_corr(
+                _window_sums(m, window), _window_sums(xm, window), _window_sums(ym, window),
+                _window_sums(xm * xm, window), _window_sums(ym * ym, window), sxy, window,
+            )
+        cube[:, lo:lo + chunk] = corr
+
+    return cube
+
+
+def time_stride(n, max_bins=MAX_TIME_BINS):
+    """Hvor mange tidskolonner som slås sammen for visning."""
+    return max(1, int(np.ceil(n / max_bins)))
+
+
+if __name__ == "__main__":
+    # Benchmark mot pandas: python -m functions.correlation
+    import time
+    import pandas as pd
+
+    rng = np.random.default_rng(0)
+    n = 5 * 8760
+    x = np.sin(np.arange(n) * 2 * np.pi / 24) + rng.normal(0, 0.5, n)
+    y = -np.roll(x, 5) * 1e6 + rng.normal(0, 3e5, n)
+    x[rng.choice(n, 50, replace=False)] = np.nan
+    lags = np.arange(-72, 73)
+    window = 72
+
+    t0 = time.perf_counter()
+    l, g = lagged_corr_fft(x, y, 72)
+    t1 = time.perf_counter()
+    R = rolling_corr_lags(x, y, lags, window)
+    t2 = time.perf_counter()
+
+    sx, sy = pd.Series(x), pd.Series(y)
+    ref_g = np.array([sx.corr(sy.shift(L)) for L in lags])
+    t3 = time.perf_counter()
+    ref_R = np.array([sx.rolling(window).corr(sy.shift(L)).to_numpy() for L in lags])
+    t4 = time.perf_counter()
+
+    print(f"global (145 lag): FFT {1000 * (t1 - t0):.0f} ms, pandas {1000 * (t3 - t2):.0f} ms, "
+          f"maks avvik {np.nanmax(np.abs(g - ref_g)):.1e}, beste lag {l[np.nanargmax(np.abs(g))]}")
+    print(f"lag × tid ({n} timer): cumsum {t2 - t1:.2f} s, pandas {t4 - t3:.2f} s, "
+          f"maks avvik {np.nanmax(np.abs(R - ref_R)):.1e}, "
+          f"like NaN {np.array_equal(np.isnan(R), np.isnan(ref_R))}")
+
+    # Alle værvariabler × alle energiserier (5 × 55 serier, noen med hull)
+    X = np.vstack([x + rng.normal(0, 0.3, n) for _ in range(5)])
+    Y = np.vstack([(1 + i) * 1e5 * np.roll(x, i) + rng.normal(0, 1e5, n) for i in range(55)])
+    Y[3, :2000] = np.nan
+    t5 = time.perf_counter()
+    cube = rolling_corr_matrix(X, Y, window, lag=24)
+    t6 = time.perf_counter()
+    ref = np.array([[pd.Series(a).rolling(window).corr(pd.Series(b).shift(24)).to_numpy()
+                     for b in Y] for a in X])
+    t7 = time.perf_counter()
+    print(f"matrise {cube.shape} ({cube.nbytes / 1e6:.0f} MB float32): vektorisert {t6 - t5:.2f} s, "
+          f"pandas {t7 - t6:.2f} s ({X.shape[0] * Y.shape[0]} kall), "
+          f"maks avvik {np.nanmax(np.abs(cube - ref)):.1e}, like NaN {np.array_equal(np.isnan(cube), np.isnan(ref))}")
@@ -0,0 +1,151 @@
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from functions.forecasting import FOURIER_HARMONICS, fitted_model, forecast
+
+
+# ---------------------------------------------------------
+# Oppsett: standardmodell og lagring
+# ---------------------------------------------------------
+# Batchjobben bruker den raske sesongmodusen (Fourier-ledd for døgn og uke),
+# så alle områder kan tilpasses på et langt vindu innen rimelig tid. Egne
+# parametere tilpasses fortsatt interaktivt på page_forecast.
+PRICE_AREAS = ["NO1", "NO2", "NO3", "NO4", "NO5"]
+SOURCES = ["production", "consumption"]
+SERIES = SOURCES + ["net"]
+
+ORDER = (1, 0, 1)
+SEASONAL_ORDER = (0, 0, 0, 0)
+HARMONICS = FOURIER_HARMONICS
+WINDOW_DAYS = 90
+HORIZON = 7 * 24
+Z_95 = 1.96
+
+STORE_DIR = Path(__file__).resolve().parent.parent / ".cache" / "forecasts"
+
+
+def store_path(price_area):
+    return STORE_DIR / f"{price_area}.parquet"
+
+
+def model_label():
+    return f"SARIMAX{ORDER} + Fourier {'/'.join(f'{p}×{k}' for p, k in HARMONICS)}, {WINDOW_DAYS} d vindu"
+
+
+# ---------------------------------------------------------
+# Prognose for ett område
+# ---------------------------------------------------------
+def _frame(series, mean, lower, upper):
+    return pd.DataFrame({"series": series, "time": mean.index, "mean": mean.to_numpy(),
+                         "lower": np.asarray(lower), "upper": np.asarray(upper)})
+
+
+def forecast_area(price_area, train: dict, horizon=HORIZON):
+    """
+    Produksjon, forbruk og nettolast (forbruk − produksjon) for ett område.
+    train: {kilde: treningsserie} med felles tidsakse.
+    """
+    parts, means, sd = [], {}, {}
+    for source, y_train in train.items():
+        # Via modellcachen: neste planlagte kjøring varmstarter fra denne
+        result, _ = fitted_model(y_train, price_area, source, ORDER, SEASONAL_ORDER, HARMONICS)
+        fc = forecast(result, horizon)
+        ci = fc.conf_int()
+        parts.append(_frame(source, fc.predicted_mean, ci.iloc[:, 0], ci.iloc[:, 1]))
+        means[source] = fc.predicted_mean
+        sd[source] = (ci.iloc[:, 1] - ci.iloc[:, 0]).to_numpy() / (2 * Z_95)
+
+    if set(SOURCES) <= set(train):
+        # Nettolast: feilene i de to modellene antas uavhengige
+        net = means["consumption"] - means["production"]
+        net_sd = np.sqrt(sd["production"] ** 2 + sd["consumption"] ** 2)
+        parts.append(_frame("net", net, net - Z_95 * net_sd, net + Z_95 * net_sd))
+
+    out = pd.concat(parts, ignore_index=True)
+    out["price_area"] = price_area
+    out["origin"] = min(y.index[-1] for y in train.values())
+    out["run_time"] = pd.Timestamp.now().floor("s")
+    for col in ["mean", "lower", "upper"]:
+        out[col] = out[col].astype(np.float32)
+    for col in ["series", "price_area"]:
+        out[col] = out[col].astype("category")
+    return out
+
+
+def _forecast_and_store(args):
+    """Arbeidsfunksjon for prosesspoolen (må ligge på modulnivå)."""
+    price_area, train, horizon = args
+    frame = forecast_area(price_area, train, horizon)
+
+    STORE_DIR.mkdir(parents=True, exist_ok=True)
+    path = store_path(price_area)
+    tmp = path.with_suffix(".tmp")
+    frame.to_parquet(tmp, index=False)
+    tmp.replace(path)
+    return str(path)
+
+
+# ---------------------------------------------------------
+# Batchjobb og oppslag
+# ---------------------------------------------------------
+def training_sets(store, areas=None, window_days=WINDOW_DAYS):
+    """Siste window_days dager per område og kilde, på felles tidsakse."""
+    jobs = {}
+    for area in areas or PRICE_AREAS:
+        series = {source: store.series(area, source) for source in SOURCES}
+        series = {source: y for source, y in series.items() if not y.empty}
+        if not series:
+            continue
+        common = store.common_index(area) if len(series) == len(SOURCES) else next(iter(series.values())).index
+        if common.empty:
+            continue
+        common = common[common > common[-1] - pd.Timedelta(days=window_days)]
+        jobs[area] = {source: y.reindex(common) for source, y in series.items()}
+    return jobs
+
+
+def run_batch(store, areas=None, horizon=HORIZON, max_workers=None):
+    """
+    Tilpass og lag prognoser for alle områder i en prosesspool og lagre dem.
+    store er SeriesStore for Elhub-dataene. Returnerer stiene som ble skrevet.
+    """
+    jobs = [(area, train, horizon) for area, train in training_sets(store, areas).items()]
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        return list(pool.map(_forecast_and_store, jobs))
+
+
+def available():
+    """Prisområder som har lagrede prognoser."""
+    if not STORE_DIR.exists():
+        return []
+    return sorted(path.stem for path in STORE_DIR.glob("*.parquet"))
+
+
+def load_forecasts(price_area, series=None):
+    path = store_path(price_area)
+    if not path.exists():
+        return pd.DataFrame()
+    filters = [("series", "==", series)] if series else None
+    return pd.read_parquet(path, filters=filters)
+
+
+if __name__ == "__main__":
+    # Én kjøring: python -m functions.forecast_batch
+    # Planlagt, hver 6. time: python -m functions.forecast_batch 6
+    import sys
+
+    from functions.load_data import load_elhub_data
+    from functions.series_store import SeriesStore
+
+    every_hours = float(sys.argv[1]) if len(sys.argv) > 1 else None
+    while True:
+        t0 = time.perf_counter()
+        paths = run_batch(SeriesStore(load_elhub_data()))
+        print(f"Lagret {len(paths)} prognoser i {STORE_DIR} på {time.perf_counter() - t0:.1f} s")
+        if every_hours is None:
+            break
+        time.sleep(max(0.0, every_hours * 3600 - (time.perf_counter() - t0)))
@@ -0,0 +1,942 @@
+import os
+import threading
+import time
+import warnings
+import weakref
+from collections import OrderedDict, deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from statsmodels.tsa.statespace.initialization import Initialization
+from statsmodels.tsa.statespace.sarimax import SARIMAX
+from statsmodels.tsa.stattools import kpss
+
+from functions.baselines import ets_forecast, seasonal_naive
+from functions.job_queue import ACTIVE, JobQueue, report_progress, terminate_pool
+from functions.cache_files import data_version, save_npz
+
+
+# ---------------------------------------------------------
+# Tidsserier for forecasting
+# ---------------------------------------------------------
+def prepare_series(df: pd.DataFrame, price_area: str, source: str | None = None) -> pd.Series:
+    """
+    Hent timesaggregert tidsserie (kWh) for valgt prisområde og kilde (production/consumption/None).
+    Hvis source=None, brukes både produksjon og forbruk samlet.
+    """
+    df = df.copy()
+    df["start_time"] = pd.to_datetime(df["start_time"], errors="coerce")
+    df = df.dropna(subset=["start_time", "quantity_kwh"])
+    df = df.sort_values("start_time")
+
+    if "price_area" in df.columns:
+        df = df[df["price_area"] == price_area]
+
+    if source is not None and "source" in df.columns:
+        df = df[df["source"] == source]
+
+    ts = (
+        df.set_index("start_time")["quantity_kwh"]
+        .resample("h")
+        .sum()
+        .dropna()
+    )
+    return ts
+
+
+# ---------------------------------------------------------
+# Fourier-ledd: rask sesongmodus (dynamisk harmonisk regresjon)
+# ---------------------------------------------------------
+# Døgn- og ukesesong som sin/cos-regressorer med et lavordens ARIMA-feilledd i
+# stedet for seasonal_order=(P, D, Q, 168). Tilstandsvektoren blir like liten
+# som for en ikke-sesongmodell, så tid og minne vokser lineært med antall timer.
+# harmonics er (periode, K)-par; K sin/cos-par per periode.
+FOURIER_HARMONICS = ((24, 4), (168, 6))
+
+# Treningsgrense i Fourier-modus (ca. fem år med timer)
+MAX_FOURIER_SAMPLES = 5 * 8760
+
+
+def fourier_terms(index: pd.DatetimeIndex, harmonics, const=True) -> pd.DataFrame:
+    """sin/cos-ledd regnet fra absolutt tid, så fremtidige timer får riktig fase."""
+    epoch = pd.Timestamp("1970-01-01", tz=index.tz)
+    t = ((index - epoch) / pd.Timedelta(hours=1)).to_numpy(dtype=float)
+    cols = {"const": np.ones(len(index))} if const else {}
+    for period, k_max in harmonics:
+        for k in range(1, k_max + 1):
+            cols[f"sin_{period}_{k}"] = np.sin(2 * np.pi * k * t / period)
+            cols[f"cos_{period}_{k}"] = np.cos(2 * np.pi * k * t / period)
+    return pd.DataFrame(cols, index=index)
+
+
+def _exog_for(model, index):
+    """Samme Fourier-kolonner som modellen ble bygget med, for nye tidspunkter (None uten exog)."""
+    if model.exog is None:
+        return None
+    harmonics = {}
+    for name in model.exog_names:
+        if name.startswith("sin_"):
+            _, period, k = name.split("_")
+            harmonics[int(period)] = max(harmonics.get(int(period), 0), int(k))
+    return fourier_terms(index, tuple(harmonics.items()), const="const" in model.exog_names)
+
+
+# ---------------------------------------------------------
+# Prognoser i nivå
+# ---------------------------------------------------------
+# Med simple_differencing tilpasses modellen på den differensierte serien, og
+# get_forecast gir differanser. forecast() summerer dem tilbake til nivå;
+# intervallet for nivåene hentes fra simulerte baner, siden feilene i
+# differansene er korrelerte over horisonten. Prognosene huskes per
+# resultatobjekt og horisont, så et minnetreff ikke simulerer på nytt.
+N_PATHS = 500
+
+_forecasts = weakref.WeakKeyDictionary()
+
+
+class PathForecast:
+    """Prognose med intervall fra simulerte baner (samme grensesnitt som get_forecast)."""
+
+    def __init__(self, mean: pd.Series, paths: np.ndarray):
+        self.predicted_mean = mean
+        self.paths = paths
+
+    def conf_int(self, alpha=0.05):
+        lower, upper = np.quantile(self.paths, [alpha / 2, 1 - alpha / 2], axis=0)
+        return pd.DataFrame({"lower": lower, "upper": upper}, index=self.predicted_mean.index)
+
+
+def _diff_poly(d, D, s):
+    """Koeffisientene til (1 − B)^d (1 − B^s)^D."""
+    poly = np.array([1.0])
+    for _ in range(d):
+        poly = np.convolve(poly, [1.0, -1.0])
+    seasonal = np.zeros(s + 1)
+    seasonal[[0, -1]] = 1.0, -1.0
+    for _ in range(D):
+        poly = np.convolve(poly, seasonal)
+    return poly
+
+
+def _integrate(diffs, history, poly):
+    """Nivåer fra differanser (siste akse er tid); history er de siste len(poly) − 1 nivåene."""
+    k = len(poly) - 1
+    out = np.empty(diffs.shape[:-1] + (k + diffs.shape[-1],))
+    out[..., :k] = history
+    for h in range(diffs.shape[-1]):
+        out[..., k + h] = diffs[..., h] - out[..., h:k + h][..., ::-1] @ poly[1:]
+    return out[..., k:]
+
+
+def forecast(result, steps):
+    """
+    get_forecast i nivå: lager Fourier-leddene for de fremtidige timene og
+    summerer differensierte prognoser tilbake. Huskes per (resultat, steps).
+    """
+    with _lock:
+        cached = _forecasts.get(result, {}).get(steps)
+    if cached is not None:
+        return cached
+    fc = _level_forecast(result, steps)
+    with _lock:
+        _forecasts.setdefault(result, {})[steps] = fc
+    return fc
+
+
+def _level_forecast(result, steps):
+    last = result.fittedvalues.index[-1]
+    future = pd.date_range(last + pd.Timedelta(hours=1), periods=steps, freq="h")
+    exog = _exog_for(result.model, future)
+    res = result.get_forecast(steps=steps, exog=exog)
+
+    model = result.model
+    if not (model.simple_differencing and (model.k_diff or model.k_seasonal_diff)):
+        return res
+
+    poly = _diff_poly(model.k_diff, model.k_seasonal_diff, model.seasonal_periods)
+    history = np.asarray(model.orig_endog, dtype=float).ravel()[-(len(poly) - 1):]
+    mean = _integrate(res.predicted_mean.to_numpy(), history, poly)
+    paths = result.simulate(
+        steps, anchor="end", repetitions=N_PATHS, exog=exog, rng=np.random.default_rng(0)
+    )
+    paths = _integrate(np.asarray(paths, dtype=float).reshape(steps, -1).T, history, poly)
+    return PathForecast(pd.Series(mean, index=future), paths)
+
+
+# ---------------------------------------------------------
+# SARIMAX-tilpasning
+# ---------------------------------------------------------
+def build_model(y_train: pd.Series, order: tuple, seasonal_order: tuple, harmonics=()):
+    # Konstantleddet forsvinner ved differensiering, så det tas bare med uten
+    exog = None
+    if harmonics:
+        exog = fourier_terms(y_train.index, harmonics, const=not (order[1] or seasonal_order[1]))
+    return SARIMAX(
+        y_train,
+        exog=exog,
+        order=order,
+        seasonal_order=seasonal_order,
+        enforce_stationarity=False,
+        enforce_invertibility=False,
+        simple_differencing=True,
+        use_exact_diffuse=False,
+    )
+
+
+def fit_sarimax(y_train: pd.Series, order: tuple, seasonal_order: tuple, start_params=None,
+                harmonics=(), maxiter=200, callback=None):
+    """Tren en SARIMAX-modell med robuste default-innstillinger (ev. varmstart fra start_params)."""
+    model = build_model(y_train, order, seasonal_order, harmonics)
+    if model.exog is None:
+        return model.fit(
+            start_params=start_params,
+            disp=False,
+            method="lbfgs",
+            maxiter=maxiter,
+            callback=callback,
+        )
+
+    # Fourier-koeffisientene fra minste kvadrater (på de differensierte dataene)
+    # holdes faste; bare ARIMA-feilleddet estimeres med MLE
+    k_exog = model.exog.shape[1]
+    ok = np.isfinite(model.endog[:, 0])
+    beta = np.linalg.lstsq(model.exog[ok], model.endog[ok, 0], rcond=None)[0]
+    if start_params is not None:
+        start_params = np.asarray(start_params)[k_exog:]
+    with model.fix_params(dict(zip(model.exog_names, beta))):
+        return model.fit(
+            start_params=start_params,
+            disp=False,
+            method="lbfgs",
+            maxiter=maxiter,
+            callback=callback,
+        )
+
+
+# ---------------------------------------------------------
+# Modellcache: tilpassede parametere per (område, kilde, vindu, ordre)
+# ---------------------------------------------------------
+# Parameterne lagres på disk; et treff gjenoppbygger resultatet med ett
+# Kalman-filterpass (ingen optimering). De siste resultatobjektene holdes i
+# minnet, så ny horisont bare er get_forecast. Et nytt treningsvindu med samme
+# modell varmstartes fra de sist tilpassede parameterne.
+CACHE_DIR = Path(__file__).resolve().parent.parent / ".cache" / "sarimax"
+
+MEMORY_ENTRIES = 16
+
+_results = OrderedDict()
+_lock = threading.Lock()
+
+
+def spec_key(price_area, source, order, seasonal_order, harmonics=()):
+    o = "".join(map(str, order))
+    so = "".join(map(str, seasonal_order[:3])) + f"s{seasonal_order[3]}"
+    key = f"{price_area}_{source or 'all'}_o{o}_so{so}"
+    if harmonics:
+        key += "_f" + "-".join(f"{period}x{k}" for period, k in harmonics)
+    return key
+
+
+def _params_path(name):
+    return CACHE_DIR / f"{name}.npz"
+
+
+def _load_record(name):
+    """Lagrede parametere og ev. informasjonskriterier ({"params", "aic", "bic"})."""
+    path = _params_path(name)
+    if not path.exists():
+        return None
+    with np.load(path) as data:
+        return {k: data[k] if k == "params" else float(data[k]) for k in data.files}
+
+
+def _load_params(name):
+    record = _load_record(name)
+    return None if record is None else record["params"]
+
+
+def _store_params(name, params, **scores):
+    save_npz(_params_path(name), params=np.asarray(params, dtype=float), **scores)
+
+
+def _remember(key, result):
+    with _lock:
+        _results[key] = result
+        _results.move_to_end(key)
+        while len(_results) > MEMORY_ENTRIES:
+            _results.popitem(last=False)
+
+
+def _model_key(y_train, price_area, source, order, seasonal_order, harmonics=()):
+    spec = spec_key(price_area, source, order, seasonal_order, harmonics)
+    return spec, f"{spec}_{data_version(y_train)}"
+
+
+def _cached(key, y_train, order, seasonal_order, harmonics=()):
+    """Resultat fra minnet eller disken, ellers (None, None)."""
+    with _lock:
+        if key in _results:
+            _results.move_to_end(key)
+            return _results[key], "minne"
+
+    params = _load_params(key)
+    if params is None:
+        return None, None
+    result = build_model(y_train, order, seasonal_order, harmonics).smooth(params)
+    _remember(key, result)
+    return result, "disk"
+
+
+def _warm_start(spec, y_train, order, seasonal_order, harmonics=()):
+    """Sist tilpassede parametere for samme modell, hvis de passer."""
+    start = _load_params(f"{spec}_latest")
+    n_params = len(build_model(y_train, order, seasonal_order, harmonics).param_names)
+    return start if start is not None and len(start) == n_params else None
+
+
+def _store_fit(spec, key, params, aic, bic):
+    _store_params(key, params, aic=aic, bic=bic)
+    _store_params(f"{spec}_latest", params)
+
+
+def _save(spec, key, result):
+    _store_fit(spec, key, result.params, float(result.aic), float(result.bic))
+    _remember(key, result)
+
+
+def fitted_model(y_train: pd.Series, price_area, source, order: tuple, seasonal_order: tuple, harmonics=()):
+    """
+    Tilpasset SARIMAX for treningsvinduet, via cache der det går.
+    Returnerer (resultat, status) der status er "minne", "disk", "varmstart" eller "kald".
+    """
+    spec, key = _model_key(y_train, price_area, source, order, seasonal_order, harmonics)
+    result, status = _cached(key, y_train, order, seasonal_order, harmonics)
+    if result is not None:
+        return result, status
+
+    start = _warm_start(spec, y_train, order, seasonal_order, harmonics)
+    result = fit_sarimax(y_train, order, seasonal_order, start_params=start, harmonics=harmonics)
+    _save(spec, key, result)
+    return result, "kald" if start is None else "varmstart"
+
+
+# ---------------------------------------------------------
+# Prosesspool med frist og avbrudd
+# ---------------------------------------------------------
+# Brukes av ordresøket og backtesten. Avbrytes ventingen (f.eks. fordi
+# Streamlit starter en ny kjøring) eller går fristen ut, stoppes arbeiderne.
+
+def _pool_map(worker, tasks: dict, on_result, on_tick=None, deadline=None, max_workers=None, poll=0.25,
+              initializer=None, initargs=()):
+    """
+    Kjør worker(args) for hver oppgave {etikett: args} i en prosesspool.
+    on_result(etikett, svar) kalles når en oppgave er ferdig og on_tick() jevnlig.
+    Ved frist (time.monotonic()) eller unntak stoppes arbeiderne.
+    initializer(*initargs) kjøres én gang per arbeider (f.eks. for delte data).
+    Returnerer etikettene som ikke ble ferdige før fristen.
+    """
+    pool = ProcessPoolExecutor(
+        max_workers=max_workers or min(len(tasks), os.cpu_count() or 1),
+        initializer=initializer,
+        initargs=initargs,
+    )
+    try:
+        futures = {pool.submit(worker, args): label for label, args in tasks.items()}
+        pending = set(futures)
+        while pending:
+            timeout = poll if deadline is None else max(0.0, min(poll, deadline - time.monotonic()))
+            done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            for future in done:
+                on_result(futures[future], future.result())
+            if on_tick is not None:
+                on_tick()
+            if pending and deadline is not None and time.monotonic() >= deadline:
+                terminate_pool(pool)
+                return {futures[f] for f in pending}
+    except BaseException:
+        terminate_pool(pool)
+        raise
+    pool.shutdown()
+    return set()
+
+
+# ---------------------------------------------------------
+# Automatisk ordresøk med tidsbudsjett
+# ---------------------------------------------------------
+# Som auto.arima velges d først (KPSS), så informasjonskriteriene er
+# sammenlignbare. Trinn 1 tilpasser hele kandidatgitteret på et kort vindu med
+# få iterasjoner; trinn 2 tilpasser bare de top_k beste på hele vinduet. Begge
+# trinn kjører parallelt og stoppes ved fristen. Alle kandidater caches.
+SEARCH_PQ = (0, 1, 2)
+SEARCH_SEASONAL = ((0, 0), (1, 0), (0, 1), (1, 1))
+
+
+def choose_d(y: pd.Series, alpha=0.05):
+    """d=1 hvis KPSS forkaster nivå-stasjonaritet, ellers 0."""
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        p_value = kpss(y.to_numpy(dtype=float), regression="c", nlags="auto")[1]
+    return int(p_value < alpha)
+
+
+def candidate_grid(d, s):
+    """Kandidater (order, seasonal_order); s=0 gir bare ikke-sesongmodeller (f.eks. Fourier-modus)."""
+    seasonal = SEARCH_SEASONAL if s > 0 else ((0, 0),)
+    grid = []
+    for p in SEARCH_PQ:
+        for q in SEARCH_PQ:
+            for P, Q in seasonal:
+                so = (P, 0, Q, s) if (P or Q) else (0, 0, 0, 0)
+                grid.append(((p, d, q), so))
+    return grid
+
+
+def _score_job(args):
+    """Arbeidsfunksjon for ordresøket: tilpass og returner parametere og kriterier."""
+    y_train, order, seasonal_order, harmonics, maxiter = args
+    t0 = time.perf_counter()
+    result = fit_sarimax(y_train, order, seasonal_order, harmonics=harmonics, maxiter=maxiter)
+    aic, bic = float(result.aic), float(result.bic)
+    return {
+        "params": np.asarray(result.params),
+        "aic": aic if np.isfinite(aic) else np.inf,
+        "bic": bic if np.isfinite(bic) else np.inf,
+        "sekunder": time.perf_counter() - t0,
+    }
+
+
+def auto_order(y_train: pd.Series, price_area, source, s=24, criterion="aic", budget_s=60.0,
+               short_hours=14 * 24, top_k=3, short_maxiter=50, on_progress=None, max_workers=None,
+               harmonics=()):
+    """
+    Søk etter beste (order, seasonal_order) for serien innenfor budget_s sekunder.
+    Med harmonics (Fourier-modus) søkes bare ikke-sesongordrer.
+    on_progress(trinn, ferdige, totalt) kalles underveis.
+    Returnerer dict med order, seasonal_order, result, kandidater (DataFrame) og tider.
+    """
+    t_start = time.monotonic()
+    deadline = t_start + budget_s
+    timing = {}
+
+    d = choose_d(y_train)
+    grid = candidate_grid(d, 0 if harmonics else s)
+    timing["d-valg (KPSS)"] = time.monotonic() - t_start
+
+    rows = []
+
+    def run_stage(stage, series, candidates, maxiter, stage_deadline):
+        scores, tasks = {}, {}
+        for order, so in candidates:
+            spec, key = _model_key(series, price_area, source, order, so, harmonics)
+            record = _load_record(key)
+            if record is not None and criterion in record:
+                scores[(order, so)] = record
+                rows.append({"trinn": stage, "order": order, "seasonal_order": so,
+                             "aic": record.get("aic"), "bic": record.get("bic"),
+                             "sekunder": 0.0, "status": "cache"})
+            else:
+                tasks[(order, so)] = (series, order, so, harmonics, maxiter)
+
+        def on_result(label, answer):
+            order, so = label
+            spec, key = _model_key(series, price_area, source, order, so, harmonics)
+            _store_params(key, answer["params"], aic=answer["aic"], bic=answer["bic"])
+            if stage == 2:
+                _store_params(f"{spec}_latest", answer["params"])
+            scores[label] = answer
+            rows.append({"trinn": stage, "order": order, "seasonal_order": so,
+                         "aic": answer["aic"], "bic": answer["bic"],
+                         "sekunder": answer["sekunder"], "status": "ferdig"})
+
+        def on_tick():
+            if on_progress is not None:
+                on_progress(stage, len(scores), len(candidates))
+
+        t0 = time.monotonic()
+        unfinished = _pool_map(_score_job, tasks, on_result, on_tick, stage_deadline, max_workers) if tasks else set()
+        for order, so in unfinished:
+            rows.append({"trinn": stage, "order": order, "seasonal_order": so,
+                         "aic": np.nan, "bic": np.nan, "sekunder": np.nan, "status": "tidsfrist"})
+        return scores, time.monotonic() - t0
+
+    # Trinn 1: alle kandidater på et kort vindu (halve budsjettet)
+    short = y_train.iloc[-short_hours:] if len(y_train) > short_hours else y_train
+    stage1, timing["trinn 1 (kort vindu)"] = run_stage(
+        1, short, grid, short_maxiter, t_start + 0.5 * budget_s
+    )
+    if not stage1:
+        raise RuntimeError("Ingen kandidater ble ferdige innenfor tidsbudsjettet.")
+
+    # Trinn 2: de beste på hele treningsvinduet
+    ranked = sorted(stage1, key=lambda label: stage1[label][criterion])
+    stage2, timing["trinn 2 (fullt vindu)"] = run_stage(2, y_train, ranked[:top_k], 200, deadline)
+
+    if stage2:
+        order, so = min(stage2, key=lambda label: stage2[label][criterion])
+        key = _model_key(y_train, price_area, source, order, so, harmonics)[1]
+        result, _ = _cached(key, y_train, order, so, harmonics)
+        kilde = "fullt vindu"
+    else:
+        # Tiden gikk ut: bruk vinneren fra trinn 1 med parameterne fra det korte vinduet
+        order, so = ranked[0]
+        result = build_model(y_train, order, so, harmonics).smooth(stage1[(order, so)]["params"])
+        kilde = "kort vindu (tidsfrist)"
+
+    timing["totalt"] = time.monotonic() - t_start
+    candidates = pd.DataFrame(rows).sort_values(["trinn", criterion], na_position="last")
+    return {
+        "order": order,
+        "seasonal_order": so,
+        "result": result,
+        "d": d,
+        "kilde": kilde,
+        "kandidater": candidates.reset_index(drop=True),
+        "tider": timing,
+    }
+
+
+# ---------------------------------------------------------
+# Jobbkø for SARIMAX-tilpasninger
+# ---------------------------------------------------------
+# Tilpasningene siden starter, kjøres i en jobbkø med egne arbeiderprosesser
+# som deles av alle økter, så en lang tilpasning ikke holder skripttråden.
+# Jobb-ID-en er cachenøkkelen (område, kilde, ordre og datavindu): samme modell
+# på samme data blir samme jobb. Arbeideren returnerer bare parametere og
+# informasjonskriterier, som skrives til modellcachen på disk. Resultatobjektet
+# bygges først når en kjøring slår opp modellen (som et vanlig disktreff), så
+# ingen modellberegning skjer i serverens tråd for ferdige jobber. Én kjerne
+# holdes fri til Streamlit-serveren.
+FIT_WORKERS = max(1, (os.cpu_count() or 1) - 1)
+
+
+def _fit_job(args):
+    """Arbeidsfunksjon for jobbkøen (må ligge på modulnivå); melder iterasjonstall."""
+    key, y_train, order, seasonal_order, harmonics, start_params = args
+    iterations = [0]
+
+    def report(_params):
+        iterations[0] += 1
+        report_progress(iterations[0])
+
+    result = fit_sarimax(y_train, order, seasonal_order, start_params, harmonics, callback=report)
+    if not np.isfinite(result.llf):
+        raise ValueError("SARIMAX ga ikke-endelig likelihood")
+    return key, np.asarray(result.params), float(result.aic), float(result.bic)
+
+
+fit_queue = JobQueue(_fit_job, max_workers=FIT_WORKERS)
+
+
+def queue_fit(y_train: pd.Series, price_area, source, order: tuple, seasonal_order: tuple, harmonics=(),
+              retry=False, start_params=None):
+    """
+    SARIMAX fra cachen, ellers en tilpasning i jobbkøen.
+    Returnerer (resultat, status, jobb-ID): ved cachetreff (resultat, "minne"/"disk", None),
+    ellers (None, "kald"/"varmstart", ID-en til jobben). retry=True starter en
+    feilet eller avbrutt jobb for samme modell på nytt. start_params er varmstarten
+    (ellers sist lagrede parametere for samme modell).
+    """
+    spec, key = _model_key(y_train, price_area, source, order, seasonal_order, harmonics)
+    result, status = _cached(key, y_train, order, seasonal_order, harmonics)
+    if result is not None:
+        return result, status, None
+
+    job = fit_queue.status(key)
+    if job is None or (retry and job["tilstand"] in ("feil", "avbrutt")):
+        start = start_params
+        if start is None:
+            start = _warm_start(spec, y_train, order, seasonal_order, harmonics)
+        fit_queue.submit(
+            key, (key, y_train, order, seasonal_order, harmonics, start),
+            on_done=lambda answer: _store_fit(spec, *answer),
+            retry=retry, start="kald" if start is None else "varmstart",
+        )
+        job = fit_queue.status(key)
+    return None, job["start"], key
+
+
+def job_result(job_id, y_train, order, seasonal_order, harmonics=()):
+    """
+    Resultatet fra en ferdig jobb (fra modellcachen) eller None. En jobb som er
+    ryddet bort fra køen, slås også opp i cachen.
+    """
+    job = fit_queue.status(job_id)
+    if job is not None and job["tilstand"] != "ferdig":
+        return None
+    result, _ = _cached(job_id, y_train, order, seasonal_order, harmonics)
+    return result
+
+
+# ---------------------------------------------------------
+# Tidsbudsjett med modellnivåer
+# ---------------------------------------------------------
+# Nivåene prøves i rekkefølge: sesongnaiv og ETS (millisekunder) regnes i
+# hovedprosessen mens SARIMAX tilpasses i jobbkøen. Blir SARIMAX ikke ferdig
+# innen fristen, brukes beste ferdige nivå. Jobben fortsetter og legges i
+# modellcachen, så neste kjøring får SARIMAX.
+TIERS = ("sesongnaiv", "ets", "sarimax")
+
+BASELINES = {"sesongnaiv": seasonal_naive, "ets": ets_forecast}
+
+
+def baseline_season(seasonal_order, harmonics=()):
+    """Sesonglengden referansemodellene bruker."""
+    if seasonal_order[3]:
+        return seasonal_order[3]
+    return 168 if dict(harmonics).get(168) else 24
+
+
+def tiered_forecasts(jobs: dict, steps, budget_s=10.0, retry=False):
+    """
+    Prognoser innen budget_s sekunder.
+    jobs: {etikett: (y_train, område, kilde, order, seasonal_order, harmonics)}.
+    Returnerer {etikett: dict} med nivå, prognose (None for SARIMAX, som lages av
+    kalleren), resultat og status (SARIMAX), tider per nivå (sekunder eller merknad)
+    og bakgrunn (jobb-ID for en SARIMAX-tilpasning som fortsatt venter eller kjører,
+    ellers None). Feiler alle referansemodellene, er nivået "sarimax" uten prognose
+    og resultat til jobben er ferdig; feiler også SARIMAX, kastes RuntimeError.
+    retry sendes videre til queue_fit.
+    """
+    t_start = time.monotonic()
+    deadline = t_start + budget_s
+    out, running = {}, {}
+
+    for label, job in jobs.items():
+        result, status, job_id = queue_fit(*job, retry=retry)
+        if result is not None:
+            out[label] = {"nivå": "sarimax", "prognose": None, "resultat": result, "status": status,
+                          "tider": {"sarimax": time.monotonic() - t_start}, "bakgrunn": None}
+        else:
+            running[label] = (job_id, status)
+
+    # Referansemodellene regnes mens SARIMAX kjører
+    for label in running:
+        y_train, _, _, order, seasonal_order, harmonics = jobs[label]
+        season = baseline_season(seasonal_order, harmonics)
+        tider, best = {}, None
+        for tier, method in BASELINES.items():
+            if best is not None and time.monotonic() >= deadline:
+                tider[tier] = "tidsfrist"
+                continue
+            t0 = time.monotonic()
+            try:
+                best = (tier, method(y_train, steps, season))
+                tider[tier] = time.monotonic() - t0
+            except Exception as e:
+                tider[tier] = f"feil: {e}"
+        # Ingen referansemodell lyktes: SARIMAX er eneste nivå og må vente på jobben
+        nivå, prognose = best if best is not None else ("sarimax", None)
+        out[label] = {"nivå": nivå, "prognose": prognose, "resultat": None, "status": None,
+                      "tider": tider, "bakgrunn": None}
+
+    fit_queue.wait([job_id for job_id, _ in running.values()], timeout=max(0.0, deadline - time.monotonic()))
+
+    for label, (job_id, status) in running.items():
+        y_train, _, _, order, seasonal_order, harmonics = jobs[label]
+        tier = out[label]
+        job = fit_queue.status(job_id)
+        if job is not None and job["tilstand"] in ACTIVE:
+            tier["tider"]["sarimax"] = "tidsfrist (fortsetter i bakgrunnen)"
+            tier["bakgrunn"] = job_id
+            continue
+        result = job_result(job_id, y_train, order, seasonal_order, harmonics)
+        if result is None:
+            tier["tider"]["sarimax"] = f"feil: {job['feil'] or job['tilstand']}" if job else "feil: jobben finnes ikke"
+            if tier["prognose"] is None:
+                reasons = "; ".join(f"{name} {why}" for name, why in tier["tider"].items())
+                raise RuntimeError(f"{label}: ingen modell lyktes ({reasons})")
+            continue
+        tier.update(nivå="sarimax", prognose=None, resultat=result, status=status)
+        tier["tider"]["sarimax"] = time.monotonic() - t_start
+
+    return out
+
+
+# ---------------------------------------------------------
+# Rullerende origo: nye timer legges til med filtrering
+# ---------------------------------------------------------
+# results.extend kjører Kalman-filteret bare over de nye timene fra siste
+# tilstand, uten ny estimering. Parameterne estimeres på nytt (varmstart) når
+# refit_hver timer er lagt til, eller når de standardiserte ett-stegs-feilene
+# for de siste drift_vindu timene har gjennomsnittlig z² over drift_grense.
+# Den nye estimeringen kjøres i jobbkøen som andre tilpasninger; til den er
+# ferdig brukes den filtrerte modellen. Låsen holdes bare under filtreringen.
+
+def _extend(result, chunk: pd.Series):
+    """
+    Som result.extend, men chunk kan starte med de siste rå verdiene som
+    simple_differencing trenger; modellen differensierer dem bort selv.
+    """
+    mod = result.model.clone(chunk, exog=_exog_for(result.model, chunk.index))
+    mod.ssm.initialization = Initialization(
+        mod.k_states,
+        "known",
+        constant=result.predicted_state[..., -1],
+        stationary_cov=result.predicted_state_cov[..., -1],
+    )
+    return mod.filter(result.params)
+
+
+class IncrementalForecaster:
+    def __init__(self, result, y_train: pd.Series, price_area, source, order: tuple, seasonal_order: tuple,
+                 refit_hver=7 * 24, drift_vindu=24, drift_grense=4.0, harmonics=()):
+        self.result = result
+        self.price_area = price_area
+        self.source = source
+        self.order = order
+        self.seasonal_order = seasonal_order
+        self.harmonics = harmonics
+        self.refit_hver = refit_hver
+        self.drift_grense = drift_grense
+
+        # Treningsvinduet rulles med konstant lengde
+        self.history = y_train.copy()
+        self.window_len = len(y_train)
+        # Antall rå verdier simple_differencing bruker før første differanse
+        self.n_diff = order[1] + seasonal_order[1] * seasonal_order[3]
+
+        self.siden_refit = 0
+        self.z = deque(maxlen=drift_vindu)
+        # (jobb-ID, vindu, årsak) for en ny estimering som venter i jobbkøen
+        self.pending = None
+        self._lock = threading.Lock()
+
+    @property
+    def last_time(self):
+        return self.history.index[-1]
+
+    def drift(self):
+        return len(self.z) == self.z.maxlen and float(np.mean(np.square(self.z))) > self.drift_grense
+
+    def _chunk(self, before: pd.Series, new: pd.Series):
+        # Differensieringen trenger de siste rå verdiene foran de nye timene
+        return pd.concat([before.iloc[-self.n_diff:], new]) if self.n_diff else new
+
+    def _fold(self, new: pd.Series):
+        self.result = _extend(self.result, self._chunk(self.history, new))
+        self.z.extend(self.result.standardized_forecasts_error[0, -len(new):])
+        self.history = pd.concat([self.history, new]).iloc[-self.window_len:]
+        self.siden_refit += len(new)
+
+    def _adopt(self, result, window: pd.Series, reason):
+        """Ta i bruk parametere estimert på window; timer som kom etterpå filtreres inn."""
+        new = self.history[self.history.index > window.index[-1]]
+        self.result = _extend(result, self._chunk(window, new)) if len(new) else result
+        self.siden_refit = len(new)
+        self.z.clear()
+        self.pending = None
+        return reason
+
+    def update(self, y: pd.Series):
+        """
+        Fold inn timer nyere enn last_time. Returnerer "uendret", "filtrert",
+        "refit_venter" (ny estimering i jobbkøen, filtrert modell brukes),
+        "refit_feil" (estimeringen feilet, beholder parameterne), eller
+        "refit_plan"/"refit_drift" når nye parametere tas i bruk.
+        """
+        with self._lock:
+            new = y[y.index > self.last_time]
+            if len(new):
+                self._fold(new)
+            quiet = "filtrert" if len(new) else "uendret"
+            pending = self.pending
+            if pending is None:
+                drift = self.drift()
+                if not drift and self.siden_refit < self.refit_hver:
+                    return quiet
+                window, reason, start = self.history, "refit_drift" if drift else "refit_plan", self.result.params
+
+        # Innsending og oppslag skjer utenfor låsen; tilpasningen kjører i jobbkøen
+        if pending is None:
+            result, _, job_id = queue_fit(
+                window, self.price_area, self.source, self.order, self.seasonal_order, self.harmonics,
+                start_params=start,
+            )
+        else:
+            job_id, window, reason = pending
+            job = fit_queue.status(job_id)
+            if job is not None and job["tilstand"] in ACTIVE:
+                return "refit_venter"
+            # Ferdig (parameterne ligger i modellcachen), feilet eller ryddet bort
+            result, _ = _cached(job_id, window, self.order, self.seasonal_order, self.harmonics)
+
+        with self._lock:
+            if self.pending is not pending:
+                # En annen økt har sendt inn eller tatt i bruk estimeringen i mellomtiden
+                return "refit_venter" if self.pending is not None else quiet
+            if result is not None:
+                return self._adopt(result, window, reason)
+            if pending is None:
+                self.pending = (job_id, window, reason)
+                return "refit_venter"
+            # Feilet: behold parameterne og prøv igjen etter neste intervall
+            self.pending = None
+            self.siden_refit = 0
+            self.z.clear()
+            return "refit_feil"
+
+
+_forecasters = OrderedDict()
+
+
+def rolling_forecaster(y: pd.Series, y_train: pd.Series, price_area, source, order: tuple, seasonal_order: tuple,
+                       harmonics=(), result=None):
+    """
+    Forecaster for serien med origo i siste tilgjengelige time. Første kall bruker
+    result (tilpasset på treningsvinduet), ellers modellcachen; senere kall legger
+    bare til nye timer. Returnerer (forecaster, status).
+    """
+    # Nøkkelen følger hele treningsvinduet (start, slutt og verdier), så et nytt
+    # vindu gir en ny tilpasning i stedet for en forecaster fra det gamle
+    _, key = _model_key(y_train, price_area, source, order, seasonal_order, harmonics)
+
+    with _lock:
+        forecaster = _forecasters.get(key)
+    if forecaster is None:
+        if result is None:
+            result, _ = fitted_model(y_train, price_area, source, order, seasonal_order, harmonics)
+        forecaster = IncrementalForecaster(result, y_train, price_area, source, order, seasonal_order,
+                                           harmonics=harmonics)
+        with _lock:
+            forecaster = _forecasters.setdefault(key, forecaster)
+            while len(_forecasters) > MEMORY_ENTRIES:
+                _forecasters.popitem(last=False)
+
+    return forecaster, forecaster.update(y[y.index > y_train.index[0]])
+
+
+if __name__ == "__main__":
+    # Benchmark kald start vs. varmstart: python -m functions.forecasting
+    import shutil
+    import tempfile
+
+    CACHE_DIR = Path(tempfile.mkdtemp())
+    rng = np.random.default_rng(0)
+    n = 60 * 24
+    t = pd.date_range("2021-01-01", periods=n + 48, freq="h")
+    # Simulert sesong-ARMA rundt et døgnmønster (ligner timeforbruk)
+    sim = build_model(pd.Series(np.zeros(n + 48), index=t), (1, 0, 1), (1, 0, 0, 24))
+    noise = sim.simulate([0.8, -0.3, 0.6, 3e3 ** 2], n + 48, random_state=rng)
+    y = pd.Series(1e5 + 2e4 * np.sin(np.arange(n + 48) * 2 * np.pi / 24) + np.asarray(noise), index=t)
+
+    for order, seasonal in [((1, 0, 1), (0, 0, 0, 0)), ((2, 0, 1), (1, 0, 1, 24))]:
+        _results.clear()
+        t0 = time.perf_counter()
+        cold, s0 = fitted_model(y[:n], "NO1", "production", order, seasonal)
+        t1 = time.perf_counter()
+        again, s1 = fitted_model(y[:n], "NO1", "production", order, seasonal)
+        t2 = time.perf_counter()
+        _results.clear()
+        disk, s2 = fitted_model(y[:n], "NO1", "production", order, seasonal)
+        t3 = time.perf_counter()
+        warm, s3 = fitted_model(y[24:n + 24], "NO1", "production", order, seasonal)
+        t4 = time.perf_counter()
+        ref = fit_sarimax(y[24:n + 24], order, seasonal)
+        t5 = time.perf_counter()
+        print(
+            f"{order}{seasonal}: {s0} {1000 * (t1 - t0):.0f} ms ({cold.mle_retvals['iterations']} it), "
+            f"{s1} {1000 * (t2 - t1):.1f} ms, {s2} {1000 * (t3 - t2):.0f} ms, "
+            f"{s3} (vindu +24 t) {1000 * (t4 - t3):.0f} ms ({warm.mle_retvals['iterations']} it) "
+            f"vs kald {1000 * (t5 - t4):.0f} ms ({ref.mle_retvals['iterations']} it), "
+            f"Δllf {warm.llf - ref.llf:+.2f}"
+        )
+
+    # Rullerende oppdatering: én ny time om gangen i 48 timer
+    for order, seasonal in [((1, 0, 1), (1, 0, 1, 24)), ((1, 1, 1), (0, 0, 0, 0))]:
+        fc = IncrementalForecaster(fit_sarimax(y[:n], order, seasonal), y[:n], "NO1", "production", order, seasonal)
+        t0 = time.perf_counter()
+        for h in range(1, 49):
+            fc.update(y[:n + h])
+        t1 = time.perf_counter()
+        full = fit_sarimax(y[48:n + 48], order, seasonal, start_params=fc.result.params)
+        f_inc = fc.result.get_forecast(24).predicted_mean.to_numpy()
+        f_full = build_model(y[48:n + 48], order, seasonal).smooth(fc.result.params).get_forecast(24).predicted_mean.to_numpy()
+        print(
+            f"{order}{seasonal} rullerende: {1000 * (t1 - t0) / 48:.1f} ms/time, "
+            f"samme forecast som fullt filterpass: {np.allclose(f_inc, f_full, rtol=1e-6)}, "
+            f"siste origo {fc.last_time}"
+        )
+
+    # To uavhengige modeller i jobbkøen (som «Begge» på page_forecast)
+    _results.clear()
+    order, seasonal = (2, 0, 1), (1, 0, 1, 24)
+    jobs = {
+        "produksjon": (y[:n], "NO2", "production", order, seasonal, ()),
+        "forbruk": (1.5 * y[48:n + 48], "NO2", "consumption", order, seasonal, ()),
+    }
+    t0 = time.perf_counter()
+    for y_train, *_ in jobs.values():
+        fit_sarimax(y_train, order, seasonal)
+    t1 = time.perf_counter()
+    fit_queue.wait([queue_fit(*job)[2] for job in jobs.values()])
+    t2 = time.perf_counter()
+    print(f"to modeller: sekvensielt {t1 - t0:.2f} s, jobbkø {t2 - t1:.2f} s ({FIT_WORKERS} arbeidere)")
+
+    # Responsivitet: korte oppgaver i serverprosessen (som andre økters skript)
+    # mens en tilpasning kjører i en tråd i samme prosess vs. i jobbkøen
+    def latencies(busy):
+        out = []
+        while busy():
+            t0 = time.perf_counter()
+            sum(i * i for i in range(20_000))
+            out.append(1000 * (time.perf_counter() - t0))
+            time.sleep(0.01)
+        return np.array(out)
+
+    idle = latencies(iter([True] * 100 + [False]).__next__)
+    y_load = 1.2 * y[:n]
+    thread = threading.Thread(target=fit_sarimax, args=(y_load, order, seasonal))
+    thread.start()
+    in_thread = latencies(thread.is_alive)
+    _results.clear()
+    job_id = queue_fit(y_load, "NO2", "load", order, seasonal)[2]
+    in_queue = latencies(lambda: fit_queue.status(job_id)["tilstand"] in ACTIVE)
+    print("korte oppgaver (p50/p95 ms): " + ", ".join(
+        f"{name} {np.median(lat):.1f}/{np.percentile(lat, 95):.1f}"
+        for name, lat in (("uten last", idle), ("tilpasning i tråd", in_thread), ("tilpasning i jobbkø", in_queue))
+    ))
+
+    # Automatisk ordresøk med tidsbudsjett
+    for budget in (20.0, 120.0):
+        shutil.rmtree(CACHE_DIR, ignore_errors=True)
+        _results.clear()
+        report = auto_order(y[:n], "NO3", "production", s=24, budget_s=budget)
+        done = report["kandidater"].groupby("trinn")["status"].value_counts().to_dict()
+        t0 = time.perf_counter()
+        again = auto_order(y[:n], "NO3", "production", s=24, budget_s=budget)
+        t1 = time.perf_counter()
+        print(
+            f"ordresøk (budsjett {budget:.0f} s, d={report['d']}): vinner {report['order']}{report['seasonal_order']} "
+            f"fra {report['kilde']}, tider " + ", ".join(f"{k} {v:.1f} s" for k, v in report["tider"].items())
+            + f", kandidater {done}, gjentatt søk {t1 - t0:.1f} s"
+        )
+
+    # Rask sesongmodus: Fourier-ledd vs. seasonal_order med s=168
+    import tracemalloc
+
+    n_long = 3 * 8760 + 168
+    idx = pd.date_range("2021-01-04", periods=n_long, freq="h")
+    h = np.arange(n_long)
+    ar = np.zeros(n_long)
+    shocks = rng.normal(0, 3e3, n_long)
+    for i in range(1, n_long):
+        ar[i] = 0.8 * ar[i - 1] + shocks[i]
+    weekend = np.where((h // 24) % 7 >= 5, -1.5e4, 0.0)
+    y_long = pd.Series(1e5 + 2e4 * np.sin(h * 2 * np.pi / 24) + weekend + ar, index=idx)
+
+    for name, y_train, seasonal, harmonics in [
+        ("Fourier, 21 dager", y_long.iloc[-168 - 21 * 24:-168], (0, 0, 0, 0), FOURIER_HARMONICS),
+        ("Fourier, 3 år", y_long.iloc[:-168], (0, 0, 0, 0), FOURIER_HARMONICS),
+        ("s=168, 21 dager", y_long.iloc[-168 - 21 * 24:-168], (1, 0, 1, 168), ()),
+    ]:
+        tracemalloc.start()
+        t0 = time.perf_counter()
+        res = fit_sarimax(y_train, (1, 0, 1), seasonal, harmonics=harmonics)
+        pred = forecast(res, 168).predicted_mean
+        t1 = time.perf_counter()
+        peak = tracemalloc.get_traced_memory()[1] / 1e6
+        tracemalloc.stop()
+        mae = np.mean(np.abs(pred - y_long[pred.index]))
+        print(f"{name} ({len(y_train)} timer): {t1 - t0:.1f} s, topp {peak:.0f} MB, MAE neste uke {mae:.0f}")
@@ -0,0 +1,200 @@
+import json
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import shapely
+import streamlit as st
+from shapely.geometry import mapping, shape
+
+
+# ---------------------------------------------------------
+# Prisområder: sammenslåtte og forenklede geometrier for kartet
+# ---------------------------------------------------------
+# file.geojson har tusenvis av kystpunkter med 16 desimaler. Geometriene slås
+# sammen per ElSpotOmr og forenkles som én dekning (coverage_simplify), så
+# felles grenser forenkles likt og naboområdene verken overlapper eller får
+# glipper. Koordinatene rundes til 5 desimaler (ca. 1 m). Det finnes én
+# forenkling per zoomnivå siden selv setter (oversikt, eller zoomet inn på
+# valgt område); toleransen er omtrent en halv skjermpiksel der. Zoom i
+# nettleseren når ikke serveren, så oppløsningen følger bare valgt område.
+GEOJSON_PATH = Path(__file__).resolve().parent.parent / "file.geojson"
+AREA_KEY = "ElSpotOmr"
+PRECISION = 5
+
+# Zoomnivå (fra og med) -> toleranse i grader
+TOLERANCES = {4: 0.02, 5: 0.01, 6: 0.005}
+
+
+def clean_area(value):
+    """Samme rensing som kartet alltid har brukt: «NO 1» -> «NO1»."""
+    return str(value).replace(" ", "")
+
+
+def read_areas(path=GEOJSON_PATH) -> dict:
+    """{område: geometri} fra GeoJSON-filen, slått sammen per ElSpotOmr."""
+    with open(path, "r", encoding="utf-8") as f:
+        gj = json.load(f)
+
+    parts = {}
+    for feat in gj["features"]:
+        area = clean_area(feat.get("properties", {}).get(AREA_KEY, ""))
+        parts.setdefault(area, []).append(shape(feat["geometry"]))
+    return {area: shapely.union_all(geoms) for area, geoms in sorted(parts.items())}
+
+
+def simplify_areas(areas: dict, tolerance, precision=PRECISION) -> dict:
+    """Topologibevarende forenkling av alle områdene samlet, med avrundede koordinater."""
+    geoms = shapely.coverage_simplify(np.array(list(areas.values())), tolerance)
+    geoms = shapely.transform(geoms, lambda coords: np.round(coords, precision))
+    return dict(zip(areas, geoms))
+
+
+def feature_collection(areas: dict) -> dict:
+    return {
+        "type": "FeatureCollection",
+        "features": [
+            {"type": "Feature", "id": area, "properties": {AREA_KEY: area}, "geometry": mapping(geom)}
+            for area, geom in areas.items()
+        ],
+    }
+
+
+def zoom_level(zoom):
+    """Nivået i TOLERANCES som gjelder for zoom."""
+    levels = sorted(TOLERANCES)
+    return max((level for level in levels if level <= zoom), default=levels[0])
+
+
+@st.cache_resource(show_spinner=False)
+def area_geometries() -> dict:
+    """Sammenslåtte geometrier i full oppløsning (én gang per prosess)."""
+    return read_areas()
+
+
+@st.cache_resource(show_spinner=False)
+def _map_geojson(level):
+    return feature_collection(simplify_areas(area_geometries(), TOLERANCES[level]))
+
+
+def map_geojson(zoom) -> dict:
+    """
+    Forenklet FeatureCollection for kartet ved zoom. Objektet deles av alle
+    økter (cache_resource) og skal ikke endres.
+    """
+    return _map_geojson(zoom_level(zoom))
+
+
+# ---------------------------------------------------------
+# Metadata og romlig indeks for prisområdene
+# ---------------------------------------------------------
+# Sentroide, utstrekning og indeks i FeatureCollection beregnes vektorisert én
+# gang per prosess og slås opp på område-ID. Et STRtree over geometriene
+# finner området for en vilkårlig koordinat (f.eks. et klikk i kartet) uten å
+# teste alle polygonene.
+
+class AreaIndex:
+    def __init__(self, areas: dict):
+        self.geometries = np.array(list(areas.values()))
+        centroids = shapely.centroid(self.geometries)
+        bounds = shapely.bounds(self.geometries)
+        self.table = pd.DataFrame(
+            {
+                "lat": shapely.get_y(centroids),
+                "lon": shapely.get_x(centroids),
+                "minx": bounds[:, 0],
+                "miny": bounds[:, 1],
+                "maxx": bounds[:, 2],
+                "maxy": bounds[:, 3],
+                "feature": np.arange(len(areas)),
+            },
+            index=pd.Index(list(areas), name=AREA_KEY),
+        )
+        self.tree = shapely.STRtree(self.geometries)
+        shapely.prepare(self.geometries)
+
+    def __contains__(self, area):
+        return area in self.table.index
+
+    def info(self, area) -> pd.Series:
+        """Rad med lat/lon (sentroide), minx/miny/maxx/maxy og feature for området."""
+        return self.table.loc[area]
+
+    def locate(self, lon, lat):
+        """Området koordinaten ligger i, eller None."""
+        # Kandidater fra treet (utstrekning), deretter presis test mot de preparerte polygonene
+        candidates = np.sort(self.tree.query(shapely.Point(lon, lat)))
+        hits = candidates[shapely.intersects_xy(self.geometries[candidates], lon, lat)]
+        return self.table.index[hits[0]] if len(hits) else None
+
+
+@st.cache_resource(show_spinner=False)
+def area_index() -> AreaIndex:
+    """AreaIndex for prisområdene (én gang per prosess)."""
+    return AreaIndex(area_geometries())
+
+
+if __name__ == "__main__":
+    # Benchmark mot rå file.geojson: python -m functions.geometry
+    import time
+
+    from plotly.io.json import to_json_plotly
+
+    def serialize(payload, repeat=5):
+        t0 = time.perf_counter()
+        for _ in range(repeat):
+            text = to_json_plotly(payload)
+        return len(text), (time.perf_counter() - t0) / repeat
+
+    with open(GEOJSON_PATH, "r", encoding="utf-8") as f:
+        raw = json.load(f)
+    # Som før: hele filen pluss en kopi av valgt område til markeringen
+    size, seconds = serialize([raw, {"type": "FeatureCollection", "features": raw["features"][:1]}])
+    n_coords = sum(len(shapely.get_coordinates(shape(f["geometry"]))) for f in raw["features"])
+    print(f"rå: {size / 1e6:.2f} MB, {n_coords} punkter, serialisering {1000 * seconds:.0f} ms")
+
+    areas = read_areas()
+    for level, tolerance in TOLERANCES.items():
+        t0 = time.perf_counter()
+        simplified = simplify_areas(areas, tolerance)
+        gj = feature_collection(simplified)
+        t1 = time.perf_counter()
+        size, seconds = serialize(gj)
+        print(
+            f"zoom {level}+ (toleranse {tolerance}°): {size / 1e6:.3f} MB, "
+            f"{len(shapely.get_coordinates(np.array(list(simplified.values()))))} punkter, "
+            f"serialisering {1000 * seconds:.1f} ms, gyldig dekning "
+            f"{bool(shapely.coverage_is_valid(np.array(list(simplified.values()))))}, "
+            f"bygget på {1000 * (t1 - t0):.0f} ms"
+        )
+
+    # Oppslag: som før (shape, centroid per rad og lineært søk) vs. AreaIndex
+    from shapely.geometry import shape as to_shape
+
+    t0 = time.perf_counter()
+    rows = pd.DataFrame([
+        {AREA_KEY: clean_area(f["properties"][AREA_KEY]), "geometry": to_shape(f["geometry"])}
+        for f in raw["features"]
+    ])
+    rows["lat"] = rows["geometry"].apply(lambda g: g.centroid.y)
+    rows["lon"] = rows["geometry"].apply(lambda g: g.centroid.x)
+    rows.loc[rows[AREA_KEY] == "NO3", "geometry"].iloc[0].bounds
+    next(f for f in raw["features"] if clean_area(f["properties"][AREA_KEY]) == "NO3")
+    t1 = time.perf_counter()
+    rng = np.random.default_rng(0)
+    points = rng.uniform([4.0, 57.5], [31.5, 71.5], size=(1000, 2))
+    naive = [next((a for a, g in areas.items() if g.intersects(shapely.Point(lon, lat))), None) for lon, lat in points]
+    t2 = time.perf_counter()
+    index = AreaIndex(areas)
+    t3 = time.perf_counter()
+    for _ in range(1000):
+        index.info("NO3")
+    t4 = time.perf_counter()
+    found = [index.locate(lon, lat) for lon, lat in points]
+    t5 = time.perf_counter()
+    print(
+        f"per kjøring før: {1000 * (t1 - t0):.0f} ms; AreaIndex bygget én gang på {1000 * (t3 - t2):.0f} ms, "
+        f"oppslag {1000 * (t4 - t3):.1f} µs, punkt-i-område {1000 * (t5 - t4):.1f} µs "
+        f"(vs. {1000 * (t2 - t1):.1f} µs med lineært søk), samme svar {found == naive}, "
+        f"treff {sum(a is not None for a in found)}/1000"
+    )
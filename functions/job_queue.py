@@ -0,0 +1,256 @@
+import multiprocessing
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import CancelledError, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+
+# ---------------------------------------------------------
+# Jobbkø med egne arbeiderprosesser
+# ---------------------------------------------------------
+# Tunge beregninger kjøres i en prosesspool som deles av alle økter i
+# Streamlit-serveren, så verken skripttråden eller GIL-en i serverprosessen
+# holdes mens de pågår. Hver jobb har en ID; legges samme ID inn igjen mens
+# jobben venter, kjører eller er ferdig, gjenbrukes den. Arbeiderne melder
+# oppstart og fremdrift via en kø som en tråd i serverprosessen leser, og siden
+# spør etter status(id). Ferdige jobber huskes til det er max_jobs nyere.
+# En jobb som kjører, avbrytes ved å stoppe arbeiderne og starte en ny pool;
+# de andre aktive jobbene legges i den nye poolen og starter på nytt.
+
+MAX_JOBS = 64
+
+ACTIVE = ("i kø", "kjører")
+
+_progress = None
+_current = None
+
+
+def _init_worker(progress):
+    global _progress
+    _progress = progress
+
+
+def _run(worker, run, args):
+    """Kjøres i arbeiderprosessen rundt worker(args); run er (jobb-ID, forsøk)."""
+    global _current
+    _current = run
+    _progress.put((run, "start", None))
+    try:
+        return worker(args)
+    finally:
+        _current = None
+
+
+def report_progress(value):
+    """Meld fremdrift fra arbeidsfunksjonen. Gjør ingenting utenfor jobbkøen."""
+    if _progress is not None and _current is not None:
+        _progress.put((_current, "fremdrift", value))
+
+
+def terminate_pool(pool):
+    """Stopp poolen, også arbeidere som er midt i en jobb."""
+    terminate = getattr(pool, "terminate_workers", None)  # Python 3.14+
+    if terminate is not None:
+        terminate()
+        return
+    for proc in list((pool._processes or {}).values()):
+        proc.terminate()
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+class Job:
+    def __init__(self, job_id, meta):
+        self.id = job_id
+        self.meta = meta
+        self.args = None
+        self.on_done = None
+        self.attempt = 0
+        self.state = "i kø"
+        self.progress = None
+        self.submitted = time.monotonic()
+        self.started = None
+        self.finished = None
+        self.result = None
+        self.error = None
+        self.future = None
+        self.done = threading.Event()
+
+
+class JobQueue:
+    """
+    Kø av jobber worker(args) i inntil max_workers prosesser om gangen.
+    worker må ligge på modulnivå og kan kalle report_progress(verdi).
+    """
+
+    def __init__(self, worker, max_workers=None, max_jobs=MAX_JOBS):
+        self.worker = worker
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.max_jobs = max_jobs
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+        self._pool = None
+        self._progress = None
+
+    def _start_pool(self):
+        if self._progress is None:
+            self._progress = multiprocessing.get_context().Queue()
+            threading.Thread(target=self._read_progress, daemon=True).start()
+        self._pool = ProcessPoolExecutor(
+            max_workers=self.max_workers, initializer=_init_worker, initargs=(self._progress,),
+        )
+
+    def _read_progress(self):
+        while True:
+            (job_id, attempt), kind, value = self._progress.get()
+            with self._lock:
+                job = self._jobs.get(job_id)
+                # Meldinger fra en stoppet arbeider (tidligere forsøk) ignoreres
+                if job is None or job.state not in ACTIVE or job.attempt != attempt:
+                    continue
+                if kind == "start":
+                    job.state, job.started = "kjører", time.monotonic()
+                else:
+                    job.progress = value
+
+    def _prune(self):
+        finished = [job_id for job_id, job in self._jobs.items() if job.state not in ACTIVE]
+        for job_id in finished[:max(0, len(self._jobs) - self.max_jobs)]:
+            del self._jobs[job_id]
+
+    def submit(self, job_id, args, on_done=None, retry=False, **meta):
+        """
+        Legg worker(args) i køen under job_id og returner ID-en. Finnes jobben
+        allerede, gjenbrukes den; med retry=True startes feilede og avbrutte
+        jobber på nytt. on_done(svar) kjøres i serverprosessen før jobben meldes
+        ferdig (f.eks. for å legge resultatet i en cache). meta lagres med jobben.
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None and (job.state in ACTIVE or job.state == "ferdig" or not retry):
+                self._jobs.move_to_end(job_id)
+                return job_id
+
+            job = Job(job_id, meta)
+            job.args, job.on_done = args, on_done
+            self._jobs[job_id] = job
+            self._prune()
+            if self._pool is None:
+                self._start_pool()
+            try:
+                future = self._dispatch(job)
+            except BrokenProcessPool:
+                # En arbeider døde (f.eks. tom for minne): ny pool for nye jobber
+                self._start_pool()
+                future = self._dispatch(job)
+
+        future.add_done_callback(lambda done: self._finish(job, done))
+        return job_id
+
+    def _dispatch(self, job):
+        """Send jobben til poolen (krever self._lock)."""
+        job.attempt += 1
+        job.future = self._pool.submit(_run, self.worker, (job.id, job.attempt), job.args)
+        return job.future
+
+    def _finish(self, job, future):
+        with self._lock:
+            # Svar fra en stoppet pool: jobben er avbrutt eller sendt på nytt
+            if future is not job.future:
+                return
+        state, result, error = "ferdig", None, None
+        try:
+            result = future.result()
+            if job.on_done is not None:
+                job.on_done(result)
+        except CancelledError:
+            state = "avbrutt"
+        except Exception as e:
+            state, error = "feil", e
+        with self._lock:
+            job.state, job.result, job.error = state, result, error
+            job.finished = time.monotonic()
+        job.done.set()
+
+    def status(self, job_id):
+        """
+        Status for jobben som dict, eller None om ID-en er ukjent:
+        tilstand ("i kø", "kjører", "ferdig", "feil" eller "avbrutt"), plass i
+        køen, siste fremdrift, ventetid og kjøretid (sekunder), feil og meta.
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            now = time.monotonic()
+            queued = [other for other in self._jobs.values() if other.state == "i kø"]
+            return {
+                "tilstand": job.state,
+                "plass": queued.index(job) + 1 if job.state == "i kø" else None,
+                "fremdrift": job.progress,
+                "ventetid": (job.started or job.finished or now) - job.submitted,
+                "kjøretid": (job.finished or now) - job.started if job.started else 0.0,
+                "feil": job.error,
+                **job.meta,
+            }
+
+    def result(self, job_id):
+        """Svaret fra en ferdig jobb (None ellers)."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return job.result if job is not None else None
+
+    def wait(self, job_ids, timeout=None):
+        """Vent til jobbene er ferdige (eller feilet) eller timeout sekunder har gått."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for job_id in job_ids:
+            with self._lock:
+                job = self._jobs.get(job_id)
+            if job is None:
+                continue
+            remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+            if not job.done.wait(remaining):
+                return False
+        return True
+
+    def cancel(self, job_id):
+        """
+        Avbryt jobben. Står den i kø, fjernes den bare. Kjører den (eller er den
+        sendt til en arbeider), stoppes arbeiderne og en ny pool startes; de andre
+        aktive jobbene legges i den nye poolen og starter på nytt.
+        Returnerer True om jobben ble avbrutt.
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job.state not in ACTIVE:
+                return False
+            future = job.future
+        # Utenfor låsen: cancel() kjører _finish, som markerer jobben som avbrutt
+        if future.cancel():
+            return True
+
+        with self._lock:
+            if job.future is not future or job.state not in ACTIVE:
+                return False  # ble ferdig eller avbrutt i mellomtiden
+            job.state, job.future, job.finished = "avbrutt", None, time.monotonic()
+            old = self._pool
+            self._start_pool()
+            requeued = []
+            for other in self._jobs.values():
+                if other.state in ACTIVE:
+                    other.state, other.started, other.progress = "i kø", None, None
+                    requeued.append((other, self._dispatch(other)))
+        job.done.set()
+        terminate_pool(old)
+        for other, future in requeued:
+            future.add_done_callback(lambda done, other=other: self._finish(other, done))
+        return True
+
+    def counts(self):
+        """Antall jobber per tilstand."""
+        with self._lock:
+            out = {}
+            for job in self._jobs.values():
+                out[job.state] = out.get(job.state, 0) + 1
+            return out
@@ -8,30 +8,38 @@ from datetime import date
 # ---------------------------------------------------------
 # ERA5 weather 
 # ---------------------------------------------------------
-def load_era5_raw(latitude, longitude, year):
-    try:
-        start_date = f"{year}-01-01"
-        end_date = f"{year}-12-31"
-
-        url = (
-            "https://archive-api.open-meteo.com/v1/era5?"
-            f"latitude={latitude}&longitude={longitude}&"
-            f"start_date={start_date}&end_date={end_date}&"
-            "hourly=temperature_2m,precipitation,wind_speed_10m,"
-            "wind_gusts_10m,wind_direction_10m&timezone=auto"
-        )
-
-        response = requests.get(url, timeout=10)
-        response.raise_for_status()
-        data = response.json()
-
-        if "hourly" not in data:
-            st.error("ERA5 API returned no hourly data.")
-            return pd.DataFrame()
+def fetch_era5(latitude, longitude, year, timezone="auto"):
+    """
+    Som load_era5_raw, men en feilet nedlasting kaster unntaket videre.
+    Brukes i cachede funksjoner, så en midlertidig feil ikke caches som «ingen data».
+    """
+    start_date = f"{year}-01-01"
+    end_date = f"{year}-12-31"
+
+    url = (
+        "https://archive-api.open-meteo.com/v1/era5?"
+        f"latitude={latitude}&longitude={longitude}&"
+        f"start_date={start_date}&end_date={end_date}&"
+        "hourly=temperature_2m,precipitation,wind_speed_10m,"
+        f"wind_gusts_10m,wind_direction_10m&timezone={timezone}"
+    )
 
-        df = pd.DataFrame(data["hourly"])
-        df["time"] = pd.to_datetime(df["time"], errors="coerce")
-        return df
+    response = requests.get(url, timeout=10)
+    response.raise_for_status()
+    data = response.json()
+
+    if "hourly" not in data:
+        raise ValueError("ERA5 API returned no hourly data.")
+
+    df = pd.DataFrame(data["hourly"])
+    df["time"] = pd.to_datetime(df["time"], errors="coerce")
+    return df
+
+
+def load_era5_raw(latitude, longitude, year, timezone="auto"):
+    """timezone="auto" gir lokal tid (som før); "GMT" gir UTC uten sommertidshopp."""
+    try:
+        return fetch_era5(latitude, longitude, year, timezone)
 
     except Exception as e:
         st.error(f"Failed to load ERA5 data: {e}")
@@ -0,0 +1,105 @@
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from functions.load_data import load_elhub_data
+
+
+# ---------------------------------------------------------
+# Timeserier for alle (prisområde, kilde) – bygget én gang per datalast
+# ---------------------------------------------------------
+# prepare_series kopierer, parser, sorterer og resampler hele Elhub-tabellen
+# for hvert kall. Her grupperes tabellen én gang til timesummer for alle
+# (område, kilde) og for begge kilder samlet. Resultatet er identisk med
+# prepare_series. Seriene deles ut som visninger; med copy-on-write i pandas
+# kan mottakeren ikke endre lagret data.
+
+class SeriesStore:
+    def __init__(self, df: pd.DataFrame):
+        t = pd.to_datetime(df["start_time"], errors="coerce")
+        ok = (t.notna() & df["quantity_kwh"].notna()).to_numpy()
+        hours = t[ok].dt.floor("h")
+        qty = df["quantity_kwh"][ok]
+        area = df["price_area"][ok]
+        source = df["source"][ok] if "source" in df.columns else pd.Series("all", index=qty.index)
+
+        by_source = qty.groupby([area, source, hours], observed=True, sort=True).sum()
+        by_area = qty.groupby([area, hours], observed=True, sort=True).sum()
+
+        self._series = {}
+        for (a, s), part in by_source.groupby(level=[0, 1], observed=True):
+            self._series[(a, s)] = self._hourly(part.droplevel([0, 1]))
+        for a, part in by_area.groupby(level=0, observed=True):
+            self._series[(a, None)] = self._hourly(part.droplevel(0))
+
+        self.areas = sorted({a for a, _ in self._series})
+        self.rows = int(ok.sum())
+        self._common = {}
+
+    @staticmethod
+    def _hourly(part):
+        # Som resample("h").sum(): timer uten data mellom første og siste time blir 0
+        index = pd.date_range(part.index[0], part.index[-1], freq="h", name="start_time")
+        series = part.reindex(index, fill_value=0.0).astype(float)
+        series.name = "quantity_kwh"
+        return series
+
+    def series(self, price_area, source=None) -> pd.Series:
+        """Timeserie (kWh) som prepare_series(df, price_area, source)."""
+        series = self._series.get((price_area, source))
+        if series is None:
+            return pd.Series(dtype=float, name="quantity_kwh")
+        return series[:]
+
+    def common_index(self, price_area):
+        """Timer der både produksjon og forbruk finnes (for nettolast)."""
+        if price_area not in self._common:
+            prod, cons = self.series(price_area, "production"), self.series(price_area, "consumption")
+            self._common[price_area] = prod.index.intersection(cons.index)
+        return self._common[price_area]
+
+    @property
+    def empty(self):
+        return not self._series
+
+
+@st.cache_resource(ttl=600, show_spinner="Bygger timeserier for alle prisområder ...")
+def elhub_series_store():
+    """SeriesStore for Elhub-dataene; bygges på nytt når load_elhub_data gjør det (ttl)."""
+    return SeriesStore(load_elhub_data())
+
+
+if __name__ == "__main__":
+    # Benchmark mot prepare_series: python -m functions.series_store
+    import time
+
+    from functions.forecasting import prepare_series
+
+    rng = np.random.default_rng(0)
+    hours = pd.date_range("2021-01-01", "2024-12-31 23:00", freq="h", tz="UTC")
+    parts = []
+    for area in ["NO1", "NO2", "NO3", "NO4", "NO5"]:
+        for source, groups in [("production", ["hydro", "wind", "solar", "thermal"]),
+                               ("consumption", ["household", "cabin", "primary", "secondary", "tertiary"])]:
+            for group in groups:
+                parts.append(pd.DataFrame({
+                    "start_time": hours, "price_area": area, "source": source, "energy_group": group,
+                    "quantity_kwh": rng.gamma(2.0, 5e4, len(hours)),
+                }))
+    df = pd.concat(parts, ignore_index=True).sample(frac=1.0, random_state=0)
+    print(f"{len(df):,} rader")
+
+    t0 = time.perf_counter()
+    ref = [prepare_series(df, "NO1", None), prepare_series(df, "NO1", "production"),
+           prepare_series(df, "NO1", "consumption")]
+    t1 = time.perf_counter()
+    store = SeriesStore(df)
+    t2 = time.perf_counter()
+    got = [store.series("NO1", None), store.series("NO1", "production"), store.series("NO1", "consumption")]
+    store.common_index("NO1")
+    t3 = time.perf_counter()
+    same = all(a.index.equals(b.index) and np.allclose(a.to_numpy(), b.to_numpy()) for a, b in zip(ref, got))
+    print(
+        f"«Begge» (3 serier): prepare_series {t1 - t0:.2f} s, bygg lager {t2 - t1:.2f} s "
+        f"(alle {len(store.areas)} områder), oppslag {1000 * (t3 - t2):.2f} ms, identisk {same}"
+    )
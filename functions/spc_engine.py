@@ -0,0 +1,88 @@
+import numpy as np
+import streamlit as st
+from scipy.fft import dct, idct
+
+from functions.rolling_stats import rolling_median_mad
+
+
+# ---------------------------------------------------------
+# DCT-basert SPC: koeffisienter caches per serie
+# ---------------------------------------------------------
+# Bare k_cut (fra trend-cutoff) påvirker invers-transformen, og k σ flytter
+# bare grensene. Derfor caches DCT-koeffisientene per serie, SATV + median/MAD
+# per cutoff, og grensene regnes ut på nytt for hver k σ.
+
+def hourly_values(df, verdi_kolonne="temperature_2m", tids_kolonne="time"):
+    """Timesserie uten hull (samme forbehandling som SPC-analysen på page_6)."""
+    s = (
+        df.set_index(tids_kolonne)
+        .sort_index()[verdi_kolonne]
+        .asfreq("1h")
+        .interpolate("time")
+    )
+    return s.to_numpy()
+
+
+def k_cut_for(N, cutoff_dager):
+    """Antall lavfrekvente DCT-koeffisienter som fjernes for en gitt trend-cutoff."""
+    T_timer = cutoff_dager * 24
+    return max(int(np.floor(2 * N / T_timer)), 1)
+
+
+@st.cache_data(show_spinner=False)
+def dct_coefficients(x):
+    return dct(np.asarray(x, dtype=float), type=2, norm="ortho")
+
+
+def satv_batch(c, k_cuts):
+    """SATV for flere cutoffs i én batchet invers-DCT. Returnerer matrise (len(k_cuts), N)."""
+    k_cuts = np.asarray(k_cuts)
+    keep = np.arange(len(c))[None, :] >= k_cuts[:, None]
+    return idct(np.where(keep, c[None, :], 0.0), type=2, norm="ortho", axis=-1)
+
+
+def robust_center_scale(satv):
+    """Median og robust sigma (1.4826 × MAD, std som reserve)."""
+    median = np.median(satv, axis=-1)
+    mad = np.median(np.abs(satv - np.expand_dims(median, -1)), axis=-1)
+    sigma = np.where(mad > 0, 1.4826 * mad, np.std(satv, axis=-1))
+    return median, sigma
+
+
+@st.cache_data(show_spinner=False)
+def cutoff_table(x, cutoffs_dager):
+    """
+    SATV, median og sigma for alle cutoffs i ett kall (én batchet invers-DCT).
+    Returnerer {cutoff_dager: (satv, median, sigma)}.
+    """
+    c = dct_coefficients(x)
+    k_cuts = [k_cut_for(len(c), cd) for cd in cutoffs_dager]
+    satv = satv_batch(c, k_cuts)
+    median, sigma = robust_center_scale(satv)
+    return {
+        cd: (satv[i], float(median[i]), float(sigma[i]))
+        for i, cd in enumerate(cutoffs_dager)
+    }
+
+
+@st.cache_data(show_spinner="Beregner rullerende median/MAD ...")
+def rolling_center_scale(satv, window_timer):
+    """
+    Rullerende median og robust sigma over et sentrert vindu på window_timer timer,
+    slik at grensene følger årstidene. Der MAD er 0 brukes std for hele serien.
+    """
+    median, mad = rolling_median_mad(satv, window_timer, center=True)
+    sigma = np.where(mad > 0, 1.4826 * mad, np.std(satv))
+    return median, sigma
+
+
+def spc_limits(median, sigma, k_sigma):
+    return median - k_sigma * sigma, median + k_sigma * sigma
+
+
+def spc_z(x, cutoff_dager=90):
+    """Robust z-score |SATV − median| / sigma for én cutoff (brukes av batchjobben)."""
+    c = dct(np.asarray(x, dtype=float), type=2, norm="ortho")
+    satv = satv_batch(c, [k_cut_for(len(c), cutoff_dager)])[0]
+    median, sigma = robust_center_scale(satv)
+    return np.abs(satv - median) / (sigma if sigma > 0 else 1.0)
@@ -0,0 +1,126 @@
+import hashlib
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+from numpy.lib.stride_tricks import sliding_window_view
+from scipy import fft, signal
+
+
+# ---------------------------------------------------------
+# Slider-gitteret på page_3
+# ---------------------------------------------------------
+WINDOW_GRID = list(range(64, 513, 32))
+OVERLAP_GRID = list(range(32, 257, 32))
+
+# Maks antall tidskolonner i heatmapen (flere enn dette vises ikke på skjermen)
+MAX_TIME_BINS = 2000
+
+
+def effective_overlap(window_length, overlap):
+    return min(overlap, window_length - 1)
+
+
+def grid_settings():
+    """Unike (vindu, effektivt overlapp) i slider-gitteret."""
+    return sorted({(w, effective_overlap(w, o)) for w in WINDOW_GRID for o in OVERLAP_GRID})
+
+
+# ---------------------------------------------------------
+# Timeserier for alle produksjonsgrupper i ett område
+# ---------------------------------------------------------
+def frame_version(df):
+    """Billig dataversjon for Elhub API-data (brukes som cache-nøkkel i stedet for hele df)."""
+    h = hashlib.sha1(pd.util.hash_pandas_object(df[["startTime", "quantityKwh"]], index=False).to_numpy())
+    return h.hexdigest()[:16]
+
+
+@st.cache_data(show_spinner=False)
+def area_matrix(_df, price_area, version):
+    """Timesoppløst DataFrame (tid × produksjonsgruppe) for ett prisområde."""
+    dff = _df[_df["priceArea"].str.upper() == price_area.upper()].copy()
+    dff["startTime"] = pd.to_datetime(dff["startTime"], utc=True, errors="coerce").dt.tz_convert(None)
+    dff = dff.dropna(subset=["startTime"])
+    dff["productionGroup"] = dff["productionGroup"].str.lower()
+
+    wide = dff.pivot_table(
+        index="startTime", columns="productionGroup", values="quantityKwh", aggfunc="mean"
+    )
+    # Hull inni serien interpoleres som før; manglende ender settes til 0
+    return wide.resample("h").mean().interpolate(limit_area="inside").fillna(0.0)
+
+
+# ---------------------------------------------------------
+# Vektorisert STFT (samme skalering som signal.spectrogram)
+# ---------------------------------------------------------
+def stft_power_db(values, window_length, noverlap, max_time_bins=MAX_TIME_BINS, fs=1.0):
+    """
+    Effektspektrogram i dB for alle rader i values (grupper × tid) i ett kall.
+    Tilsvarer signal.spectrogram(detrend="linear", scaling="spectrum", window="hann"),
+    men bare hvert n-te segment beregnes når det ellers blir flere enn max_time_bins.
+    Returnerer (f, t, Sxx_db float32 med form grupper × frekvens × tid).
+    """
+    values = np.atleast_2d(np.asarray(values, dtype=float))
+    hop = window_length - noverlap
+    n_seg = (values.shape[-1] - window_length) // hop + 1
+    stride = max(1, int(np.ceil(n_seg / max_time_bins)))
+
+    frames = sliding_window_view(values, window_length, axis=-1)[:, ::hop * stride]
+    frames = signal.detrend(frames, axis=-1, type="linear")
+
+    win = signal.get_window("hann", window_length)
+    spec = fft.rfft(frames * win, axis=-1, workers=-1)
+
+    power = (spec.real ** 2 + spec.imag ** 2) / win.sum() ** 2
+    if window_length % 2:
+        power[..., 1:] *= 2
+    else:
+        power[..., 1:-1] *= 2
+
+    f = fft.rfftfreq(window_length, d=1.0 / fs)
+    t = (np.arange(frames.shape[1]) * hop * stride + window_length / 2) / fs
+    Sxx_db = (10 * np.log10(power + 1e-12)).astype(np.float32)
+    return f, t, np.swapaxes(Sxx_db, 1, 2)
+
+
+@st.cache_data(show_spinner="Beregner spektrogram ...", max_entries=5 * len(grid_settings()))  # fem prisområder
+def area_spectrogram(_df, price_area, version, window_length, noverlap):
+    """Spektrogram for alle produksjonsgrupper i området ved gitt vindu/overlapp."""
+    wide = area_matrix(_df, price_area, version)
+    if len(wide) < max(32, window_length):
+        return None
+
+    f, t_rel, Sxx_db = stft_power_db(wide.to_numpy().T, window_length, noverlap)
+    t_abs = wide.index[0] + pd.to_timedelta(t_rel, unit="h")
+    return {
+        "groups": list(wide.columns),
+        "f_per_day": (f * 24.0).astype(np.float32),
+        "time": t_abs,
+        "Sxx_db": Sxx_db,
+    }
+
+
+def precompute_grid(df, price_area, version):
+    """Varm opp cachen for hele slider-gitteret (alle grupper per kall)."""
+    for window_length, noverlap in grid_settings():
+        area_spectrogram(df, price_area, version, window_length, noverlap)
+
+
+def group_spectrogram(df, price_area, version, production_group, window_length, overlap,
+                      max_freq_per_day=None):
+    """
+    Slå opp spektrogrammet for én gruppe og beskjær frekvensaksen til det som vises.
+    Returnerer (f_per_day, tid, Sxx_db) eller None hvis serien er for kort.
+    """
+    cube = area_spectrogram(df, price_area, version, window_length, effective_overlap(window_length, overlap))
+    group = production_group.lower()
+    if cube is None or group not in cube["groups"]:
+        return None
+
+    f_per_day = cube["f_per_day"]
+    Sxx_db = cube["Sxx_db"][cube["groups"].index(group)]
+    if max_freq_per_day is not None:
+        keep = f_per_day <= max_freq_per_day
+        f_per_day, Sxx_db = f_per_day[keep], Sxx_db[keep]
+
+    return f_per_day, cube["time"], Sxx_db
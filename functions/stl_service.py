@@ -0,0 +1,135 @@
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from statsmodels.tsa.seasonal import STL
+
+from functions.cache_files import data_version, save_npz
+
+
+# ---------------------------------------------------------
+# Diskcache for STL-komponenter
+# ---------------------------------------------------------
+CACHE_DIR = Path(__file__).resolve().parent.parent / ".cache" / "stl"
+
+COMPONENTS = ["Trend", "Seasonal", "Residual"]
+
+
+def hourly_series(df, price_area, production_group):
+    """Timeserie (kWh) for ett prisområde og én produksjonsgruppe fra Elhub API-data."""
+    df_filtered = df[
+        (df["priceArea"].str.upper() == price_area.upper()) &
+        (df["productionGroup"].str.lower() == production_group.lower())
+    ].copy()
+
+    if df_filtered.empty:
+        return pd.Series(dtype=float)
+
+    df_filtered["startTime"] = pd.to_datetime(df_filtered["startTime"], utc=True, errors="coerce").dt.tz_convert(None)
+    df_filtered = df_filtered.dropna(subset=["startTime"]).sort_values("startTime").set_index("startTime")
+
+    return df_filtered["quantityKwh"].resample("h").mean().interpolate()
+
+
+def cache_key(price_area, production_group, period, seasonal, trend, robust, version):
+    return (
+        f"{price_area.upper()}_{production_group.lower()}_"
+        f"p{period}_s{seasonal}_t{trend}_r{int(bool(robust))}_{version}"
+    )
+
+
+def _cache_path(key):
+    return CACHE_DIR / f"{key}.npz"
+
+
+def _load(key):
+    path = _cache_path(key)
+    if not path.exists():
+        return None
+    with np.load(path) as data:
+        return {name: data[name] for name in COMPONENTS}
+
+
+def _store(key, result):
+    save_npz(_cache_path(key), **{name: np.asarray(result[name], dtype=float) for name in COMPONENTS})
+
+
+def _fit(values, period, seasonal, trend, robust):
+    fit = STL(values, period=period, seasonal=seasonal, trend=trend, robust=robust).fit()
+    return {"Trend": fit.trend, "Seasonal": fit.seasonal, "Residual": fit.resid}
+
+
+def _fit_and_store(args):
+    """Arbeidsfunksjon for prosesspoolen (må ligge på modulnivå)."""
+    key, values, period, seasonal, trend, robust = args
+    if _cache_path(key).exists():
+        return key
+    _store(key, _fit(values, period, seasonal, trend, robust))
+    return key
+
+
+def _components_frame(ts, result):
+    return pd.DataFrame({
+        "time": ts.index,
+        "Original": ts.to_numpy(),
+        "Trend": np.asarray(result["Trend"]),
+        "Seasonal": np.asarray(result["Seasonal"]),
+        "Residual": np.asarray(result["Residual"]),
+    })
+
+
+# ---------------------------------------------------------
+# Enkeltserie: slå opp i cache, ellers tilpass og lagre
+# ---------------------------------------------------------
+def decompose(ts, price_area, production_group, period=24, seasonal=13, trend=31, robust=True):
+    """STL-komponenter som DataFrame (time, Original, Trend, Seasonal, Residual)."""
+    key = cache_key(price_area, production_group, period, seasonal, trend, robust, data_version(ts))
+
+    result = _load(key)
+    if result is None:
+        result = _fit(ts.to_numpy(), period, seasonal, trend, robust)
+        _store(key, result)
+
+    return _components_frame(ts, result)
+
+
+# ---------------------------------------------------------
+# Batch: alle (prisområde × produksjonsgruppe) parallelt
+# ---------------------------------------------------------
+def batch_decompose(frames, period=24, seasonal=13, trend=31, robust=True, max_workers=None):
+    """
+    Dekomponer alle produksjonsgrupper for alle prisområder i en prosesspool
+    og skriv komponentene til diskcachen.
+    frames: {prisområde: Elhub API-DataFrame}. Returnerer listen av cache-nøkler.
+    """
+    jobs = []
+    for price_area, df in frames.items():
+        if df.empty:
+            continue
+        for group in sorted(df["productionGroup"].dropna().unique()):
+            ts = hourly_series(df, price_area, group)
+            if len(ts) < 2 * period:
+                continue
+            key = cache_key(price_area, group, period, seasonal, trend, robust, data_version(ts))
+            if not _cache_path(key).exists():
+                jobs.append((key, ts.to_numpy(), period, seasonal, trend, robust))
+
+    if not jobs:
+        return []
+
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        return list(pool.map(_fit_and_store, jobs))
+
+
+if __name__ == "__main__":
+    # Forhåndsberegn STL for alle prisområder: python -m functions.stl_service
+    import time
+    from functions.load_data import hent_elhub_data
+
+    t0 = time.perf_counter()
+    frames = {area: hent_elhub_data(area) for area in ["NO1", "NO2", "NO3", "NO4", "NO5"]}
+    t1 = time.perf_counter()
+    keys = batch_decompose(frames)
+    t2 = time.perf_counter()
+    print(f"Hentet data på {t1 - t0:.1f} s, dekomponerte {len(keys)} serier på {t2 - t1:.1f} s")
@@ -0,0 +1,146 @@
+import pandas as pd
+import streamlit as st
+
+
+# ---------------------------------------------------------
+# Oppløsninger for progressiv forfining (fra fin til grov)
+# ---------------------------------------------------------
+RESOLUTIONS = [
+    ("h", 1),
+    ("3h", 3),
+    ("6h", 6),
+    ("12h", 12),
+    ("D", 24),
+    ("W", 24 * 7),
+]
+
+# Maks antall punkter per serie som sendes til nettleseren
+MAX_POINTS = 1500
+
+
+def choose_resolution(start, end, max_points=MAX_POINTS):
+    """Velg den fineste oppløsningen som holder antall punkter under max_points."""
+    span_hours = (end - start) / pd.Timedelta(hours=1)
+    for freq, hours in RESOLUTIONS:
+        if span_hours / hours <= max_points:
+            return freq
+    return RESOLUTIONS[-1][0]
+
+
+def _selection_window(chart_key):
+    """Les x-intervallet fra siste box-utvalg i grafen (eller None)."""
+    sel_state = st.session_state.get(chart_key)
+    if not sel_state or "selection" not in sel_state:
+        return None
+
+    boxes = sel_state["selection"].get("box", [])
+    if not boxes or len(boxes[0].get("x", [])) < 2:
+        return None
+
+    x0, x1 = pd.to_datetime(boxes[0]["x"][:2])
+    return (min(x0, x1), max(x0, x1))
+
+
+def zoom_window(chart_key):
+    """
+    Returnerer zoomvinduet (start, slutt) for grafen, eller None for hele perioden.
+    Et nytt box-utvalg erstatter vinduet; samme utvalg brukes bare én gang,
+    slik at "Vis hele perioden" ikke overstyres av et gammelt utvalg.
+    """
+    window_key = f"{chart_key}_window"
+    seen_key = f"{chart_key}_seen"
+
+    selected = _selection_window(chart_key)
+    if selected is not None and selected != st.session_state.get(seen_key):
+        st.session_state[seen_key] = selected
+        st.session_state[window_key] = selected
+
+    return st.session_state.get(window_key)
+
+
+def reset_zoom(chart_key):
+    st.session_state.pop(f"{chart_key}_window", None)
+
+
+def refine(df, time_col, value_cols, window=None, group_col=None,
+           agg="mean", max_points=MAX_POINTS):
+    """
+    Klipp df til zoomvinduet og aggreger til en oppløsning som passer skjermen.
+    Returnerer (aggregert DataFrame, valgt frekvens).
+    """
+    if isinstance(value_cols, str):
+        value_cols = [value_cols]
+
+    times = df[time_col]
+    if window is not None:
+        start, end = window
+        tz = getattr(times.dt, "tz", None)
+        if tz is not None:
+            start = start.tz_localize(tz) if start.tzinfo is None else start.tz_convert(tz)
+            end = end.tz_localize(tz) if end.tzinfo is None else end.tz_convert(tz)
+        df = df[(times >= start) & (times <= end)]
+
+    if df.empty:
+        return df, RESOLUTIONS[0][0]
+
+    freq = choose_resolution(df[time_col].min(), df[time_col].max(), max_points)
+
+    if group_col is None:
+        out = (
+            df.set_index(time_col)[value_cols]
+            .resample(freq)
+            .agg(agg)
+            .reset_index()
+        )
+    else:
+        out = (
+            df.groupby([group_col, pd.Grouper(key=time_col, freq=freq)])[value_cols]
+            .agg(agg)
+            .reset_index()
+        )
+    return out, freq
+
+
+# ---------------------------------------------------------
+# Zoombar graf (fragment: zoom kjører kun grafen på nytt)
+# ---------------------------------------------------------
+@st.fragment
+def zoomable_chart(chart_key, df, time_col, value_cols, build_figure,
+                   group_col=None, agg="mean", max_points=MAX_POINTS):
+    """
+    Tegn en tidsseriegraf som starter grovt og henter finere oppløsning
+    for det utsnittet brukeren markerer (box select).
+    build_figure(df_refined) må returnere en plotly-figur.
+    """
+    window = zoom_window(chart_key)
+    df_view, freq = refine(df, time_col, value_cols, window, group_col, agg, max_points)
+
+    if df_view.empty:
+        st.info("Ingen data i valgt utsnitt.")
+        reset_zoom(chart_key)
+        return
+
+    fig = build_figure(df_view)
+    fig.update_layout(dragmode="select")
+    st.plotly_chart(
+        fig,
+        key=chart_key,
+        on_select="rerun",
+        selection_mode="box",
+        use_container_width=True,
+    )
+
+    col_info, col_reset = st.columns([4, 1])
+    with col_info:
+        st.caption(
+            f"Oppløsning: **{freq}** – marker et tidsrom i grafen for å zoome inn "
+            "med finere oppløsning."
+        )
+    with col_reset:
+        if window is not None:
+            st.button(
+                "Vis hele perioden",
+                key=f"{chart_key}_reset",
+                on_click=reset_zoom,
+                args=(chart_key,),
+            )
@@ -2,6 +2,7 @@ import streamlit as st
 import pandas as pd
 import plotly.express as px
 from functions.load_data import load_elhub_data
+from functions.zoom import zoomable_chart
 
 
 def show():
@@ -81,16 +82,24 @@ def show():
     df_plot = df_area[df_area["production_group"].isin(selected_groups)]
     df_plot = df_plot.sort_values("start_time")
 
-    fig_line = px.line(
+    def build_line(df_view):
+        return px.line(
+            df_view,
+            x="start_time",
+            y="quantity_kwh",
+            color="production_group",
+            labels={
+                "start_time": "Tid",
+                "quantity_kwh": "Produksjon (kWh)",
+            },
+            title=f"Produksjon i {selected_area}, {year_selected}",
+        )
+
+    zoomable_chart(
+        f"page2_line_{selected_area}_{year_selected}",
         df_plot,
-        x="start_time",
-        y="quantity_kwh",
-        color="production_group",
-        labels={
-            "start_time": "Tid",
-            "quantity_kwh": "Produksjon (kWh)",
-        },
-        title=f"Produksjon i {selected_area}, {year_selected}",
+        time_col="start_time",
+        value_cols="quantity_kwh",
+        build_figure=build_line,
+        group_col="production_group",
     )
-
-    st.plotly_chart(fig_line, use_container_width=True)
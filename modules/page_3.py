@@ -2,41 +2,37 @@ import streamlit as st
 import pandas as pd
 import requests
 from datetime import date
-from statsmodels.tsa.seasonal import STL
 import plotly.graph_objects as go
-from scipy import signal
 import numpy as np
+from functions import spectrogram_engine, stl_service
 from functions.load_data import hent_elhub_data
+from functions.zoom import zoomable_chart
 
 # ------------------------------------------------------------
 # 2. STL-dekomponering
 # ------------------------------------------------------------
-def stl_decomposition_plot(df, price_area, production_group, period=24, seasonal=13, trend=31, robust=True):
+@st.cache_data(show_spinner="Beregner STL-dekomponering ...")
+def stl_decomposition(df, price_area, production_group, period=24, seasonal=13, trend=31, robust=True):
+    """STL-komponenter som DataFrame med kolonnene time, Original, Trend, Seasonal, Residual."""
     required_cols = {"priceArea", "productionGroup", "quantityKwh", "startTime"}
     if not required_cols.issubset(df.columns):
         raise ValueError(f"Mangler kolonner: {required_cols - set(df.columns)}")
 
-    df_filtered = df[
-        (df["priceArea"].str.upper() == price_area.upper()) &
-        (df["productionGroup"].str.lower() == production_group.lower())
-    ].copy()
-
-    if df_filtered.empty:
+    ts = stl_service.hourly_series(df, price_area, production_group)
+    if ts.empty:
         st.warning(f"Ingen data funnet for {price_area} / {production_group}")
         return None
 
-    df_filtered["startTime"] = pd.to_datetime(df_filtered["startTime"], utc=True, errors="coerce").dt.tz_convert(None)
-    df_filtered = df_filtered.dropna(subset=["startTime"]).sort_values("startTime").set_index("startTime")
+    # Slås opp i diskcachen (area, gruppe, parametere, dataversjon) før ny tilpasning
+    return stl_service.decompose(ts, price_area, production_group, period, seasonal, trend, robust)
 
-    ts = df_filtered["quantityKwh"].resample("h").mean().interpolate()
-    stl = STL(ts, period=period, seasonal=seasonal, trend=trend, robust=robust)
-    result = stl.fit()
 
+def stl_figure(components, price_area, production_group):
     fig = go.Figure()
-    fig.add_trace(go.Scatter(x=ts.index, y=ts, name="Original", line=dict(color="blue")))
-    fig.add_trace(go.Scatter(x=ts.index, y=result.trend, name="Trend", line=dict(color="red")))
-    fig.add_trace(go.Scatter(x=ts.index, y=result.seasonal, name="Seasonal", line=dict(color="orange")))
-    fig.add_trace(go.Scatter(x=ts.index, y=result.resid, name="Residual", line=dict(color="green")))
+    fig.add_trace(go.Scatter(x=components["time"], y=components["Original"], name="Original", line=dict(color="blue")))
+    fig.add_trace(go.Scatter(x=components["time"], y=components["Trend"], name="Trend", line=dict(color="red")))
+    fig.add_trace(go.Scatter(x=components["time"], y=components["Seasonal"], name="Seasonal", line=dict(color="orange")))
+    fig.add_trace(go.Scatter(x=components["time"], y=components["Residual"], name="Residual", line=dict(color="green")))
 
     fig.update_layout(
         title=f"STL-dekomponering for {production_group.upper()} i {price_area} (2021)",
@@ -48,44 +44,30 @@ def stl_decomposition_plot(df, price_area, production_group, period=24, seasonal
     return fig
 
 
-# ------------------------------------------------------------
-# 3. Spektrogram
-# ------------------------------------------------------------
-def spectrogram_plot(df, price_area, production_group, window_length=256, overlap=128):
-    dff = df[
-        (df["priceArea"].str.upper() == price_area.upper()) &
-        (df["productionGroup"].str.lower() == production_group.lower())
-    ].copy()
-
-    if dff.empty:
-        st.warning(f"Ingen data for {price_area}/{production_group}")
+def stl_decomposition_plot(df, price_area, production_group, period=24, seasonal=13, trend=31, robust=True):
+    components = stl_decomposition(df, price_area, production_group, period, seasonal, trend, robust)
+    if components is None:
         return None
+    return stl_figure(components, price_area, production_group)
 
-    dff["startTime"] = pd.to_datetime(dff["startTime"], utc=True, errors="coerce").dt.tz_convert(None)
-    dff = dff.dropna(subset=["startTime"]).sort_values("startTime").set_index("startTime")
-    ts = dff["quantityKwh"].resample("h").mean().interpolate()
 
-    if len(ts) < max(32, window_length):
-        st.warning(f"For kort serie ({len(ts)} punkter) for vindu {window_length}")
-        return None
-
-    overlap = min(overlap, window_length - 1)
-    fs = 1.0  # én måling per time
-
-    f, t_rel, Sxx = signal.spectrogram(
-        ts.values,
-        fs=fs,
-        nperseg=window_length,
-        noverlap=overlap,
-        detrend="linear",
-        scaling="spectrum",
-        window="hann",
+# ------------------------------------------------------------
+# 3. Spektrogram
+# ------------------------------------------------------------
+def spectrogram_plot(df, price_area, production_group, window_length=256, overlap=128,
+                     max_freq_per_day=None, version=None):
+    if version is None:
+        version = spectrogram_engine.frame_version(df)
+
+    # Forhåndsberegnet STFT for alle grupper i området (float32 dB)
+    spec = spectrogram_engine.group_spectrogram(
+        df, price_area, version, production_group, window_length, overlap, max_freq_per_day
     )
+    if spec is None:
+        st.warning(f"Ingen data eller for kort serie for {price_area}/{production_group} med vindu {window_length}")
+        return None
 
-    Sxx_db = 10 * np.log10(Sxx + 1e-12)
-    t0 = ts.index[0]
-    t_abs = t0 + pd.to_timedelta(t_rel, unit="h")
-    f_per_day = f * 24.0
+    f_per_day, t_abs, Sxx_db = spec
 
     fig = go.Figure(
         data=go.Heatmap(z=Sxx_db, x=t_abs, y=f_per_day, colorscale="Viridis", colorbar=dict(title="Power [dB]"))
@@ -100,7 +82,59 @@ def spectrogram_plot(df, price_area, production_group, window_length=256, overla
 
 
 # ------------------------------------------------------------
-# 4. Streamlit-side
+# 4. Analysepaneler (fragmenter: egne widgets kjører kun sitt panel)
+# ------------------------------------------------------------
+@st.fragment
+def stl_panel(df_all, selected_area, selected_group):
+    st.subheader("STL-dekomponering")
+    st.write(
+        """
+        **STL (Seasonal-Trend decomposition using Loess)** deler opp tidsserien i tre komponenter:
+        - **Trend:** Langsiktig utvikling  
+        - **Sesong:** Regelmessige mønstre  
+        - **Residual:** Støy og uregelmessige svingninger
+        """
+    )
+    if st.button("⚡ Forhåndsberegn STL for alle produksjonsgrupper"):
+        with st.spinner("Dekomponerer alle produksjonsgrupper parallelt ..."):
+            keys = stl_service.batch_decompose({selected_area: df_all})
+        st.success(f"Lagret {len(keys)} nye dekomponeringer i cachen.")
+
+    components = stl_decomposition(df_all, selected_area, selected_group)
+    if components is not None:
+        zoomable_chart(
+            f"page3_stl_{selected_area}_{selected_group}",
+            components,
+            time_col="time",
+            value_cols=["Original", "Trend", "Seasonal", "Residual"],
+            build_figure=lambda view: stl_figure(view, selected_area, selected_group),
+        )
+
+
+@st.fragment
+def spectrogram_panel(df_all, selected_area, selected_group):
+    st.subheader("Spektrogram")
+    window_length = st.slider("Velg vinduslengde (timer)", 64, 512, 256, step=32)
+    overlap = st.slider("Velg overlapp (timer)", 32, 256, 128, step=32)
+    max_freq = st.slider("Maks frekvens (sykluser/døgn)", 1.0, 12.0, 12.0, step=0.5)
+
+    # Hele slider-gitteret beregnes én gang per område og dataversjon
+    version = spectrogram_engine.frame_version(df_all)
+    grid_key = f"page3_spec_grid_{selected_area}_{version}"
+    if grid_key not in st.session_state:
+        with st.spinner("Forhåndsberegner spektrogrammer for alle vinduer ..."):
+            spectrogram_engine.precompute_grid(df_all, selected_area, version)
+        st.session_state[grid_key] = True
+
+    fig_spec = spectrogram_plot(
+        df_all, selected_area, selected_group, window_length, overlap, max_freq, version
+    )
+    if fig_spec:
+        st.plotly_chart(fig_spec, use_container_width=True)
+
+
+# ------------------------------------------------------------
+# 5. Streamlit-side
 # ------------------------------------------------------------
 def show():
     st.title("Analyse av produksjonsdata – STL og Spektrogram")
@@ -120,29 +154,15 @@ def show():
     production_groups = sorted(df_all["productionGroup"].dropna().unique())
     selected_group = st.selectbox("Velg produksjonsgruppe:", production_groups)
 
-    tabs = st.tabs(["📈 STL-analyse", "🌈 Spektrogram"])
+    # Late faner: kun den aktive fanen beregnes (resultatene caches)
+    tabs = st.tabs(["📈 STL-analyse", "🌈 Spektrogram"], key="page3_tabs", on_change="rerun")
 
     # --- Tab 1 ---
     with tabs[0]:
-        st.subheader("STL-dekomponering")
-        st.write(
-            """
-            **STL (Seasonal-Trend decomposition using Loess)** deler opp tidsserien i tre komponenter:
-            - **Trend:** Langsiktig utvikling  
-            - **Sesong:** Regelmessige mønstre  
-            - **Residual:** Støy og uregelmessige svingninger
-            """
-        )
-        fig_stl = stl_decomposition_plot(df_all, selected_area, selected_group)
-        if fig_stl:
-            st.plotly_chart(fig_stl, use_container_width=True)
+        if tabs[0].open:
+            stl_panel(df_all, selected_area, selected_group)
 
     # --- Tab 2 ---
     with tabs[1]:
-        st.subheader("Spektrogram")
-        window_length = st.slider("Velg vinduslengde (timer)", 64, 512, 256, step=32)
-        overlap = st.slider("Velg overlapp (timer)", 32, 256, 128, step=32)
-
-        fig_spec = spectrogram_plot(df_all, selected_area, selected_group, window_length, overlap)
-        if fig_spec:
-            st.plotly_chart(fig_spec, use_container_width=True)
\ No newline at end of file
+        if tabs[1].open:
+            spectrogram_panel(df_all, selected_area, selected_group)
@@ -1,6 +1,8 @@
 import streamlit as st
 import pandas as pd
+import plotly.express as px
 from functions.load_data import load_era5_raw  
+from functions.zoom import zoomable_chart
 
 
 # ------------------------------------------------------------
@@ -97,7 +99,30 @@ def show(df=None):
     else:
         st.info("Ingen numeriske variabler funnet i datasettet.")
 
-    # 🔹 4. Info nederst
+    # 🔹 4. Tidsserie for hele året (zoom for timesoppløsning)
+    if variables:
+        st.subheader("Tidsserie for hele året")
+        pick_variable = st.selectbox("Velg variabel:", variables)
+
+        def build_line(df_view):
+            fig = px.line(
+                df_view,
+                x="time",
+                y=pick_variable,
+                title=f"{pick_variable} – {selected_area} (2021)",
+            )
+            fig.update_layout(xaxis_title="Tid", yaxis_title="Verdi", template="plotly_white")
+            return fig
+
+        zoomable_chart(
+            f"page5_line_{selected_area}_{pick_variable}",
+            df,
+            time_col="time",
+            value_cols=pick_variable,
+            build_figure=build_line,
+        )
+
+    # 🔹 5. Info nederst
     with st.expander("ℹ️ Om dataene"):
         st.markdown(
             """
@@ -1,10 +1,11 @@
 import streamlit as st
 import pandas as pd
 import numpy as np
-from scipy.fft import dct, idct
-from sklearn.neighbors import LocalOutlierFactor
 import plotly.graph_objects as go
 
+from functions import anomaly_batch, spc_engine
+from functions.lof_1d import lof_outliers, lof_scores_1d
+
 # Gjenbruk funksjonen fra page_5
 from modules.page_5 import get_or_load_meteo_data
 
@@ -12,36 +13,33 @@ from modules.page_5 import get_or_load_meteo_data
 # ------------------------------------------------------------
 # --- 1. Hjelpefunksjon: SPC-analyse for temperatur -----------
 # ------------------------------------------------------------
+# Trend-cutoffene slideren kan velge; SATV for alle beregnes i én batchet invers-DCT
+CUTOFF_DAGER = tuple(range(30, 181, 10))
+
+# Vindulengder for rullerende median/MAD (dager)
+RULLERENDE_DAGER = [1, 3, 7, 14, 30, 60, 90]
+
+
 def analyser_temperatur_dct_spc(
     df, verdi_kolonne="temperature_2m", tids_kolonne="time",
-    cutoff_dager=90, k_sigma=3
+    cutoff_dager=90, k_sigma=3, rullerende_dager=None
 ):
-    """Robust SPC-analyse med DCT-filtrert serie."""
-    s = (
-        df.set_index(tids_kolonne)
-        .sort_index()[verdi_kolonne]
-        .asfreq("1h")
-        .interpolate("time")
-    )
+    """
+    Robust SPC-analyse med DCT-filtrert serie.
+    rullerende_dager=None gir globale grenser; ellers brukes rullerende median/MAD
+    over et sentrert vindu med så mange dager, slik at grensene følger årstidene.
+    """
+    x = spc_engine.hourly_values(df, verdi_kolonne, tids_kolonne)
 
-    x = s.to_numpy()
-    N = len(x)
-
-    # --- Diskret cosinustransform ---
-    c = dct(x, type=2, norm="ortho")
-    T_timer = cutoff_dager * 24
-    k_cut = max(int(np.floor(2 * N / T_timer)), 1)
-    c_hp = c.copy()
-    c_hp[:k_cut] = 0.0
-
-    # --- Høyfrekvent komponent (SATV) ---
-    satv = idct(c_hp, type=2, norm="ortho")
-
-    # --- Robust SPC-grenser ---
-    median = np.median(satv)
-    mad = np.median(np.abs(satv - median))
-    sigma = 1.4826 * mad if mad > 0 else np.std(satv)
-    lo, hi = median - k_sigma * sigma, median + k_sigma * sigma
+    # --- DCT-koeffisienter, SATV og median/MAD er cachet per serie og cutoff ---
+    cutoffs = CUTOFF_DAGER if cutoff_dager in CUTOFF_DAGER else (cutoff_dager,)
+    satv, median, sigma = spc_engine.cutoff_table(x, cutoffs)[cutoff_dager]
+
+    if rullerende_dager:
+        median, sigma = spc_engine.rolling_center_scale(satv, 24 * rullerende_dager)
+
+    # --- Robust SPC-grenser (kun disse avhenger av k σ) ---
+    lo, hi = spc_engine.spc_limits(median, sigma, k_sigma)
     is_outlier = (satv < lo) | (satv > hi)
 
     # --- Plot ---
@@ -62,11 +60,12 @@ def analyser_temperatur_dct_spc(
         template="plotly_white", hovermode="x unified", title_x=0.5
     )
 
+    # Rullerende grenser oppsummeres med medianen over året
     stats = {
-        "median_SATV": round(float(median), 3),
-        "sigma_SATV": round(float(sigma), 3),
-        "nedre_grense": round(float(lo), 3),
-        "ovre_grense": round(float(hi), 3),
+        "median_SATV": round(float(np.median(median)), 3),
+        "sigma_SATV": round(float(np.median(sigma)), 3),
+        "nedre_grense": round(float(np.median(lo)), 3),
+        "ovre_grense": round(float(np.median(hi)), 3),
         "antall_outliers": int(is_outlier.sum()),
         "andel_outliers_%": round(100 * is_outlier.mean(), 2),
     }
@@ -77,6 +76,12 @@ def analyser_temperatur_dct_spc(
 # ------------------------------------------------------------
 # --- 2. Hjelpefunksjon: LOF-analyse for nedbør --------------
 # ------------------------------------------------------------
+@st.cache_data(show_spinner="Beregner LOF ...")
+def lof_scores(x, n_neighbors=50):
+    """LOF-score per time; uavhengig av andel_outliers, så den caches på tvers av slideren."""
+    return lof_scores_1d(x, n_neighbors=n_neighbors)
+
+
 def analyser_nedbor_lof(df, verdi_kolonne="precipitation",
                         tids_kolonne="time", andel_outliers=0.01):
     """LOF-analyse for å finne anomale nedbørshendelser."""
@@ -87,12 +92,11 @@ def analyser_nedbor_lof(df, verdi_kolonne="precipitation",
         .interpolate("time")
         .fillna(0.0)
     )
-    x = s.to_numpy().reshape(-1, 1)
+    x = s.to_numpy()
 
-    lof = LocalOutlierFactor(contamination=andel_outliers, n_neighbors=50)
-    labels = lof.fit_predict(x)
-    scores = -lof.negative_outlier_factor_
-    is_outlier = labels == -1
+    # Eksakt 1-D LOF (sortering + glidende vindu); kun terskelen avhenger av andelen
+    scores = lof_scores(x, n_neighbors=50)
+    is_outlier = lof_outliers(scores, andel_outliers)
 
     fig = go.Figure()
     fig.add_trace(go.Scatter(
@@ -122,7 +126,147 @@ def analyser_nedbor_lof(df, verdi_kolonne="precipitation",
 
 
 # ------------------------------------------------------------
-# --- 3. Streamlit-side: “new B” ------------------------------
+# --- 3. Analysepaneler (fragmenter) --------------------------
+# ------------------------------------------------------------
+@st.fragment
+def spc_panel(df):
+    st.subheader("SPC-analyse av temperatur")
+    st.write(
+        "Denne analysen bruker **robuste SPC-grenser** "
+        "(median ± k × 1.4826 × MAD) etter DCT-filtrering for å fremheve raske, "
+        "uvanlige temperaturendringer."
+    )
+    cutoff = st.slider("Trend-cutoff (dager)", CUTOFF_DAGER[0], CUTOFF_DAGER[-1], 90, step=10)
+    k_sigma = st.slider("k σ (kontrollgrense)", 1, 5, 3, step=1)
+
+    modus = st.radio("Kontrollgrenser", ["Globale", "Rullerende median/MAD"], horizontal=True)
+    rullerende = None
+    if modus == "Rullerende median/MAD":
+        rullerende = st.select_slider("Vindu (dager)", RULLERENDE_DAGER, value=30)
+
+    fig_spc, stats_spc = analyser_temperatur_dct_spc(
+        df, "temperature_2m", "time", cutoff, k_sigma, rullerende
+    )
+    st.plotly_chart(fig_spc, use_container_width=True)
+    st.dataframe(pd.DataFrame([stats_spc]))
+
+    with st.expander("📘 Forklaring"):
+        st.markdown(
+            """
+            Røde punkter markerer **outliers** — timer der den sesongjusterte temperaturvariasjonen ligger utenfor ± 3 σ.  
+            Disse indikerer ekstreme kulde- eller varme-episoder.
+            """
+        )
+
+
+@st.fragment
+def lof_panel(df):
+    st.subheader("LOF-analyse av nedbør")
+    st.write(
+        "Metoden **Local Outlier Factor (LOF)** finner observasjoner som avviker sterkt fra nabopunktene, "
+        "for eksempel ekstremregn."
+    )
+    andel = st.slider("Forventet andel anomalier (%)", 0.1, 5.0, 1.0, step=0.1) / 100.0
+    fig_lof, stats_lof = analyser_nedbor_lof(df, "precipitation", "time", andel)
+    st.plotly_chart(fig_lof, use_container_width=True)
+    st.dataframe(pd.DataFrame([stats_lof]))
+
+    with st.expander("📘 Forklaring"):
+        st.markdown(
+            """
+            **LOF** måler hvor tett en observasjon ligger i forhold til naboene.  
+            Høy LOF-score betyr at verdien skiller seg ut og regnes som en anomali.
+            """
+        )
+
+
+@st.cache_data(show_spinner=False)
+def load_batch_scores(price_area, year, variable, versjon):
+    """Lagrede scorer fra batchjobben; versjon (filens mtime) ugyldiggjør cachen."""
+    return anomaly_batch.load_scores(price_area, year, variable)
+
+
+@st.fragment
+def batch_panel():
+    st.subheader("Anomalier for alle prisområder og værvariabler")
+    st.write(
+        "Scorene beregnes på forhånd av en batchjobb som kjører LOF og DCT-SPC for alle "
+        "ERA5-variabler (og en felles temperatur–vind–nedbør-vektor) i alle prisområder. "
+        "Her blas det bare i lagrede resultater – ingen modell tilpasses ved visning."
+    )
+
+    if st.button("▶️ Kjør batchjobb for 2021 (alle prisområder)"):
+        with st.spinner("Scorer alle områder og variabler i parallell ..."):
+            paths = anomaly_batch.run_batch([2021])
+        st.success(f"Lagret {len(paths)} filer.")
+
+    pairs = anomaly_batch.available()
+    if not pairs:
+        st.info("Ingen lagrede scorer ennå. Kjør batchjobben over eller `python -m functions.anomaly_batch 2021 2022`.")
+        return
+
+    c1, c2, c3, c4 = st.columns(4)
+    with c1:
+        area = st.selectbox("Prisområde", sorted({a for a, _ in pairs}))
+    with c2:
+        year = st.selectbox("År", sorted({y for a, y in pairs if a == area}))
+    with c3:
+        variable = st.selectbox("Variabel", anomaly_batch.VARIABLES + [anomaly_batch.JOINT_NAME])
+    with c4:
+        metode = st.radio(
+            "Score",
+            ["LOF", "SPC (robust z)"],
+            disabled=variable == anomaly_batch.JOINT_NAME,
+        )
+
+    andel = st.slider("Andel anomalier (%)", 0.1, 5.0, 1.0, step=0.1, key="batch_andel") / 100.0
+
+    versjon = anomaly_batch.store_path(area, year).stat().st_mtime
+    scores = load_batch_scores(area, year, variable, versjon)
+    if scores.empty:
+        st.warning("Fant ingen scorer for valgt kombinasjon.")
+        return
+
+    kolonne = "spc_z" if metode.startswith("SPC") and variable != anomaly_batch.JOINT_NAME else "lof"
+    score = scores[kolonne].to_numpy()
+    is_outlier = score >= np.nanquantile(score, 1.0 - andel)
+
+    fig = go.Figure()
+    if variable == anomaly_batch.JOINT_NAME:
+        fig.add_trace(go.Scatter(
+            x=scores["time"], y=scores["lof"],
+            mode="lines", name="LOF-score", line=dict(color="slategray")
+        ))
+        y_punkter, y_tittel = scores["lof"][is_outlier], "LOF-score"
+    else:
+        fig.add_trace(go.Scatter(
+            x=scores["time"], y=scores["value"],
+            mode="lines", name=variable, line=dict(color="steelblue")
+        ))
+        y_punkter, y_tittel = scores["value"][is_outlier], variable
+
+    fig.add_trace(go.Scatter(
+        x=scores["time"][is_outlier], y=y_punkter,
+        mode="markers", name=f"Anomalier ({kolonne})",
+        marker=dict(color="red", size=5)
+    ))
+    fig.update_layout(
+        title=f"{variable} – {area} ({year})",
+        xaxis_title="Tid", yaxis_title=y_tittel,
+        template="plotly_white", hovermode="x unified", title_x=0.5
+    )
+    st.plotly_chart(fig, use_container_width=True)
+
+    st.dataframe(
+        scores.loc[is_outlier, ["time", "value", "lof", "spc_z"]]
+        .sort_values(kolonne, ascending=False)
+        .head(50),
+        hide_index=True,
+    )
+
+
+# ------------------------------------------------------------
+# --- 4. Streamlit-side: “new B” ------------------------------
 # ------------------------------------------------------------
 def show():
     st.title("Outlier- og Anomalidetektering")
@@ -133,47 +277,24 @@ def show():
     st.write(f"📍 Analyserer værdata for prisområde **{selected_area}** (Open-Meteo ERA5, 2021)")
 
     # Tabs
-    tabs = st.tabs(["📊 SPC – Temperatur Outliers", "🌧 LOF – Nedbør Anomalier"])
+    # Late faner: kun den aktive fanen beregnes (resultatene caches)
+    tabs = st.tabs(
+        ["📊 SPC – Temperatur Outliers", "🌧 LOF – Nedbør Anomalier", "🗂 Alle områder (batch)"],
+        key="page6_tabs",
+        on_change="rerun",
+    )
 
     # === Tab 1: SPC-analyse ===
     with tabs[0]:
-        st.subheader("SPC-analyse av temperatur")
-        st.write(
-            "Denne analysen bruker **robuste SPC-grenser** "
-            "(median ± k × 1.4826 × MAD) etter DCT-filtrering for å fremheve raske, "
-            "uvanlige temperaturendringer."
-        )
-        cutoff = st.slider("Trend-cutoff (dager)", 30, 180, 90, step=10)
-        k_sigma = st.slider("k σ (kontrollgrense)", 1, 5, 3, step=1)
-
-        fig_spc, stats_spc = analyser_temperatur_dct_spc(df, "temperature_2m", "time", cutoff, k_sigma)
-        st.plotly_chart(fig_spc, use_container_width=True)
-        st.dataframe(pd.DataFrame([stats_spc]))
-
-        with st.expander("📘 Forklaring"):
-            st.markdown(
-                """
-                Røde punkter markerer **outliers** — timer der den sesongjusterte temperaturvariasjonen ligger utenfor ± 3 σ.  
-                Disse indikerer ekstreme kulde- eller varme-episoder.
-                """
-            )
+        if tabs[0].open:
+            spc_panel(df)
 
     # === Tab 2: LOF-analyse ===
     with tabs[1]:
-        st.subheader("LOF-analyse av nedbør")
-        st.write(
-            "Metoden **Local Outlier Factor (LOF)** finner observasjoner som avviker sterkt fra nabopunktene, "
-            "for eksempel ekstremregn."
-        )
-        andel = st.slider("Forventet andel anomalier (%)", 0.1, 5.0, 1.0, step=0.1) / 100.0
-        fig_lof, stats_lof = analyser_nedbor_lof(df, "precipitation", "time", andel)
-        st.plotly_chart(fig_lof, use_container_width=True)
-        st.dataframe(pd.DataFrame([stats_lof]))
-
-        with st.expander("📘 Forklaring"):
-            st.markdown(
-                """
-                **LOF** måler hvor tett en observasjon ligger i forhold til naboene.  
-                Høy LOF-score betyr at verdien skiller seg ut og regnes som en anomali.
-                """
-            )
\ No newline at end of file
+        if tabs[1].open:
+            lof_panel(df)
+
+    # === Tab 3: Lagrede batch-anomalier ===
+    with tabs[2]:
+        if tabs[2].open:
+            batch_panel()
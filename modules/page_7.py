@@ -2,6 +2,124 @@ import streamlit as st
 import requests
 import pandas as pd
 import plotly.express as px
+import plotly.graph_objects as go
+
+from functions.anomaly_stream import AnomalyService
+from functions.series_store import elhub_series_store
+
+
+# ------------------------------------------------------------
+# --- Henting og strømmende anomalitjeneste -------------------
+# ------------------------------------------------------------
+VARIABLER = ["temperature_2m", "precipitation", "wind_speed_10m"]
+
+# Dager med historikk som hentes sammen med prognosen (varmer opp tilstanden)
+PAST_DAYS = 31
+
+# Elhub: prisområdet byen ligger i, og hvor mange dager som varmer opp tilstanden
+CITY_AREA = {"Oslo": "NO1", "Bergen": "NO5", "Trondheim": "NO3", "Tromsø": "NO4"}
+ELHUB_KILDER = {"consumption": "Forbruk", "production": "Produksjon"}
+ELHUB_DAYS = 90
+
+
+@st.cache_data(ttl=900, show_spinner="Henter data fra Open-Meteo ...")
+def hent_vaerdata(lat, lon):
+    """Timesdata (siste PAST_DAYS dager + prognose) og lokal tid 'nå' for stedet."""
+    url = (
+        f"https://api.open-meteo.com/v1/forecast?"
+        f"latitude={lat}&longitude={lon}"
+        f"&hourly={','.join(VARIABLER)}"
+        f"&timezone=auto&past_days={PAST_DAYS}"
+    )
+    response = requests.get(url)
+    data = response.json()
+
+    df = pd.DataFrame(data["hourly"])
+    df["time"] = pd.to_datetime(df["time"])
+    now = pd.Timestamp.now(tz="UTC").tz_localize(None) + pd.Timedelta(seconds=data.get("utc_offset_seconds", 0))
+    return df, now
+
+
+@st.cache_resource
+def anomaly_service(city):
+    """Én tilstand per by, delt mellom økter og beholdt mellom reruns."""
+    return AnomalyService(VARIABLER)
+
+
+@st.cache_resource
+def elhub_anomaly_service(price_area, source):
+    """Én tilstand per (prisområde, kilde) for Elhub-timene, delt mellom økter."""
+    return AnomalyService(["quantityKwh"])
+
+
+@st.fragment(run_every="15m")
+def live_alarm_panel(city, lat, lon):
+    st.subheader(f"🚨 Live anomalier for {city}")
+
+    df, now = hent_vaerdata(lat, lon)
+    observert = df[df["time"] <= now]
+    prognose = df[df["time"] > now]
+
+    # Bare timer som er nyere enn forrige kjøring scores; historikken gjenbrukes
+    service = anomaly_service(city)
+    nye = service.ingest(observert)
+    if not nye.empty:
+        st.toast(f"{len(nye)} nye alarmer for {city}", icon="🚨")
+
+    alarmer = service.alarm_frame()
+    fremover = service.preview(prognose)
+    fremover = fremover[fremover["alarm"]] if not fremover.empty else fremover
+
+    var = st.selectbox("Variabel", VARIABLER, key="page7_alarm_var")
+    fig = go.Figure()
+    fig.add_trace(go.Scatter(x=df["time"], y=df[var], mode="lines", name=var, line=dict(color="steelblue")))
+    a = alarmer[alarmer["variable"] == var]
+    fig.add_trace(go.Scatter(x=a["time"], y=a["value"], mode="markers", name="Alarm (observert)",
+                             marker=dict(color="red", size=7)))
+    if not fremover.empty:
+        f = fremover[fremover["variable"] == var]
+        fig.add_trace(go.Scatter(x=f["time"], y=f["value"], mode="markers", name="Alarm (prognose)",
+                                 marker=dict(color="orange", size=7, symbol="diamond")))
+    fig.add_vline(x=now, line_dash="dot", line_color="gray")
+    fig.update_layout(xaxis_title="Tid", yaxis_title="Verdi", template="plotly_white", hovermode="x unified")
+    st.plotly_chart(fig, use_container_width=True)
+
+    st.caption(f"Sist innlagte time: {service.last_time} · {len(alarmer)} alarmer totalt")
+    st.dataframe(alarmer.sort_values("time", ascending=False).head(50), use_container_width=True)
+
+
+@st.fragment(run_every="15m")
+def elhub_alarm_panel(price_area):
+    st.subheader(f"⚡ Live anomalier i Elhub-data for {price_area}")
+
+    source = st.radio("Kilde", list(ELHUB_KILDER), format_func=ELHUB_KILDER.get, horizontal=True,
+                      key="page7_elhub_source")
+
+    # Timeserielageret bygges på nytt når Elhub-dataene lastes på nytt (ttl);
+    # bare timer nyere enn forrige innlagte scores
+    series = elhub_series_store().series(price_area, source)
+    if series.empty:
+        st.info(f"Ingen Elhub-data for {price_area}.")
+        return
+    series = series[series.index > series.index[-1] - pd.Timedelta(days=ELHUB_DAYS)]
+    df = series.rename("quantityKwh").rename_axis("time").reset_index()
+
+    service = elhub_anomaly_service(price_area, source)
+    nye = service.ingest(df)
+    if not nye.empty:
+        st.toast(f"{len(nye)} nye Elhub-alarmer for {price_area}", icon="⚡")
+
+    alarmer = service.alarm_frame()
+    fig = go.Figure()
+    fig.add_trace(go.Scatter(x=df["time"], y=df["quantityKwh"], mode="lines", name="kWh",
+                             line=dict(color="steelblue")))
+    fig.add_trace(go.Scatter(x=alarmer["time"], y=alarmer["value"], mode="markers", name="Alarm",
+                             marker=dict(color="red", size=7)))
+    fig.update_layout(xaxis_title="Tid", yaxis_title="kWh", template="plotly_white", hovermode="x unified")
+    st.plotly_chart(fig, use_container_width=True)
+
+    st.caption(f"Sist innlagte time: {service.last_time} · {len(alarmer)} alarmer totalt")
+
 
 def show():
     st.header("🌤️ Live værdata fra Open-Meteo")
@@ -18,19 +136,9 @@ def show():
     city = st.selectbox("Velg en by:", list(cities.keys()))
     lat, lon = cities[city]
 
-    # Hent data fra Open-Meteo API
-    url = (
-        f"https://api.open-meteo.com/v1/forecast?"
-        f"latitude={lat}&longitude={lon}"
-        f"&hourly=temperature_2m,precipitation,wind_speed_10m"
-        f"&timezone=auto"
-    )
-    response = requests.get(url)
-    data = response.json()
-
-    # Konverter data til DataFrame
-    df_weather = pd.DataFrame(data["hourly"])
-    df_weather["time"] = pd.to_datetime(df_weather["time"])
+    # Hent data fra Open-Meteo API (historikken brukes bare av anomalipanelet)
+    df_all, _ = hent_vaerdata(lat, lon)
+    df_weather = df_all[df_all["time"] >= df_all["time"].max().normalize() - pd.Timedelta(days=6)]
 
     # Vis rådata
     st.subheader(f"Timesdata for {city}")
@@ -52,4 +160,8 @@ def show():
         yaxis_title="Verdi",
         template="plotly_white"
     )
-    st.plotly_chart(fig, use_container_width=True)
\ No newline at end of file
+    st.plotly_chart(fig, use_container_width=True)
+
+    live_alarm_panel(city, lat, lon)
+
+    elhub_alarm_panel(CITY_AREA[city])
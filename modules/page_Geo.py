@@ -4,358 +4,320 @@ import plotly.express as px
 import plotly.graph_objects as go
 from functions.load_data import load_elhub_data
 import pandas as pd
-import json
-from shapely.geometry import shape
+from functions.geometry import area_index, map_geojson
 from modules.page_Snow import show as page_Snow
 
 
-def show():
+# =====================================================================
+# 🗺️ KARTPANEL (fragment: filter, dato og klikk kjører kun kartet)
+# =====================================================================
+@st.fragment
+def map_panel(df):
 
-    # =====================================================================
-    # 🏷️ 1) HOVEDTITTEL
-    # =====================================================================
-    st.title("Analyse av energiproduksjon og -forbruk i norske elspotområder")
-    
+    # -----------------------------------------------------------------
+    # 3) FILTERE for kartdelen (i panelet, slik at endringer kun
+    #    kjører kartpanelet på nytt)
+    # -----------------------------------------------------------------
+    st.markdown("### 🔧 Filter")
+
+    col_src, col_group = st.columns(2)
+
+    # --- Datagrunnlag ---
+    with col_src:
+        src = st.radio(
+            "🔍 Velg type data:",
+            [
+                "Alt (produksjon + forbruk)",
+                "Kun produksjon",
+                "Kun forbruk"
+            ]
+        )
+
+    if src == "Kun produksjon":
+        df = df[df["source"] == "production"]
+    elif src == "Kun forbruk":
+        df = df[df["source"] == "consumption"]
+
+    # --- Energigruppe ---
+    groups = sorted(df["energy_group"].dropna().unique())
+
+    with col_group:
+        group_choice = st.selectbox(
+            "⚡ Velg energigruppe:",
+            ["Alle grupper"] + list(groups)
+        )
+
+    if group_choice != "Alle grupper":
+        df = df[df["energy_group"] == group_choice]
 
     # =====================================================================
-    # 2) LAST DATA
+    # 4) DATO-SLIDER 
     # =====================================================================
-    df = load_elhub_data()
+    st.markdown("## 📅 Velg tidsintervall")
+
+    min_date = df["start_time"].min().date()
+    max_date = df["start_time"].max().date()
+
+    start_date, end_date = st.slider(
+        "Tidsperiode:",
+        min_value=min_date,
+        max_value=max_date,
+        value=(min_date, max_date),
+        format="DD.MM.YYYY",
+    )
+
+    df = df[df["start_time"].dt.date.between(start_date, end_date)]
 
     if df.empty:
-        st.error("Ingen data returnert fra MongoDB.")
+        st.warning("Ingen data for valgt tidsintervall.")
         st.stop()
 
-    df["start_time"] = pd.to_datetime(df["start_time"], errors="coerce")
-    df = df.dropna(subset=["start_time"])
+    # =====================================================================
+    # 5) GEOMETRI  (sentroide, utstrekning og romlig indeks – bygget én
+    #    gang per prosess, ingen geometriberegning per kjøring)
+    # =====================================================================
+    index = area_index()
+
+    # =====================================================================
+    # 6) STATISTIKK
+    # =====================================================================
+    stats = (
+        df.groupby("price_area")["quantity_kwh"]
+        .agg(["mean", "count", "min", "max"])
+        .rename(columns={
+            "mean": "Gjennomsnitt (kWh)",
+            "count": "Antall målinger",
+            "min": "Laveste (kWh)",
+            "max": "Høyeste (kWh)"
+        })
+    )
+
+    # =====================================================================
+    # 7) TABELL – STIL OG EMOJIS
+    # =====================================================================
+    st.markdown("## 📊 Oversikt over prisområder")
+
+    st.dataframe(
+        stats.style.format({
+            "Gjennomsnitt (kWh)": "{:,.0f}",
+            "Antall målinger": "{:,.0f}",
+            "Laveste (kWh)": "{:,.0f}",
+            "Høyeste (kWh)": "{:,.0f}",
+        }),
+        use_container_width=True,
+    )
 
-    # Sikre energy_group finnes
-    if "energy_group" not in df.columns:
-        df["energy_group"] = df["production_group"]
-        df.loc[df["consumption_group"].notna(), "energy_group"] = df["consumption_group"]
 
 
     # =====================================================================
-    # 🔀 VIEW-KONTROLL (erstatter TABS)
+    # 8) KART
     # =====================================================================
-    view = st.radio(
-        "Velg visning:",
-        ["🗺️ Kartanalyse", "❄️ Snow Drift"],
-        horizontal=True
+    st.markdown("## 🗺️ Kart over elspotområder")
+
+    # Ferdig tabell med lat/lon (sentroide) per område + statistikken
+    areas = index.table.reset_index().merge(stats, how="left", left_on="ElSpotOmr", right_index=True)
+
+    # session state
+    if "selected_area" not in st.session_state:
+        st.session_state.selected_area = None
+
+    selected_area = st.session_state.selected_area
+
+    # selection (fra plotly on_select)
+    sel_state = st.session_state.get("map")
+    if sel_state and "selection" in sel_state:
+        pts = sel_state["selection"].get("points", [])
+        if pts:
+            chosen = pts[0].get("location")
+            if not chosen and "lat" in pts[0] and "lon" in pts[0]:
+                # Klikk uten område-ID (f.eks. klikkpunktene): slå opp koordinaten
+                chosen = index.locate(pts[0]["lon"], pts[0]["lat"])
+            if chosen:
+                st.session_state.selected_area = chosen
+                selected_area = chosen
+
+    # zoom
+    center = {"lat": 65, "lon": 12}
+    zoom = 4
+    if selected_area and selected_area in index:
+        minx, miny, maxx, maxy = index.info(selected_area)[["minx", "miny", "maxx", "maxy"]]
+        center = {"lat": (miny + maxy) / 2, "lon": (minx + maxx) / 2}
+        span = max(maxy - miny, maxx - minx)
+        zoom = 6 if span < 5 else 5
+
+    # Forenklet geometri for zoomnivået over (i stedet for hele file.geojson)
+    fig = px.choropleth_map(
+        areas,
+        geojson=map_geojson(zoom),
+        locations="ElSpotOmr",
+        featureidkey="properties.ElSpotOmr",
+        color="Gjennomsnitt (kWh)",
+        color_continuous_scale="Viridis",
+        map_style="open-street-map",
+        zoom=zoom,
+        center=center,
+        opacity=0.6,
     )
 
+    fig.update_traces(
+        hovertemplate=(
+            "<b>Prisområde: %{location}</b><br>"
+            "Snitt: %{z:,.0f} kWh<br>"
+            "<extra></extra>"
+        )
+    )
 
+    # Usynlige punkter for klikk
+    fig.add_trace(go.Scattermap(
+        lat=areas["lat"],
+        lon=areas["lon"],
+        mode="markers",
+        marker=dict(size=25, opacity=0),
+        customdata=areas["ElSpotOmr"],
+        hoverinfo="none",
+        name="clickpoints"
+    ))
+
+    # Highlight valgt område + lagre koordinat til SNOW
+    if selected_area and selected_area in index:
+        c = index.info(selected_area)
+
+        # 🔴 Marker valgt polygon: tykk kant i samme trace (ingen kopi av geometrien)
+        is_selected = areas["ElSpotOmr"] == selected_area
+        fig.update_traces(
+            marker_line_width=is_selected.map({True: 5, False: 1}).tolist(),
+            marker_line_color=is_selected.map({True: "black", False: "#444"}).tolist(),
+            selector=dict(type="choroplethmap"),
+        )
+
+        # 🔴 Marker valgt centroid
+        fig.add_trace(go.Scattermap(
+            lat=[c["lat"]],
+            lon=[c["lon"]],
+            mode="markers",
+            marker=dict(size=18, color="red"),
+            name="Valgt område"
+        ))
+
+        # ⭐️ Viktig: lagre koordinat til SNOW-siden
+        st.session_state["selected_coord"] = {
+            "lat": float(c["lat"]),
+            "lon": float(c["lon"]),
+        }
+
+    fig.update_layout(height=650, margin=dict(l=0, r=0, t=0, b=0))
+    st.plotly_chart(fig, key="map", on_select="rerun", use_container_width=True)
 
     # =====================================================================
-    # 🗺️ VIEW 1 — KART
+    # 9) DETALJER + TIDSSERIE
     # =====================================================================
-    if view == "🗺️ Kartanalyse":
 
-        # -----------------------------------------------------------------
-        # 3) SIDEBAR FILTERE for kartdelen
-        # -----------------------------------------------------------------
-        st.sidebar.header("🔧 Filter")
+    st.markdown("---")
+    st.subheader("📌 Detaljer for valgt område")
 
-        # --- Datagrunnlag ---
-        st.sidebar.markdown("### 🔍 Datagrunnlag")
+    if selected_area and selected_area in stats.index:
 
-        src = st.sidebar.radio(
-            "Velg type data:",
-            [
-                "Alt (produksjon + forbruk)",
-                "Kun produksjon",
-                "Kun forbruk"
-            ]
+        row = stats.loc[selected_area]
+
+        st.metric(
+            label=f"Gjennomsnittlig energimengde i {selected_area}",
+            value=f"{row['Gjennomsnitt (kWh)']:,.0f} kWh"
         )
 
-        if src == "Kun produksjon":
-            df = df[df["source"] == "production"]
-        elif src == "Kun forbruk":
-            df = df[df["source"] == "consumption"]
+        st.write(f"Antall målinger: **{int(row['Antall målinger'])}**")
+        st.write(f"Min–maks: **{row['Laveste (kWh)']:,.0f} – {row['Høyeste (kWh)']:,.0f} kWh**")
 
-        # --- Energigruppe ---
-        st.sidebar.markdown("### ⚡ Energigruppe")
-        groups = sorted(df["energy_group"].dropna().unique())
+        df_ts = df[df["price_area"] == selected_area].copy()
 
-        group_choice = st.sidebar.selectbox(
-            "Velg energigruppe:",
-            ["Alle grupper"] + list(groups)
-        )
+        if not df_ts.empty:
+            df_ts_daily = (
+                df_ts.set_index("start_time")["quantity_kwh"]
+                .resample("D").mean()
+                .reset_index()
+            )
 
-        if group_choice != "Alle grupper":
-            df = df[df["energy_group"] == group_choice]
+            fig_ts = px.line(
+                df_ts_daily,
+                x="start_time",
+                y="quantity_kwh",
+                title=f"Daglig gjennomsnittlig energimengde – {selected_area}",
+                labels={"start_time": "Dato", "quantity_kwh": "kWh"},
+            )
+            fig_ts.update_layout(height=350, margin=dict(l=0, r=0, t=30, b=0))
+            st.plotly_chart(fig_ts, use_container_width=True)
+        else:
+            st.info("Ingen tidsseriedata for dette området.")
 
-        # =====================================================================
-        # 4) DATO-SLIDER 
-        # =====================================================================
-        st.markdown("## 📅 Velg tidsintervall")
+    else:
+        st.info("Klikk på et prisområde for å vise detaljer. "
+                "Koordinaten brukes også på SNOW-siden.")
+                
 
-        min_date = df["start_time"].min().date()
-        max_date = df["start_time"].max().date()
+    # =====================================================================
+    # 10) INFO-SEKSJONER
+    # =====================================================================
 
-        start_date, end_date = st.slider(
-            "Tidsperiode:",
-            min_value=min_date,
-            max_value=max_date,
-            value=(min_date, max_date),
-            format="DD.MM.YYYY",
-        )
+    with st.expander("ℹ️ Hva betyr energigruppe?"):
+        st.markdown("""
+    En *energigruppe* beskriver **typen energi** som produseres eller forbrukes.
 
-        df = df[df["start_time"].dt.date.between(start_date, end_date)]
+    Vanlige grupper:
+    - 🔵 **hydro** – vannkraft  
+    - 🟢 **wind** – vindkraft  
+    - 🟠 **thermal** – varme, gass, biomasse  
+    - 🟣 **industry** – energibruk i industri  
+    - 🏠 **household** – energibruk i husholdninger  
+    - ⚙️ **other** – kategorier som ikke passer i andre grupper
+        """)
 
-        if df.empty:
-            st.warning("Ingen data for valgt tidsintervall.")
-            st.stop()
+    with st.expander("ℹ️ Hva er `kWh`?"):
+        st.markdown("""
+    `quantity_kwh` viser hvor mye energi (kWh) som er **produsert eller brukt i løpet av én time**.
+        """)
 
-        # =====================================================================
-        # 5) GEOJSON  (NY VERSJON UTEN GEOPANDAS)
-        # =====================================================================
-        @st.cache_data
-        def load_geojson():
-            # Les rå geojson
-            with open("file.geojson", "r", encoding="utf-8") as f:
-                gj = json.load(f)
-
-            rows = []
-            for feat in gj["features"]:
-                props = feat.get("properties", {})
-                # original
-                omr_raw = str(props.get("ElSpotOmr", ""))
-                # samme rensing som du hadde i GeoPandas:
-                omr_clean = omr_raw.replace(" ", "")
-                # oppdater også i selve geojsonet slik at featureidkey matcher
-                props["ElSpotOmr"] = omr_clean
-
-                geom = shape(feat["geometry"])
-                rows.append({
-                    "ElSpotOmr": omr_clean,
-                    "geometry": geom,
-                })
-
-            areas_df = pd.DataFrame(rows)
-            return gj, areas_df
-
-        geojson, areas = load_geojson()
-
-        # =====================================================================
-        # 6) STATISTIKK
-        # =====================================================================
-        stats = (
-            df.groupby("price_area")["quantity_kwh"]
-            .agg(["mean", "count", "min", "max"])
-            .rename(columns={
-                "mean": "Gjennomsnitt (kWh)",
-                "count": "Antall målinger",
-                "min": "Laveste (kWh)",
-                "max": "Høyeste (kWh)"
-            })
-        )
 
-        # =====================================================================
-        # 7) TABELL – STIL OG EMOJIS
-        # =====================================================================
-        st.markdown("## 📊 Oversikt over prisområder")
-
-        st.dataframe(
-            stats.style.format({
-                "Gjennomsnitt (kWh)": "{:,.0f}",
-                "Antall målinger": "{:,.0f}",
-                "Laveste (kWh)": "{:,.0f}",
-                "Høyeste (kWh)": "{:,.0f}",
-            }),
-            use_container_width=True,
-        )
+def show():
 
+    # =====================================================================
+    # 🏷️ 1) HOVEDTITTEL
+    # =====================================================================
+    st.title("Analyse av energiproduksjon og -forbruk i norske elspotområder")
+    
 
+    # =====================================================================
+    # 2) LAST DATA
+    # =====================================================================
+    df = load_elhub_data()
 
-        # =====================================================================
-        # 8) KART
-        # =====================================================================
-        st.markdown("## 🗺️ Kart over elspotområder")
-
-        # merge som før – areas er nå en "vanlig" DataFrame med geometry-kolonne
-        areas = areas.merge(stats, how="left", left_on="ElSpotOmr", right_index=True)
-
-        # centroid-beregning med shapely
-        areas["lat"] = areas["geometry"].apply(lambda g: g.centroid.y)
-        areas["lon"] = areas["geometry"].apply(lambda g: g.centroid.x)
-
-        # session state
-        if "selected_area" not in st.session_state:
-            st.session_state.selected_area = None
-
-        selected_area = st.session_state.selected_area
-
-        # selection (fra plotly on_select)
-        sel_state = st.session_state.get("map")
-        if sel_state and "selection" in sel_state:
-            pts = sel_state["selection"].get("points", [])
-            if pts:
-                chosen = pts[0].get("location")
-                if chosen:
-                    st.session_state.selected_area = chosen
-                    selected_area = chosen
-
-        # zoom
-        center = {"lat": 65, "lon": 12}
-        zoom = 4
-        if selected_area and selected_area in areas["ElSpotOmr"].values:
-            geom_sel = areas.loc[areas["ElSpotOmr"] == selected_area, "geometry"].iloc[0]
-            minx, miny, maxx, maxy = geom_sel.bounds
-            center = {"lat": (miny + maxy) / 2, "lon": (minx + maxx) / 2}
-            span = max(maxy - miny, maxx - minx)
-            zoom = 6 if span < 5 else 5
-
-        # Bruk geojson direkte (ikke areas.to_json())
-        fig = px.choropleth_mapbox(
-            areas,
-            geojson=geojson,
-            locations="ElSpotOmr",
-            featureidkey="properties.ElSpotOmr",
-            color="Gjennomsnitt (kWh)",
-            color_continuous_scale="Viridis",
-            mapbox_style="open-street-map",
-            zoom=zoom,
-            center=center,
-            opacity=0.6,
-        )
+    if df.empty:
+        st.error("Ingen data returnert fra MongoDB.")
+        st.stop()
 
-        fig.update_traces(
-            hovertemplate=(
-                "<b>Prisområde: %{location}</b><br>"
-                "Snitt: %{z:,.0f} kWh<br>"
-                "<extra></extra>"
-            )
-        )
+    df["start_time"] = pd.to_datetime(df["start_time"], errors="coerce")
+    df = df.dropna(subset=["start_time"])
 
-        # Usynlige punkter for klikk
-        fig.add_trace(go.Scattermapbox(
-            lat=areas["lat"],
-            lon=areas["lon"],
-            mode="markers",
-            marker=dict(size=25, opacity=0),
-            customdata=areas["ElSpotOmr"],
-            hoverinfo="none",
-            name="clickpoints"
-        ))
+    # Sikre energy_group finnes
+    if "energy_group" not in df.columns:
+        df["energy_group"] = df["production_group"]
+        df.loc[df["consumption_group"].notna(), "energy_group"] = df["consumption_group"]
 
-        # Highlight valgt område + lagre koordinat til SNOW
-        if selected_area and selected_area in areas["ElSpotOmr"].values:
-            geom_sel = areas.loc[areas["ElSpotOmr"] == selected_area, "geometry"].iloc[0]
-            c = areas.loc[areas["ElSpotOmr"] == selected_area].iloc[0]
-
-            # Finn riktig feature i geojson etter ElSpotOmr
-            selected_feature = next(
-                (
-                    f
-                    for f in geojson["features"]
-                    if f.get("properties", {}).get("ElSpotOmr") == selected_area
-                ),
-                None,
-            )
 
-            if selected_feature is not None:
-                js = {
-                    "type": "FeatureCollection",
-                    "features": [selected_feature],
-                }
-
-                # 🔴 Marker valgt polygon
-                fig.add_trace(go.Choroplethmapbox(
-                    geojson=js,
-                    locations=[selected_area],
-                    featureidkey="properties.ElSpotOmr",
-                    z=[1],
-                    showscale=False,
-                    marker_line_color="black",
-                    marker_line_width=5,
-                    marker_opacity=0
-                ))
-
-            # 🔴 Marker valgt centroid
-            fig.add_trace(go.Scattermapbox(
-                lat=[c["lat"]],
-                lon=[c["lon"]],
-                mode="markers",
-                marker=dict(size=18, color="red"),
-                name="Valgt område"
-            ))
-
-            # ⭐️ Viktig: lagre koordinat til SNOW-siden
-            st.session_state["selected_coord"] = {
-                "lat": float(c["lat"]),
-                "lon": float(c["lon"]),
-            }
-
-        fig.update_layout(height=650, margin=dict(l=0, r=0, t=0, b=0))
-        st.plotly_chart(fig, key="map", on_select="rerun", use_container_width=True)
-
-        # =====================================================================
-        # 9) DETALJER + TIDSSERIE
-        # =====================================================================
-
-        st.markdown("---")
-        st.subheader("📌 Detaljer for valgt område")
-
-        if selected_area and selected_area in stats.index:
-
-            row = stats.loc[selected_area]
-
-            st.metric(
-                label=f"Gjennomsnittlig energimengde i {selected_area}",
-                value=f"{row['Gjennomsnitt (kWh)']:,.0f} kWh"
-            )
+    # =====================================================================
+    # 🔀 VIEW-KONTROLL (erstatter TABS)
+    # =====================================================================
+    view = st.radio(
+        "Velg visning:",
+        ["🗺️ Kartanalyse", "❄️ Snow Drift"],
+        horizontal=True
+    )
 
-            st.write(f"Antall målinger: **{int(row['Antall målinger'])}**")
-            st.write(f"Min–maks: **{row['Laveste (kWh)']:,.0f} – {row['Høyeste (kWh)']:,.0f} kWh**")
-
-            df_ts = df[df["price_area"] == selected_area].copy()
-
-            if not df_ts.empty:
-                df_ts_daily = (
-                    df_ts.set_index("start_time")["quantity_kwh"]
-                    .resample("D").mean()
-                    .reset_index()
-                )
-
-                fig_ts = px.line(
-                    df_ts_daily,
-                    x="start_time",
-                    y="quantity_kwh",
-                    title=f"Daglig gjennomsnittlig energimengde – {selected_area}",
-                    labels={"start_time": "Dato", "quantity_kwh": "kWh"},
-                )
-                fig_ts.update_layout(height=350, margin=dict(l=0, r=0, t=30, b=0))
-                st.plotly_chart(fig_ts, use_container_width=True)
-            else:
-                st.info("Ingen tidsseriedata for dette området.")
 
-        else:
-            st.info("Klikk på et prisområde for å vise detaljer. "
-                    "Koordinaten brukes også på SNOW-siden.")
-                    
-
-        # =====================================================================
-        # 10) INFO-SEKSJONER
-        # =====================================================================
-
-        with st.expander("ℹ️ Hva betyr energigruppe?"):
-            st.markdown("""
-        En *energigruppe* beskriver **typen energi** som produseres eller forbrukes.
-
-        Vanlige grupper:
-        - 🔵 **hydro** – vannkraft  
-        - 🟢 **wind** – vindkraft  
-        - 🟠 **thermal** – varme, gass, biomasse  
-        - 🟣 **industry** – energibruk i industri  
-        - 🏠 **household** – energibruk i husholdninger  
-        - ⚙️ **other** – kategorier som ikke passer i andre grupper
-            """)
-
-        with st.expander("ℹ️ Hva er `kWh`?"):
-            st.markdown("""
-        `quantity_kwh` viser hvor mye energi (kWh) som er **produsert eller brukt i løpet av én time**.
-            """)
+
+    # =====================================================================
+    # 🗺️ VIEW 1 — KART
+    # =====================================================================
+    if view == "🗺️ Kartanalyse":
+        map_panel(df)
 
 
 
@@ -1,9 +1,14 @@
 # page_corr.py
 import streamlit as st
 import pandas as pd
+import numpy as np
 import plotly.express as px
+import plotly.graph_objects as go
 
-from functions.load_data import load_era5_raw, load_elhub_data
+from functions.alignment import aligned_weather_energy
+from functions.correlation import (
+    best_lag, lagged_corr_fft, rolling_corr_lags, rolling_corr_matrix, time_stride,
+)
 
 
 # ------------------------------------------------------------
@@ -19,6 +24,58 @@ def sliding_corr(df, met_var, energy_var, lag_hours, window):
     return pd.DataFrame({"time": df["time"], "corr": corr})
 
 
+# ------------------------------------------------------------
+# Lag-skann: alle lag i én beregning
+# ------------------------------------------------------------
+@st.cache_data(show_spinner="Beregner korrelasjon for alle lag ...")
+def lag_scan(x, y, max_lag, window):
+    """Global korrelasjon per lag (FFT) og lag × tid-matrise (kumulative summer)."""
+    lags, global_corr = lagged_corr_fft(x, y, max_lag)
+    matrix = rolling_corr_lags(x, y, lags, window)
+    best, best_corr = best_lag(lags, matrix)
+    return lags, global_corr, matrix, best, best_corr
+
+
+# ------------------------------------------------------------
+# Matrise: alle værvariabler × alle energiserier
+# ------------------------------------------------------------
+@st.cache_data(show_spinner="Beregner korrelasjonsmatrisen ...")
+def corr_cube(X, Y, window, lag):
+    """float32-kube (vær × energiserie × tid) og median korrelasjon per par."""
+    cube = rolling_corr_matrix(X, Y, window, lag)
+    return cube, np.nanmedian(cube, axis=-1)
+
+
+def lag_scan_figures(times, lags, global_corr, matrix, best, met_var, energy_var, window):
+    i = int(np.nanargmax(np.abs(global_corr)))
+    fig_global = px.line(
+        x=lags, y=global_corr,
+        labels={"x": "Lag (timer)", "y": "Korrelasjon"},
+        title=f"Korrelasjon over hele perioden per lag – sterkest ved lag {lags[i]} t (r = {global_corr[i]:.2f})",
+    )
+    fig_global.add_vline(x=lags[i], line_dash="dash", line_color="red")
+    fig_global.add_hline(y=0, line_dash="dash", line_color="gray")
+
+    # Heatmapen viser hver n-te tidskolonne; beste lag er beregnet på full oppløsning
+    step = time_stride(matrix.shape[1])
+    t = times[::step]
+    fig_heat = go.Figure(go.Heatmap(
+        x=t, y=lags, z=matrix[:, ::step],
+        colorscale="RdBu", zmid=0, zmin=-1, zmax=1,
+        colorbar=dict(title="r"),
+    ))
+    fig_heat.add_trace(go.Scatter(
+        x=t, y=best[::step], mode="markers", name="Beste lag per vindu",
+        marker=dict(color="black", size=3),
+    ))
+    fig_heat.update_layout(
+        title=f"Glidende korrelasjon ({window} t vindu) for alle lag: {met_var} vs {energy_var}",
+        xaxis_title="Tid (UTC)", yaxis_title="Lag (timer)",
+        template="plotly_white", legend=dict(orientation="h", y=-0.2),
+    )
+    return fig_global, fig_heat
+
+
 # ------------------------------------------------------------
 # MAIN PAGE
 # ------------------------------------------------------------
@@ -70,23 +127,18 @@ def show():
     # ------------------------------------------------------------
     # 2) Last værdata og energidata
     # ------------------------------------------------------------
+    # Sammenslått timetabell i UTC, bygget én gang per by og år; lag/vindu
+    # påvirker bare korrelasjonsberegningen under
     with st.status("Henter værdata og energidata...", expanded=False):
-        meteo = load_era5_raw(lat, lon, 2021)
-        energy = load_elhub_data()
-
-    meteo["time"] = pd.to_datetime(meteo["time"])
-    energy["start_time"] = pd.to_datetime(energy["start_time"])
-
-    # Aggregér energiproduksjon pr time
-    energy_hourly = (
-        energy.groupby("start_time")["quantity_kwh"]
-        .sum()
-        .reset_index()
-        .rename(columns={"start_time": "time", "quantity_kwh": "energy_kwh"})
-    )
+        try:
+            df, met_vars, energy_vars = aligned_weather_energy(lat, lon, 2021)
+        except Exception as e:
+            st.error(f"Kunne ikke hente værdata fra ERA5: {e}")
+            return
 
-    # Merge vær + energi
-    df = pd.merge(meteo, energy_hourly, on="time", how="inner").sort_values("time")
+    if df.empty:
+        st.warning("Fant ingen overlappende vær- og energidata.")
+        return
 
     # ------------------------------------------------------------
     # 3) Sidebar – velg parametere
@@ -95,9 +147,6 @@ def show():
 
     st.sidebar.markdown("Justér korrelasjonsanalysen:")
 
-    met_vars = [c for c in meteo.columns if c not in ["time"]]
-    energy_vars = ["energy_kwh"]
-
     # Meteorologisk variabel
     met_var = st.sidebar.selectbox(
         "🌦️ Meteorologisk variabel",
@@ -109,21 +158,32 @@ def show():
     energy_var = st.sidebar.selectbox(
         "⚡ Energivariabel",
         energy_vars,
-        help="Timeoppløst energiproduksjon akkumulert fra Elhub-data."
+        help="Timeoppløst energi fra Elhub: summen av alt, eller én serie per prisområde, kilde og gruppe."
     )
 
-    # Lag
-    lag = st.sidebar.slider(
-        "⏱️ Lag (timer)",
-        -72, 72, 0,
+    modus = st.sidebar.radio(
+        "🔍 Modus",
+        ["Ett lag", "Lag-skann (alle lag)", "Matrise (alle serier)"],
         help=(
-            "Forskyver energiserien i tid.\n\n"
-            "**Positiv lag (+24):** Været skjer FØR energiforbruket\n"
-            "**Negativ lag (–24):** Energiforbruket skjer FØR været\n"
-            "Bruk dette for å avdekke forsinkede effekter."
+            "Lag-skann beregner korrelasjonen for alle lag −72…72 på én gang og markerer beste lag.\n"
+            "Matrise beregner alle værvariabler mot alle energiserier i én beregning."
         )
     )
 
+    # Lag
+    lag = 0
+    if modus != "Lag-skann (alle lag)":
+        lag = st.sidebar.slider(
+            "⏱️ Lag (timer)",
+            -72, 72, 0,
+            help=(
+                "Forskyver energiserien i tid.\n\n"
+                "**Positiv lag (+24):** Været skjer FØR energiforbruket\n"
+                "**Negativ lag (–24):** Energiforbruket skjer FØR været\n"
+                "Bruk dette for å avdekke forsinkede effekter."
+            )
+        )
+
     # Vindu
     window = st.sidebar.slider(
         "📏 Vindu (timer)",
@@ -138,7 +198,15 @@ def show():
     # ------------------------------------------------------------
     # 4) Beregn korrelasjon
     # ------------------------------------------------------------
-    corr_df = sliding_corr(df, met_var, energy_var, lag, window)
+    if modus == "Ett lag":
+        corr_df = sliding_corr(df, met_var, energy_var, lag, window)
+    elif modus == "Matrise (alle serier)":
+        # Én beregning for hele matrisen; valg i sidefeltet er bare oppslag i kuben
+        cube, median_corr = corr_cube(
+            df[met_vars].to_numpy(dtype=float).T, df[energy_vars].to_numpy(dtype=float).T, window, lag
+        )
+        i, j = met_vars.index(met_var), energy_vars.index(energy_var)
+        corr_df = pd.DataFrame({"time": df["time"], "corr": cube[i, j]})
 
     # ------------------------------------------------------------
     # 5) Plot korrelasjon
@@ -157,15 +225,46 @@ def show():
         """
     )
 
-    fig = px.line(
-        corr_df,
-        x="time",
-        y="corr",
-        title=f"Korrelasjon mellom {met_var} og {energy_var} (lag={lag}t, vindu={window}t)",
-        labels={"corr": "Korrelasjon", "time": "Tid"}
-    )
-    fig.add_hline(y=0, line_dash="dash", line_color="gray")
-    st.plotly_chart(fig, use_container_width=True)
+    if modus != "Lag-skann (alle lag)":
+        fig = px.line(
+            corr_df,
+            x="time",
+            y="corr",
+            title=f"Korrelasjon mellom {met_var} og {energy_var} (lag={lag}t, vindu={window}t)",
+            labels={"corr": "Korrelasjon", "time": "Tid (UTC)"}
+        )
+        fig.add_hline(y=0, line_dash="dash", line_color="gray")
+        st.plotly_chart(fig, use_container_width=True)
+
+    if modus == "Matrise (alle serier)":
+        fig_matrix = px.imshow(
+            median_corr, x=energy_vars, y=met_vars,
+            color_continuous_scale="RdBu", zmin=-1, zmax=1, aspect="auto",
+            labels={"color": "Median r"},
+            title=f"Median glidende korrelasjon for alle par (lag={lag}t, vindu={window}t)",
+        )
+        st.plotly_chart(fig_matrix, use_container_width=True)
+        st.caption("Velg en celle i sidefeltet (vær- og energivariabel) for å se korrelasjonen over tid.")
+    elif modus == "Lag-skann (alle lag)":
+        lags, global_corr, matrix, best, _ = lag_scan(
+            df[met_var].to_numpy(dtype=float), df[energy_var].to_numpy(dtype=float), 72, window
+        )
+        # Konstant serie eller for få overlappende timer: ingen lag har en korrelasjon
+        if not np.isfinite(global_corr).any():
+            st.info(
+                f"Korrelasjonen kan ikke beregnes for noe lag: {met_var} eller {energy_var} er konstant "
+                "eller har for få overlappende timer i perioden."
+            )
+        else:
+            fig_global, fig_heat = lag_scan_figures(
+                df["time"].to_numpy(), lags, global_corr, matrix, best, met_var, energy_var, window
+            )
+            st.plotly_chart(fig_global, use_container_width=True)
+            st.plotly_chart(fig_heat, use_container_width=True)
+            st.caption(
+                "Svarte punkter viser laget med sterkest |korrelasjon| i hvert vindu. "
+                "Rødt = positiv, blått = negativ sammenheng."
+            )
 
     # ------------------------------------------------------------
     # 6) Vis rå tidsserier
@@ -6,39 +6,21 @@ import numpy as np
 import plotly.graph_objects as go
 
 from datetime import timedelta
-from statsmodels.tsa.statespace.sarimax import SARIMAX
-from functions.load_data import load_elhub_data
+from functions import forecast_batch
+from functions.backtest import run_backtest
+from functions.forecasting import (
+    BASELINES, FIT_WORKERS, FOURIER_HARMONICS, MAX_FOURIER_SAMPLES, auto_order, baseline_season, fit_queue,
+    fitted_model, forecast, queue_fit, rolling_forecaster, tiered_forecasts,
+)
+from functions.job_queue import ACTIVE
+from functions.series_store import elhub_series_store
+from functions.zoom import zoomable_chart
 
 
 # ==============================================================
 #  HJELPEFUNKSJONER
 # ==============================================================
 
-def prepare_series(df: pd.DataFrame, price_area: str, source: str | None = None) -> pd.Series:
-    """
-    Hent timesaggregert tidsserie (kWh) for valgt prisområde og kilde (production/consumption/None).
-    Hvis source=None, brukes både produksjon og forbruk samlet.
-    """
-    df = df.copy()
-    df["start_time"] = pd.to_datetime(df["start_time"], errors="coerce")
-    df = df.dropna(subset=["start_time", "quantity_kwh"])
-    df = df.sort_values("start_time")
-
-    if "price_area" in df.columns:
-        df = df[df["price_area"] == price_area]
-
-    if source is not None and "source" in df.columns:
-        df = df[df["source"] == source]
-
-    ts = (
-        df.set_index("start_time")["quantity_kwh"]
-        .resample("H")
-        .sum()
-        .dropna()
-    )
-    return ts
-
-
 def limit_training_series(y: pd.Series, max_samples: int = 5000) -> pd.Series:
     """Begrenser treningsdatasettet til de siste max_samples punktene om det er for stort."""
     if len(y) > max_samples:
@@ -50,23 +32,613 @@ def limit_training_series(y: pd.Series, max_samples: int = 5000) -> pd.Series:
     return y
 
 
-def fit_sarimax(y_train: pd.Series, order: tuple, seasonal_order: tuple):
-    """Tren en SARIMAX-modell med robuste default-innstillinger."""
-    model = SARIMAX(
-        y_train,
-        order=order,
-        seasonal_order=seasonal_order,
-        enforce_stationarity=False,
-        enforce_invertibility=False,
-        simple_differencing=True,
-        use_exact_diffuse=False,
+MODEL_STATUS = {
+    "minne": "♻️ Modell gjenbrukt fra minnet (bare forecast beregnet)",
+    "disk": "💾 Parametere hentet fra modellcachen (ingen ny optimering)",
+    "varmstart": "🔥 Varmstartet fra forrige tilpassede parametere",
+    "kald": "🆕 Modell trent fra bunnen av",
+}
+
+ROLLING_STATUS = {
+    "uendret": "⏸ Ingen nye timer siden forrige oppdatering",
+    "filtrert": "🔄 Nye timer lagt til med Kalman-filtrering (ingen ny estimering)",
+    "refit_plan": "🗓 Parametere estimert på nytt (planlagt, varmstart)",
+    "refit_drift": "⚠️ Drift oppdaget – parametere estimert på nytt (varmstart)",
+    "refit_venter": "⏳ Parametere estimeres på nytt i bakgrunnen – filtrert modell brukes til da",
+    "refit_feil": "❌ Ny estimering feilet – beholder forrige parametere (filtrert)",
+}
+
+
+TIER_LABELS = {
+    "sesongnaiv": "📏 Sesongnaiv (siste sesong gjentatt)",
+    "ets": "📉 Holt-Winters (ETS)",
+    "sarimax": "🤖 SARIMAX",
+}
+
+TIER_NAMES = {"sesongnaiv": "Sesongnaiv", "ets": "ETS", "sarimax": "SARIMAX"}
+
+
+JOB_STATES = {"feil": "feilet", "avbrutt": "ble avbrutt"}
+
+
+def avbryt_trening(job_ids=()):
+    for job_id in job_ids:
+        fit_queue.cancel(job_id)
+    st.session_state["forecast_spec"] = None
+
+
+def job_text(job):
+    if job["tilstand"] == "i kø":
+        return f"i kø (plass {job['plass']}, venter {job['ventetid']:.0f} s)"
+    if job["tilstand"] == "kjører":
+        return f"iterasjon {job['fremdrift'] or 0} ({job['kjøretid']:.0f} s)"
+    return job["tilstand"]
+
+
+@st.fragment(run_every=1)
+def job_progress(pending):
+    """
+    Fremdrift for SARIMAX-jobbene {etikett: jobb-ID} i køen. Bare fragmentet
+    oppdateres; når ingen jobber venter eller kjører, kjøres siden på nytt
+    (da ligger modellene i modellcachen).
+    """
+    jobs = {label: fit_queue.status(job_id) for label, job_id in pending.items()}
+    if not any(job is not None and job["tilstand"] in ACTIVE for job in jobs.values()):
+        st.rerun(scope="app")
+
+    for label, job in jobs.items():
+        if job is None:
+            continue
+        st.progress(min((job["fremdrift"] or 0) / 200, 0.95), text=f"{label}: {job_text(job)}")
+    counts = fit_queue.counts()
+    st.caption(
+        f"Jobbkø: {counts.get('kjører', 0)} kjører, {counts.get('i kø', 0)} i kø "
+        f"(maks {FIT_WORKERS} samtidig, delt mellom alle brukere)."
+    )
+
+
+SOURCE_LABELS = {"production": "Produksjon", "consumption": "Forbruk"}
+
+
+def search_series(store, price_area, energy_mode, train_start, train_end):
+    """Treningsseriene ordresøket bruker (samme felles tidsakse som «Begge»)."""
+    sources = ["production", "consumption"] if energy_mode == "both" else [energy_mode]
+    series = {source: store.series(price_area, source) for source in sources}
+    common = store.common_index(price_area) if energy_mode == "both" else series[energy_mode].index
+    common = common[(common.date >= train_start) & (common.date <= train_end)]
+    return {source: y.reindex(common) for source, y in series.items()}
+
+
+def run_order_search(train, price_area, seasonal_period, criterion, budget_s, harmonics=()):
+    """Automatisk ordresøk per serie med fremdrift; budsjettet deles mellom seriene."""
+    bar = st.progress(0.0, text="Velger differensiering (KPSS) ...")
+    reports = {}
+    for i, (source, y_train) in enumerate(train.items()):
+        def vis_fremdrift(trinn, ferdige, totalt):
+            andel = (i + (0.5 * (trinn - 1) + 0.5 * ferdige / max(totalt, 1))) / len(train)
+            bar.progress(min(andel, 1.0), text=(
+                f"{SOURCE_LABELS[source]}: trinn {trinn} ({'kort' if trinn == 1 else 'fullt'} vindu) "
+                f"– {ferdige}/{totalt} kandidater"
+            ))
+
+        reports[source] = auto_order(
+            y_train, price_area, source, s=seasonal_period, criterion=criterion,
+            budget_s=budget_s / len(train), on_progress=vis_fremdrift, harmonics=harmonics,
+            max_workers=FIT_WORKERS,
+        )
+    bar.empty()
+    return reports
+
+
+def show_order_search(reports, criterion):
+    for source, report in reports.items():
+        st.success(
+            f"**{SOURCE_LABELS[source]}:** beste modell SARIMAX{report['order']}×{report['seasonal_order']} "
+            f"etter {criterion.upper()} (d={report['d']} fra KPSS, parametere fra {report['kilde']})"
+        )
+        cols = st.columns(len(report["tider"]))
+        for col, (name, seconds) in zip(cols, report["tider"].items()):
+            col.metric(name, f"{seconds:.1f} s")
+        with st.expander(f"📋 Kandidater – {SOURCE_LABELS[source]}"):
+            table = report["kandidater"].copy()
+            table["order"] = table["order"].astype(str)
+            table["seasonal_order"] = table["seasonal_order"].astype(str)
+            st.dataframe(table, use_container_width=True, hide_index=True)
+
+
+def run_models(jobs, horizon_hours, budget_s, retry=False):
+    """
+    Modeller for alle jobber. SARIMAX tilpasses i jobbkøen (egne prosesser), så
+    skripttråden venter høyst tidsbudsjettet. Med budsjett: beste modellnivå som
+    ble ferdig (tiered_forecasts); uten: fremdriften vises til SARIMAX er ferdig.
+    retry=True starter feilede jobber på nytt (ny trykk på «Tren»).
+    Returnerer {etikett: nivå-dict} som tiered_forecasts, eller None mens SARIMAX
+    tilpasses eller om jobben feilet.
+    """
+    if not budget_s:
+        queued = {label: queue_fit(*job, retry=retry) for label, job in jobs.items()}
+        pending = {label: job_id for label, (result, _, job_id) in queued.items() if result is None}
+        if not pending:
+            return {
+                label: {"nivå": "sarimax", "prognose": None, "resultat": result, "status": status,
+                        "tider": {}, "bakgrunn": None}
+                for label, (result, status, _) in queued.items()
+            }
+
+        stopped = {label: fit_queue.status(job_id) for label, job_id in pending.items()}
+        if any(job is None for job in stopped.values()):
+            # Ryddet bort fra køen i mellomtiden: neste kjøring finner modellen i cachen
+            # eller legger jobben i køen på nytt
+            st.rerun()
+        stopped = {label: job for label, job in stopped.items() if job["tilstand"] not in ACTIVE}
+        for label, job in stopped.items():
+            detail = f": {job['feil']}" if job["feil"] else ""
+            st.error(f"{label}: SARIMAX-tilpasningen {JOB_STATES.get(job['tilstand'], job['tilstand'])}{detail}. "
+                     "Trykk «Tren» for å prøve igjen.")
+        if not stopped:
+            st.button("⏹ Avbryt trening", on_click=avbryt_trening, args=(list(pending.values()),),
+                      help="Stopper tilpasningen, også om den allerede kjører.")
+            job_progress(pending)
+        return None
+
+    tiers = tiered_forecasts(jobs, horizon_hours, budget_s, retry=retry)
+    running = {label: tier["bakgrunn"] for label, tier in tiers.items() if tier["bakgrunn"] is not None}
+    if any(tier["prognose"] is None and tier["resultat"] is None for tier in tiers.values()):
+        st.info("⏳ Ingen referansemodell kunne lages for denne serien. Venter på SARIMAX i jobbkøen; "
+                "siden oppdateres automatisk når modellen er klar.")
+        job_progress(running)
+        return None
+    if running:
+        st.info("⏳ SARIMAX ble ikke ferdig innen tidsbudsjettet og tilpasses videre i jobbkøen. "
+                "Siden oppdateres automatisk når modellen er klar.")
+        job_progress(running)
+    return tiers
+
+
+def tier_timing(tider):
+    return " · ".join(
+        f"{TIER_NAMES[tier]} {value:.2f} s" if isinstance(value, float) else f"{TIER_NAMES[tier]}: {value}"
+        for tier, value in tider.items()
+    )
+
+
+def model_forecast(y, y_train, price_area, source, order, seasonal_order, rullerende, tier, harmonics,
+                   horizon_hours):
+    """
+    Prognose for serien fra nivået run_models valgte.
+    Med rullerende origo regnes også referansemodellene på vinduet frem til
+    siste time, så alle seriene (og nettolasten) får samme origo.
+    Returnerer (SARIMAX-resultat eller None, prognose, historikk, statustekst).
+    """
+    if tier["resultat"] is None:
+        if not rullerende:
+            text = f"{TIER_LABELS[tier['nivå']]} på treningsperioden · {tier_timing(tier['tider'])}"
+            return None, tier["prognose"], y_train, text
+
+        hist = y[y.index >= y_train.index[0]].iloc[-len(y_train):]
+        method = BASELINES[tier["nivå"]]
+        prognose = method(hist, horizon_hours, baseline_season(seasonal_order, harmonics))
+        text = (f"{TIER_LABELS[tier['nivå']]} rullert til {hist.index[-1]:%Y-%m-%d %H:%M} · "
+                f"{tier_timing(tier['tider'])}")
+        return None, prognose, hist, text
+
+    result, hist, text = train_or_roll(
+        y, y_train, price_area, source, order, seasonal_order, rullerende,
+        (tier["resultat"], tier["status"]), harmonics,
+    )
+    if tier["tider"]:
+        text += f" · {tier_timing(tier['tider'])}"
+    return result, forecast(result, horizon_hours), hist, text
+
+
+def show_backtest(report):
+    timing = report["tider"]
+    c1, c2, c3, c4 = st.columns(4)
+    c1.metric("Veggklokke", f"{timing['veggklokke']:.1f} s")
+    c2.metric("CPU-tid tilpasning", f"{timing['CPU-tid tilpasning']:.1f} s")
+    c3.metric("CPU-tid prognoser", f"{timing['CPU-tid prognoser']:.1f} s")
+    c4.metric("Origoer / arbeidere", f"{timing['origoer']} / {timing['arbeidere']}")
+
+    per_horizon = report["per_horisont"]
+    fig = go.Figure()
+    fig.add_trace(go.Scatter(x=per_horizon["horisont"], y=per_horizon["MAE"], mode="lines", name="MAE (kWh)"))
+    fig.add_trace(go.Scatter(
+        x=per_horizon["horisont"], y=per_horizon["MAPE (%)"], mode="lines", name="MAPE (%)", yaxis="y2",
+    ))
+    fig.update_layout(
+        height=350, title="Feil per horisont", xaxis_title="Horisont (timer)", yaxis_title="MAE (kWh)",
+        yaxis2=dict(title="MAPE (%)", overlaying="y", side="right"), hovermode="x unified",
+    )
+    st.plotly_chart(fig, use_container_width=True)
+
+    fig_cov = go.Figure(go.Scatter(
+        x=per_horizon["horisont"], y=per_horizon["dekning 95 % (%)"], mode="lines", name="Dekning",
+    ))
+    fig_cov.add_hline(y=95, line_dash="dash", line_color="gray")
+    fig_cov.update_layout(
+        height=300, title="Andel fasit innenfor 95 %-intervallet", xaxis_title="Horisont (timer)",
+        yaxis_title="Dekning (%)",
+    )
+    st.plotly_chart(fig_cov, use_container_width=True)
+
+    st.markdown("**Tid per tilpasning (sekunder)**")
+    st.dataframe(timing["per tilpasning"], use_container_width=True, hide_index=True)
+    with st.expander("📋 Per origo"):
+        st.dataframe(report["per_origo"], use_container_width=True, hide_index=True)
+
+
+BATCH_SERIES = {
+    "production": ("Produksjon", "green", "rgba(0, 128, 0, 0.12)"),
+    "consumption": ("Forbruk", "red", "rgba(255, 0, 0, 0.12)"),
+    "net": ("Nettolast (forbruk − produksjon)", "gray", "rgba(128, 128, 128, 0.12)"),
+}
+
+
+@st.cache_data(show_spinner=False)
+def load_batch_forecasts(price_area, versjon):
+    """Lagrede prognoser fra batchjobben; versjon (filens mtime) ugyldiggjør cachen."""
+    return forecast_batch.load_forecasts(price_area)
+
+
+@st.fragment
+def batch_panel(store, price_area):
+    st.markdown("### 📦 Siste planlagte forecast")
+    st.caption(
+        "Lages av en batchjobb for alle prisområder (`python -m functions.forecast_batch 6` kjører hver 6. time) "
+        f"med standardmodellen {forecast_batch.model_label()}. Egne parametere tilpasses lenger ned."
     )
-    result = model.fit(
-        disp=False,
-        method="lbfgs",
-        maxiter=200,
+
+    if st.button("▶️ Kjør batchjobb nå (alle prisområder)"):
+        with st.spinner("Tilpasser og lager prognoser for alle områder i parallell ..."):
+            paths = forecast_batch.run_batch(store, max_workers=FIT_WORKERS)
+        st.success(f"Lagret {len(paths)} filer.")
+
+    if price_area not in forecast_batch.available():
+        st.info(f"Ingen lagret prognose for {price_area} ennå.")
+        return
+
+    versjon = forecast_batch.store_path(price_area).stat().st_mtime
+    frame = load_batch_forecasts(price_area, versjon)
+
+    fig = go.Figure()
+    for series, (label, color, fill) in BATCH_SERIES.items():
+        part = frame[frame["series"] == series]
+        if part.empty:
+            continue
+        fig.add_trace(go.Scatter(
+            x=pd.concat([part["time"], part["time"][::-1]]),
+            y=pd.concat([part["lower"], part["upper"][::-1]]),
+            fill="toself", fillcolor=fill, line=dict(color="rgba(0,0,0,0)"),
+            name=f"Konfidensintervall {label.split(' ')[0].lower()}", showlegend=False,
+        ))
+        fig.add_trace(go.Scatter(
+            x=part["time"], y=part["mean"], mode="lines", name=label, line=dict(color=color),
+        ))
+    fig.update_layout(
+        height=450, hovermode="x unified", xaxis_title="Tid", yaxis_title="kWh",
+        title=f"Planlagt forecast – {price_area} (origo {frame['origin'].iloc[0]:%Y-%m-%d %H:%M})",
+        legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="center", x=0.5),
     )
-    return result
+    st.plotly_chart(fig, use_container_width=True)
+    st.caption(f"Kjørt {frame['run_time'].iloc[0]:%Y-%m-%d %H:%M}.")
+
+
+def train_or_roll(y, y_train, price_area, source, order, seasonal_order, rullerende, fitted=None, harmonics=()):
+    """
+    Modell for serien: enten tilpasset på treningsperioden, eller (rullerende)
+    oppdatert med alle nyere timer. fitted er (resultat, status) fra run_models.
+    Returnerer (resultat, historikk, statustekst).
+    """
+    if rullerende:
+        forecaster, status = rolling_forecaster(
+            y, y_train, price_area, source, order, seasonal_order, harmonics, result=fitted and fitted[0],
+        )
+        text = f"{ROLLING_STATUS[status]} · origo {forecaster.last_time:%Y-%m-%d %H:%M}"
+        return forecaster.result, forecaster.history, text
+
+    result, status = fitted or fitted_model(y_train, price_area, source, order, seasonal_order, harmonics)
+    return result, y_train, MODEL_STATUS[status]
+
+
+def show_forecast(store, price_area, energy_mode, energy_choice_label, train_start, train_end, horizon_hours,
+                  max_samples, orders, harmonics, rullerende, budget_s, retrain):
+    """
+    Tren (eller hent) modellene og vis forecasten. return her avslutter bare
+    denne delen, så resten av siden (backtest) vises også mens modellene står
+    i jobbkøen eller ved feil.
+    """
+    with st.spinner("Trener modell og lager forecast ..."):
+
+        try:
+            # ------------------------------------------------
+            # CASE 1 & 2: kun produksjon ELLER kun forbruk
+            # ------------------------------------------------
+            if energy_mode in ("production", "consumption"):
+
+                y = store.series(price_area, energy_mode)
+                if y.empty:
+                    st.error(f"Ingen data for valgt energitype ({energy_mode}) i dette prisområdet.")
+                    return
+
+                y_train = y[(y.index.date >= train_start) & (y.index.date <= train_end)]
+                if y_train.empty:
+                    st.error("Ingen data i valgt treningsperiode.")
+                    return
+
+                y_train = limit_training_series(y_train, max_samples=max_samples)
+                order, seasonal_order = orders[energy_mode]
+                tiers = run_models(
+                    {"Modell": (y_train, price_area, energy_mode, order, seasonal_order, harmonics)},
+                    horizon_hours, budget_s, retry=retrain,
+                )
+                if tiers is None:
+                    return
+
+                result, forecast_res, y_hist, status_text = model_forecast(
+                    y, y_train, price_area, energy_mode, order, seasonal_order, rullerende,
+                    tiers["Modell"], harmonics, horizon_hours,
+                )
+                model_name = TIER_NAMES[tiers["Modell"]["nivå"]]
+                st.caption(status_text)
+
+                # Forecast-tidspunkter
+                future_index = pd.date_range(
+                    start=y_hist.index[-1] + timedelta(hours=1),
+                    periods=horizon_hours,
+                    freq="h",
+                )
+
+                forecast_mean = forecast_res.predicted_mean
+                forecast_ci = forecast_res.conf_int()
+
+                # Plot
+                st.markdown("### 📊 Forecast-resultat")
+
+                label_hist = "Historisk produksjon" if energy_mode == "production" else "Historisk forbruk"
+                label_fc = "Forecast produksjon" if energy_mode == "production" else "Forecast forbruk"
+
+                # Hele treningsperioden vises; zoom henter timesoppløsning
+                hist_df = pd.DataFrame({"time": y_hist.index, "kwh": y_hist.values})
+
+                def build_forecast_figure(hist_view):
+                    fig = go.Figure()
+
+                    fig.add_trace(go.Scatter(
+                        x=hist_view["time"],
+                        y=hist_view["kwh"],
+                        mode="lines",
+                        name=label_hist,
+                        line=dict(color="black")
+                    ))
+
+                    fig.add_trace(go.Scatter(
+                        x=forecast_mean.index,
+                        y=forecast_mean.values,
+                        mode="lines",
+                        name=label_fc,
+                        line=dict(color="blue")
+                    ))
+
+                    fig.add_trace(go.Scatter(
+                        x=forecast_mean.index.tolist() + forecast_mean.index[::-1].tolist(),
+                        y=forecast_ci.iloc[:, 0].tolist() + forecast_ci.iloc[:, 1][::-1].tolist(),
+                        fill="toself",
+                        fillcolor="rgba(0, 0, 255, 0.15)",
+                        line=dict(color="rgba(0,0,0,0)"),
+                        name="Konfidensintervall",
+                    ))
+
+                    fig.update_layout(
+                        height=500,
+                        hovermode="x unified",
+                        title=f"{model_name}-forecast for {energy_choice_label} – {price_area}",
+                        xaxis_title="Tid",
+                        yaxis_title="kWh",
+                    )
+                    return fig
+
+                zoomable_chart(
+                    f"forecast_{energy_mode}_{price_area}",
+                    hist_df,
+                    time_col="time",
+                    value_cols="kwh",
+                    build_figure=build_forecast_figure,
+                )
+
+                with st.expander("📄 Modellinfo (summary)"):
+                    if result is None:
+                        st.write("Referansemodell – SARIMAX-summary vises når modellen er ferdig.")
+                    else:
+                        st.text(result.summary())
+
+            # ------------------------------------------------
+            # CASE 3: begge – produksjon + forbruk + nettolast
+            # ------------------------------------------------
+            elif energy_mode == "both":
+                y_prod = store.series(price_area, "production")
+                y_cons = store.series(price_area, "consumption")
+
+                if y_prod.empty or y_cons.empty:
+                    st.error("Mangler enten produksjons- eller forbruksdata i dette området.")
+                    return
+
+                # Felles tidsakse (forhåndsberegnet i lageret)
+                common_index = store.common_index(price_area)
+                if common_index.empty:
+                    st.error("Fant ingen felles tidsstempler mellom produksjon og forbruk.")
+                    return
+
+                y_prod = y_prod.reindex(common_index)
+                y_cons = y_cons.reindex(common_index)
+
+                # Filtrer på treningsperiode
+                mask = (common_index.date >= train_start) & (common_index.date <= train_end)
+                common_index_train = common_index[mask]
+
+                y_prod_train = y_prod.reindex(common_index_train)
+                y_cons_train = y_cons.reindex(common_index_train)
+
+                if y_prod_train.empty or y_cons_train.empty:
+                    st.error("Ingen overlappende produksjons-/forbruksdata i valgt treningsperiode.")
+                    return
+
+                # Begrens størrelse
+                y_prod_train = limit_training_series(y_prod_train, max_samples=max_samples)
+                y_cons_train = limit_training_series(y_cons_train, max_samples=max_samples)
+
+                # Tren to modeller samtidig (resultatene havner i modellcachen)
+                tiers = run_models({
+                    "Produksjon": (y_prod_train, price_area, "production", *orders["production"], harmonics),
+                    "Forbruk": (y_cons_train, price_area, "consumption", *orders["consumption"], harmonics),
+                }, horizon_hours, budget_s, retry=retrain)
+                if tiers is None:
+                    return
+                result_prod, fc_prod_res, hist_prod, status_prod = model_forecast(
+                    y_prod, y_prod_train, price_area, "production", *orders["production"], rullerende,
+                    tiers["Produksjon"], harmonics, horizon_hours,
+                )
+                result_cons, fc_cons_res, hist_cons, status_cons = model_forecast(
+                    y_cons, y_cons_train, price_area, "consumption", *orders["consumption"], rullerende,
+                    tiers["Forbruk"], harmonics, horizon_hours,
+                )
+                model_name = " / ".join(dict.fromkeys(TIER_NAMES[t["nivå"]] for t in tiers.values()))
+                st.caption(f"Produksjon: {status_prod} · Forbruk: {status_cons}")
+
+                # Felles historikk (treningsperioden, eller rullert frem til siste time)
+                hist_index = hist_prod.index.intersection(hist_cons.index)
+                hist_prod = hist_prod.reindex(hist_index)
+                hist_cons = hist_cons.reindex(hist_index)
+
+                # Forecast-tidspunkter (bruk felles slutt)
+                last_time = hist_index[-1]
+                future_index = pd.date_range(
+                    start=last_time + timedelta(hours=1),
+                    periods=horizon_hours,
+                    freq="h",
+                )
+
+                fc_prod_mean = fc_prod_res.predicted_mean
+                fc_cons_mean = fc_cons_res.predicted_mean
+
+                fc_prod_ci = fc_prod_res.conf_int()
+                fc_cons_ci = fc_cons_res.conf_int()
+
+                # Nettolast: forbruk - produksjon
+                net_hist = hist_cons - hist_prod
+                net_fc = fc_cons_mean - fc_prod_mean
+
+                # Plot
+                st.markdown("### 📊 Forecast-resultat – produksjon, forbruk og nettolast")
+
+                # Hele treningsperioden vises; zoom henter timesoppløsning
+                hist_df = pd.DataFrame({
+                    "time": hist_index,
+                    "prod": hist_prod.values,
+                    "cons": hist_cons.values,
+                    "net": net_hist.values,
+                })
+
+                def build_forecast_figure(hist_view):
+                    fig = go.Figure()
+
+                    # Historikk
+                    fig.add_trace(go.Scatter(
+                        x=hist_view["time"],
+                        y=hist_view["prod"],
+                        mode="lines",
+                        name="Historisk produksjon",
+                        line=dict(color="green")
+                    ))
+                    fig.add_trace(go.Scatter(
+                        x=hist_view["time"],
+                        y=hist_view["cons"],
+                        mode="lines",
+                        name="Historisk forbruk",
+                        line=dict(color="red")
+                    ))
+                    fig.add_trace(go.Scatter(
+                        x=hist_view["time"],
+                        y=hist_view["net"],
+                        mode="lines+markers",
+                        name="Historisk nettolast (forbruk − produksjon)",
+                        line=dict(color="gray", dash="dot"),
+                        opacity=0.7
+                    ))
+
+                    # Forecast-linjer
+                    fig.add_trace(go.Scatter(
+                        x=fc_prod_mean.index,
+                        y=fc_prod_mean.values,
+                        mode="lines",
+                        name="Forecast produksjon",
+                        line=dict(color="green", dash="dash")
+                    ))
+                    fig.add_trace(go.Scatter(
+                        x=fc_cons_mean.index,
+                        y=fc_cons_mean.values,
+                        mode="lines",
+                        name="Forecast forbruk",
+                        line=dict(color="red", dash="dash")
+                    ))
+                    fig.add_trace(go.Scatter(
+                        x=net_fc.index,
+                        y=net_fc.values,
+                        mode="lines+markers",
+                        name="Forecast nettolast (forbruk − produksjon)",
+                        line=dict(color="gray", dash="dashdot"),
+                        opacity=0.9
+                    ))
+
+                    # Konfidensintervall for produksjon
+                    fig.add_trace(go.Scatter(
+                        x=fc_prod_mean.index.tolist() + fc_prod_mean.index[::-1].tolist(),
+                        y=fc_prod_ci.iloc[:, 0].tolist() + fc_prod_ci.iloc[:, 1][::-1].tolist(),
+                        fill="toself",
+                        fillcolor="rgba(0, 128, 0, 0.12)",
+                        line=dict(color="rgba(0,0,0,0)"),
+                        name="Konfidensintervall produksjon",
+                        showlegend=True,
+                    ))
+
+                    # Konfidensintervall for forbruk
+                    fig.add_trace(go.Scatter(
+                        x=fc_cons_mean.index.tolist() + fc_cons_mean.index[::-1].tolist(),
+                        y=fc_cons_ci.iloc[:, 0].tolist() + fc_cons_ci.iloc[:, 1][::-1].tolist(),
+                        fill="toself",
+                        fillcolor="rgba(255, 0, 0, 0.12)",
+                        line=dict(color="rgba(0,0,0,0)"),
+                        name="Konfidensintervall forbruk",
+                        showlegend=True,
+                    ))
+
+                    fig.update_layout(
+                        height=550,
+                        hovermode="x unified",
+                        title=f"{model_name}-forecast – produksjon, forbruk og nettolast – {price_area}",
+                        xaxis_title="Tid",
+                        yaxis_title="kWh",
+                        legend=dict(orientation="h", yanchor="bottom", y=1.02,
+                                    xanchor="center", x=0.5),
+                    )
+                    return fig
+
+                zoomable_chart(
+                    f"forecast_both_{price_area}",
+                    hist_df,
+                    time_col="time",
+                    value_cols=["prod", "cons", "net"],
+                    build_figure=build_forecast_figure,
+                )
+
+                for name, res in (("produksjon", result_prod), ("forbruk", result_cons)):
+                    with st.expander(f"📄 Modellinfo (summary) – {name}"):
+                        if res is None:
+                            st.write("Referansemodell – SARIMAX-summary vises når modellen er ferdig.")
+                        else:
+                            st.text(res.summary())
+
+        except Exception as e:
+            st.error(f"Feil under modelltrening eller forecasting: {e}")
 
 
 # ==============================================================
@@ -80,7 +652,7 @@ def show():
     st.warning(
         """
         **Stabilitetsbegrensninger i denne appen:**
-        - Maks **5000 treningspunkter** per modell
+        - Maks **5000 treningspunkter** per modell (ca. 5 år i rask sesongmodus)
         - Summen **p+q+P+Q ≤ 10**
         - Maks sesonglengde: **168 timer**
         - Anbefalt treningsperiode: **30–60 dager**
@@ -113,17 +685,14 @@ def show():
     # ------------------------------------------------------------
     # Hent data og velg prisområde / energitype
     # ------------------------------------------------------------
-    df_raw = load_elhub_data()
+    # Timeseriene for alle områder og kilder bygges én gang per datalast
+    store = elhub_series_store()
 
-    if df_raw.empty:
+    if store.empty:
         st.error("Ingen data tilgjengelig fra Elhub.")
         return
 
-    if "price_area" not in df_raw.columns:
-        st.error("Kolonnen 'price_area' mangler i Elhub-data.")
-        return
-
-    areas = sorted(df_raw["price_area"].dropna().unique())
+    areas = store.areas
 
     col_top1, col_top2 = st.columns(2)
     with col_top1:
@@ -166,11 +735,13 @@ def show():
             """
         )
 
+    batch_panel(store, price_area)
+
     # ------------------------------------------------------------
     # Treningsperiode
     # ------------------------------------------------------------
     # Vi trenger først en "referanseserie" for å finne min/max-dato
-    ref_series = prepare_series(df_raw, price_area, source=None)
+    ref_series = store.series(price_area)
     if ref_series.empty:
         st.error("Ingen energidata tilgjengelig for valgt prisområde.")
         return
@@ -227,6 +798,26 @@ def show():
         with c7:
             Q = st.number_input("Q (sesong-MA)", min_value=0, max_value=3, value=0)
 
+        fourier = st.toggle(
+            "⚡ Rask sesongmodus (Fourier-ledd for døgn og uke)",
+            help=(
+                "Døgn- og ukesesong modelleres som sin/cos-ledd med et ARIMA(p,d,q)-feilledd "
+                "i stedet for sesong-ARIMA. P, D, Q og s over brukes ikke. Mye raskere enn "
+                "s=168, og treningsperioden kan være flere år."
+            ),
+        )
+        harmonics = ()
+        if fourier:
+            default_k = dict(FOURIER_HARMONICS)
+            cf1, cf2 = st.columns(2)
+            with cf1:
+                k_day = st.number_input("K døgn (sin/cos-par, periode 24 t)", min_value=0, max_value=11,
+                                        value=default_k[24])
+            with cf2:
+                k_week = st.number_input("K uke (sin/cos-par, periode 168 t)", min_value=0, max_value=40,
+                                         value=default_k[168])
+            harmonics = tuple((period, k) for period, k in ((24, k_day), (168, k_week)) if k > 0)
+
     if (p + q + P + Q) > 10:
         st.error("Summen av p+q+P+Q må være ≤ 10. Reduser noen av parametrene.")
         st.stop()
@@ -236,253 +827,130 @@ def show():
         st.stop()
 
     order = (p, d, q)
-    seasonal_order = (P, D, Q, seasonal_period) if seasonal_period > 0 else (0, 0, 0, 0)
+    seasonal_order = (P, D, Q, seasonal_period) if seasonal_period > 0 and not fourier else (0, 0, 0, 0)
+    max_samples = MAX_FOURIER_SAMPLES if fourier else 5000
+    orders = {source: (order, seasonal_order) for source in SOURCE_LABELS}
 
     # ------------------------------------------------------------
-    # Kjør modell
+    # Automatisk ordresøk
     # ------------------------------------------------------------
-    st.markdown("### 🤖 Kjør modell")
-
-    if st.button("Tren SARIMAX og lag forecast"):
-        with st.spinner("Trener modell og lager forecast ..."):
-
+    auto = st.toggle(
+        "🧭 Automatisk ordresøk (AIC/BIC)",
+        help=(
+            "Velger d med KPSS-test og søker over p, q ≤ 2 og P, Q ≤ 1 med sesonglengden over. "
+            "Alle kandidater tilpasses først på de siste 14 dagene, deretter bare de beste "
+            "på hele treningsperioden. Søket stopper når tidsbudsjettet er brukt opp."
+        ),
+    )
+    if auto:
+        ca, cb = st.columns(2)
+        with ca:
+            criterion = st.radio("Kriterium", ["aic", "bic"], format_func=str.upper, horizontal=True)
+        with cb:
+            budget_s = st.slider("Tidsbudsjett (sekunder)", 10, 300, 60, 10)
+
+        search_key = (price_area, energy_mode, train_start, train_end, seasonal_period, harmonics, criterion, budget_s)
+        if st.button("🔎 Søk etter beste ordre"):
+            train = search_series(store, price_area, energy_mode, train_start, train_end)
+            if any(y.empty for y in train.values()):
+                st.error("Ingen data i valgt treningsperiode.")
+                return
             try:
-                # ------------------------------------------------
-                # CASE 1 & 2: kun produksjon ELLER kun forbruk
-                # ------------------------------------------------
-                if energy_mode in ("production", "consumption"):
-
-                    y = prepare_series(df_raw, price_area, source=energy_mode)
-                    if y.empty:
-                        st.error(f"Ingen data for valgt energitype ({energy_mode}) i dette prisområdet.")
-                        return
-
-                    y_train = y[(y.index.date >= train_start) & (y.index.date <= train_end)]
-                    if y_train.empty:
-                        st.error("Ingen data i valgt treningsperiode.")
-                        return
-
-                    y_train = limit_training_series(y_train, max_samples=5000)
-
-                    result = fit_sarimax(y_train, order=order, seasonal_order=seasonal_order)
-
-                    # Forecast-tidspunkter
-                    future_index = pd.date_range(
-                        start=y_train.index[-1] + timedelta(hours=1),
-                        periods=horizon_hours,
-                        freq="H",
-                    )
-
-                    forecast_res = result.get_forecast(steps=horizon_hours)
-                    forecast_mean = forecast_res.predicted_mean
-                    forecast_ci = forecast_res.conf_int()
-
-                    # Plot
-                    st.markdown("### 📊 Forecast-resultat")
-
-                    hist_horizon = 24 * 7
-                    y_hist = y_train[-hist_horizon:]
-
-                    fig = go.Figure()
-
-                    label_hist = "Historisk produksjon" if energy_mode == "production" else "Historisk forbruk"
-                    label_fc = "Forecast produksjon" if energy_mode == "production" else "Forecast forbruk"
-
-                    fig.add_trace(go.Scatter(
-                        x=y_hist.index,
-                        y=y_hist.values,
-                        mode="lines",
-                        name=label_hist,
-                        line=dict(color="black")
-                    ))
-
-                    fig.add_trace(go.Scatter(
-                        x=forecast_mean.index,
-                        y=forecast_mean.values,
-                        mode="lines",
-                        name=label_fc,
-                        line=dict(color="blue")
-                    ))
-
-                    fig.add_trace(go.Scatter(
-                        x=forecast_mean.index.tolist() + forecast_mean.index[::-1].tolist(),
-                        y=forecast_ci.iloc[:, 0].tolist() + forecast_ci.iloc[:, 1][::-1].tolist(),
-                        fill="toself",
-                        fillcolor="rgba(0, 0, 255, 0.15)",
-                        line=dict(color="rgba(0,0,0,0)"),
-                        name="Konfidensintervall",
-                    ))
-
-                    fig.update_layout(
-                        height=500,
-                        hovermode="x unified",
-                        title=f"SARIMAX-forecast for {energy_choice_label} – {price_area}",
-                        xaxis_title="Tid",
-                        yaxis_title="kWh",
-                    )
-
-                    st.plotly_chart(fig, use_container_width=True)
-
-                    with st.expander("📄 Modellinfo (summary)"):
-                        st.text(result.summary())
-
-                # ------------------------------------------------
-                # CASE 3: begge – produksjon + forbruk + nettolast
-                # ------------------------------------------------
-                elif energy_mode == "both":
-                    y_prod = prepare_series(df_raw, price_area, source="production")
-                    y_cons = prepare_series(df_raw, price_area, source="consumption")
-
-                    if y_prod.empty or y_cons.empty:
-                        st.error("Mangler enten produksjons- eller forbruksdata i dette området.")
-                        return
-
-                    # Sørg for felles tidsakse
-                    common_index = y_prod.index.intersection(y_cons.index)
-                    if common_index.empty:
-                        st.error("Fant ingen felles tidsstempler mellom produksjon og forbruk.")
-                        return
-
-                    y_prod = y_prod.reindex(common_index)
-                    y_cons = y_cons.reindex(common_index)
-
-                    # Filtrer på treningsperiode
-                    mask = (common_index.date >= train_start) & (common_index.date <= train_end)
-                    common_index_train = common_index[mask]
-
-                    y_prod_train = y_prod.reindex(common_index_train)
-                    y_cons_train = y_cons.reindex(common_index_train)
-
-                    if y_prod_train.empty or y_cons_train.empty:
-                        st.error("Ingen overlappende produksjons-/forbruksdata i valgt treningsperiode.")
-                        return
-
-                    # Begrens størrelse
-                    y_prod_train = limit_training_series(y_prod_train, max_samples=5000)
-                    y_cons_train = limit_training_series(y_cons_train, max_samples=5000)
-
-                    # Tren to modeller
-                    result_prod = fit_sarimax(y_prod_train, order=order, seasonal_order=seasonal_order)
-                    result_cons = fit_sarimax(y_cons_train, order=order, seasonal_order=seasonal_order)
-
-                    # Forecast-tidspunkter (bruk felles slutt)
-                    last_time = common_index_train[-1]
-                    future_index = pd.date_range(
-                        start=last_time + timedelta(hours=1),
-                        periods=horizon_hours,
-                        freq="H",
-                    )
-
-                    fc_prod_res = result_prod.get_forecast(steps=horizon_hours)
-                    fc_cons_res = result_cons.get_forecast(steps=horizon_hours)
-
-                    fc_prod_mean = fc_prod_res.predicted_mean
-                    fc_cons_mean = fc_cons_res.predicted_mean
-
-                    fc_prod_ci = fc_prod_res.conf_int()
-                    fc_cons_ci = fc_cons_res.conf_int()
-
-                    # Nettolast: forbruk - produksjon
-                    net_hist = y_cons_train - y_prod_train
-                    net_fc = fc_cons_mean - fc_prod_mean
-
-                    # Plot
-                    st.markdown("### 📊 Forecast-resultat – produksjon, forbruk og nettolast")
-
-                    hist_horizon = 24 * 7
-                    y_prod_hist = y_prod_train[-hist_horizon:]
-                    y_cons_hist = y_cons_train[-hist_horizon:]
-                    net_hist = net_hist[-hist_horizon:]
+                st.session_state["order_search"] = (
+                    search_key,
+                    run_order_search(train, price_area, seasonal_period, criterion, budget_s, harmonics),
+                )
+            except Exception as e:
+                st.error(f"Feil under ordresøket: {e}")
 
-                    fig = go.Figure()
+        saved = st.session_state.get("order_search")
+        if saved is not None and saved[0] == search_key:
+            reports = saved[1]
+            show_order_search(reports, criterion)
+            orders.update({source: (r["order"], r["seasonal_order"]) for source, r in reports.items()})
+        else:
+            st.info("Trykk «Søk etter beste ordre». Til da brukes parameterne over.")
 
-                    # Historikk
-                    fig.add_trace(go.Scatter(
-                        x=y_prod_hist.index,
-                        y=y_prod_hist.values,
-                        mode="lines",
-                        name="Historisk produksjon",
-                        line=dict(color="green")
-                    ))
-                    fig.add_trace(go.Scatter(
-                        x=y_cons_hist.index,
-                        y=y_cons_hist.values,
-                        mode="lines",
-                        name="Historisk forbruk",
-                        line=dict(color="red")
-                    ))
-                    fig.add_trace(go.Scatter(
-                        x=net_hist.index,
-                        y=net_hist.values,
-                        mode="lines+markers",
-                        name="Historisk nettolast (forbruk − produksjon)",
-                        line=dict(color="gray", dash="dot"),
-                        opacity=0.7
-                    ))
+    # ------------------------------------------------------------
+    # Kjør modell
+    # ------------------------------------------------------------
+    st.markdown("### 🤖 Kjør modell")
 
-                    # Forecast-linjer
-                    fig.add_trace(go.Scatter(
-                        x=fc_prod_mean.index,
-                        y=fc_prod_mean.values,
-                        mode="lines",
-                        name="Forecast produksjon",
-                        line=dict(color="green", dash="dash")
-                    ))
-                    fig.add_trace(go.Scatter(
-                        x=fc_cons_mean.index,
-                        y=fc_cons_mean.values,
-                        mode="lines",
-                        name="Forecast forbruk",
-                        line=dict(color="red", dash="dash")
-                    ))
-                    fig.add_trace(go.Scatter(
-                        x=net_fc.index,
-                        y=net_fc.values,
-                        mode="lines+markers",
-                        name="Forecast nettolast (forbruk − produksjon)",
-                        line=dict(color="gray", dash="dashdot"),
-                        opacity=0.9
-                    ))
+    # Samme modell og treningsvindu som sist trent: ny horisont gjenbruker det
+    # cachede resultatet og kjører bare get_forecast
+    rullerende = st.toggle(
+        "🔄 Rullerende origo (legg til nye timer uten å trene på nytt)",
+        help=(
+            "Modellen trenes på treningsperioden og oppdateres deretter med alle nyere timer "
+            "via Kalman-filtrering. Parameterne estimeres på nytt ukentlig eller ved drift."
+        ),
+    )
 
-                    # Konfidensintervall for produksjon
-                    fig.add_trace(go.Scatter(
-                        x=fc_prod_mean.index.tolist() + fc_prod_mean.index[::-1].tolist(),
-                        y=fc_prod_ci.iloc[:, 0].tolist() + fc_prod_ci.iloc[:, 1][::-1].tolist(),
-                        fill="toself",
-                        fillcolor="rgba(0, 128, 0, 0.12)",
-                        line=dict(color="rgba(0,0,0,0)"),
-                        name="Konfidensintervall produksjon",
-                        showlegend=True,
-                    ))
+    budget_s = st.number_input(
+        "⏱ Tidsbudsjett (sekunder, 0 = vent på SARIMAX)",
+        min_value=0,
+        max_value=600,
+        value=10,
+        help=(
+            "Blir ikke SARIMAX ferdig innen budsjettet, vises beste raske modell "
+            "(Holt-Winters eller sesongnaiv) mens SARIMAX tilpasses videre i bakgrunnen."
+        ),
+    )
 
-                    # Konfidensintervall for forbruk
-                    fig.add_trace(go.Scatter(
-                        x=fc_cons_mean.index.tolist() + fc_cons_mean.index[::-1].tolist(),
-                        y=fc_cons_ci.iloc[:, 0].tolist() + fc_cons_ci.iloc[:, 1][::-1].tolist(),
-                        fill="toself",
-                        fillcolor="rgba(255, 0, 0, 0.12)",
-                        line=dict(color="rgba(0,0,0,0)"),
-                        name="Konfidensintervall forbruk",
-                        showlegend=True,
-                    ))
+    train_spec = (price_area, energy_mode, train_start, train_end, tuple(orders.items()), harmonics, rullerende)
+    retrain = st.button("Tren SARIMAX og lag forecast")
+    if retrain:
+        st.session_state["forecast_spec"] = train_spec
 
-                    fig.update_layout(
-                        height=550,
-                        hovermode="x unified",
-                        title=f"SARIMAX-forecast – produksjon, forbruk og nettolast – {price_area}",
-                        xaxis_title="Tid",
-                        yaxis_title="kWh",
-                        legend=dict(orientation="h", yanchor="bottom", y=1.02,
-                                    xanchor="center", x=0.5),
-                    )
+    if st.session_state.get("forecast_spec") == train_spec:
+        show_forecast(
+            store, price_area, energy_mode, energy_choice_label, train_start, train_end, horizon_hours,
+            max_samples, orders, harmonics, rullerende, budget_s, retrain,
+        )
 
-                    st.plotly_chart(fig, use_container_width=True)
+    # ------------------------------------------------------------
+    # Backtest
+    # ------------------------------------------------------------
+    st.markdown("### 🧪 Backtest")
 
-                    with st.expander("📄 Modellinfo (summary) – produksjon"):
-                        st.text(result_prod.summary())
+    with st.expander("Test modellen ved mange origoer gjennom hele perioden"):
+        st.markdown(
+            "Modellen over tilpasses på et vindu like langt som treningsperioden før hvert origo, "
+            "og prognosen sammenlignes med fasit. Origoene fordeles på flere prosesser."
+        )
+        b1, b2, b3 = st.columns(3)
+        with b1:
+            n_origins = st.slider("Antall origoer", min_value=4, max_value=104, value=26)
+        with b2:
+            bt_horizon = st.number_input("Horisont (timer)", min_value=1, max_value=168, value=48)
+        with b3:
+            refit_days = st.number_input(
+                "Ny estimering hver (dager)", min_value=0, max_value=30, value=7,
+                help="Mellom estimeringene legges nye timer bare til med filtrering. 0 = estimer ved hvert origo.",
+            )
+        bt_source = energy_mode
+        if energy_mode == "both":
+            bt_source = st.radio(
+                "Serie", list(SOURCE_LABELS), format_func=SOURCE_LABELS.get, horizontal=True,
+            )
 
-                    with st.expander("📄 Modellinfo (summary) – forbruk"):
-                        st.text(result_cons.summary())
+        window = min(((train_end - train_start).days + 1) * 24, max_samples)
+        bt_key = (price_area, bt_source, window, orders[bt_source], harmonics, n_origins, bt_horizon, refit_days)
 
+        if st.button("Kjør backtest"):
+            bar = st.progress(0.0, text="Starter backtest ...")
+            try:
+                report = run_backtest(
+                    store.series(price_area, bt_source), *orders[bt_source], harmonics,
+                    window=window, horizon=bt_horizon, n_origins=n_origins, refit_every=refit_days * 24,
+                    on_progress=lambda done, total: bar.progress(done / total, text=f"{done}/{total} origoer"),
+                    max_workers=FIT_WORKERS,
+                )
+                st.session_state["backtest"] = (bt_key, report)
             except Exception as e:
-                st.error(f"Feil under modelltrening eller forecasting: {e}")
+                st.error(f"Feil under backtest: {e}")
+            bar.empty()
+
+        saved = st.session_state.get("backtest")
+        if saved is not None and saved[0] == bt_key:
+            show_backtest(saved[1])